@@ -1,32 +1,160 @@
 import os
 import time
+import asyncio
+import threading
 import json
 import uuid
 import logging
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, request, jsonify, send_file, render_template, stream_with_context
+from werkzeug.security import safe_join
 from dotenv import load_dotenv
 from datetime import datetime
-from modules.music.generator import generate_music_with_suno
-from modules.video.generator import generate_video_from_text, merge_video_audio
+from modules.music.generator import generate_music_with_suno, check_generation_status
+from modules.music.async_generator import check_generation_status_async, generate_lyrics_async
+from modules.music.resilience import breaker_states
+from modules.music.status_cache import status_cache
+from modules.music.poller import TaskPoller
+from modules.music.dedup import generation_dedup
+from modules.music.lyrics_cache import lyrics_cache
+from modules.video.generator import generate_video_from_text, MERGE_DETERMINISTIC_OFFSET, MERGE_STREAMING, MERGE_AUDIO_OFFSET
+from modules.video.merge_engine import get_merge_engine, QueueFullError
+from modules.video.merge_cache import merge_cache
 from modules.veo3 import Veo3Client
+from modules.callback.store import create_callback_store, SHORT_ID_LENGTH
+from modules.callback.notifier import CompletionNotifier, ANY_CALLBACK
+from modules.callback.events import TaskEventBroker, callback_stage, STAGE_COMPLETE, STAGE_MERGE_DONE, STAGE_ERROR
+from modules.idempotency import IdempotencyStore, idempotent
+from modules.asgi import AsyncRouteDispatcher, StreamResponse
+from modules.semantic_cache import semantic_cache
+from modules.media.etag import file_etag
+from modules.media.cache import get_media_cache
+from modules.paths import OUTPUT_DIR
 
 # Initialize Flask application
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False  # Don't escape non-ASCII characters like Japanese
 load_dotenv(dotenv_path=".env")
 
-# Set output directory
-OUTPUT_DIR = "output"
+# Merge pool processes (spawn) import this script as __mp_main__ to unpickle
+# their jobs: they only run merges, so the server state below is not started in them
+MERGE_POOL_PROCESS = __name__ == '__mp_main__'
+
+# Create output directory (repository-relative, see modules/paths.py)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Cache lifetime of /api/download responses (seconds); revalidated with ETag afterwards
+DOWNLOAD_MAX_AGE = int(os.getenv("DOWNLOAD_MAX_AGE", 3600))
+# Longest /api/merge-video-audio waits for its merge before answering 202 with the job (seconds)
+MERGE_SYNC_TIMEOUT = float(os.getenv("MERGE_SYNC_TIMEOUT", 120))
+# Let a fronting nginx / Apache send files (X-Sendfile) instead of the worker
+app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "false").lower() == "true"
+
 # Default prompt
 DEFAULT_PROMPT = "A calm atmosphere combining jazz and classical music"
 
-# Dictionary to store callback data
-callback_data = {}
+# Indexed store for callback data and request ID / task ID mapping
+# Memory is bounded by TTL, entry count and byte budget (LRU eviction)
+# CALLBACK_STORE_BACKEND=sqlite shares the store between worker processes
+callback_store = create_callback_store(
+    backend="memory" if MERGE_POOL_PROCESS else os.getenv("CALLBACK_STORE_BACKEND", "memory"),
+    path=os.getenv("CALLBACK_STORE_PATH", os.path.join(OUTPUT_DIR, "callbacks.db")),
+    ttl=float(os.getenv("CALLBACK_TTL_SECONDS", 24 * 60 * 60)),
+    max_entries=int(os.getenv("CALLBACK_MAX_ENTRIES", 10000)),
+    max_bytes=int(os.getenv("CALLBACK_MAX_BYTES", 256 * 1024 * 1024))
+)
+if not MERGE_POOL_PROCESS:
+    callback_store.start_sweeper(interval=float(os.getenv("CALLBACK_SWEEP_INTERVAL", 60)))
+
+# Wakes requests waiting for a callback as soon as it is stored
+# (callbacks stored by other worker processes are picked up by polling the shared store)
+callback_notifier = CompletionNotifier(
+    poll_interval=float(os.getenv("CALLBACK_POLL_INTERVAL", 0.5)) if callback_store.shared else None
+)
+
+# Pushes per-task progress stages to Server-Sent Events clients
+# (event IDs follow the callback store's sequence so Last-Event-ID works across workers)
+task_events = TaskEventBroker(sequence=lambda: callback_store.sequence)
+# Open event streams per process: streams beyond this get 503. Under hypercorn (asgi_app)
+# a stream is an idle coroutine; the Flask route (app.run / WSGI servers) holds a thread each
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", 100))
+# Interval of shared-store checks of idle streams (callbacks stored by other workers)
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", 2))
+sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+def record_callback(data):
+    """
+    Store a callback payload, wake its waiters and publish its progress stage
+    
+    Args:
+        data: Callback payload (from the webhook or the task poller)
+        
+    Returns:
+        Task IDs the payload was stored under
+    """
+    # Store callback data under all task IDs found in it (matching Suno's callback format)
+    # Indexes for task ID, audio ID and MP4 task ID are built here once
+    task_ids = callback_store.add(data)
+    
+    print(f"★★★ Stored callback data for task IDs: {task_ids} ★★★")
+    print(f"★★★ Stored callback count: {len(callback_store)} ★★★")
+    
+    # Wake requests waiting for these task IDs (including short title ID matches)
+    callback_notifier.notify(task_ids + [task_id[:SHORT_ID_LENGTH] for task_id in task_ids])
+    
+    # Push progress stage to event stream subscribers
+    stage = callback_stage(data)
+    if stage:
+        stored = callback_store.get(task_ids[0])
+        for task_id in task_ids:
+            task_events.publish(task_id, stage, data, event_id=stored.get("seq") if stored else None)
+    
+    # Completed generations become candidates for near-duplicate prompts
+    if stage == STAGE_COMPLETE:
+        for task_id in task_ids:
+            semantic_cache.complete_pending(task_id, {"task_id": task_id, "callback_data": data})
+    elif isinstance(data, dict) and data.get("request_id") and data.get("status") == "OK":
+        # fal webhook (video generation)
+        semantic_cache.complete_pending(data["request_id"], {"request_id": data["request_id"], "callback_data": data})
+    
+    return task_ids
+
+def find_similar_generation(kind, prompt, params):
+    """
+    Look up a completed generation whose prompt is a near duplicate
+    
+    Args:
+        kind: Generation kind ("music", "video")
+        prompt: Generation prompt
+        params: Parameters that must match exactly (genre, model, style...)
+        
+    Returns:
+        Tuple of prompt embedding (for add_pending) and match (or None)
+    """
+    vector = semantic_cache.encode(prompt)
+    similar = semantic_cache.lookup(kind, params, vector)
+    if similar:
+        print(f"★★★ Near-duplicate {kind} prompt (similarity {similar['similarity']}): '{similar['prompt']}' ★★★")
+    return vector, similar
+
+# Serve near-duplicate results instead of generating again (per request: reuse_similar)
+SEMANTIC_CACHE_SERVE = os.getenv("SEMANTIC_CACHE_SERVE", "false").lower() == "true"
+# Load the prompt embedding model now, not inside the first generation request
+if not MERGE_POOL_PROCESS:
+    semantic_cache.start_warm_up()
 
-# Dictionary to store request ID and task ID mapping
-app.request_task_mapping = {}
+# Responses of POST generation endpoints by Idempotency-Key (or idempotency_key / request_id):
+# a repeated request gets the stored response or waits for the running one
+idempotency_store = IdempotencyStore()
+
+# Polls every pending Suno task in the background and stores terminal
+# results as callbacks, so lost or late webhooks still complete the task
+task_poller = TaskPoller(
+    check_status=check_generation_status,
+    store=callback_store,
+    on_result=record_callback
+)
+if os.getenv("TASK_POLLER_ENABLED", "true").lower() == "true" and not MERGE_POOL_PROCESS:
+    task_poller.start()
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +189,11 @@ def api_docs():
                         "name": "model_version",
                         "type": "string",
                         "description": "Model version to use (default: v4)"
+                    },
+                    {
+                        "name": "reuse_similar",
+                        "type": "boolean",
+                        "description": "Return a completed generation of a near-duplicate prompt instead of generating (default: SEMANTIC_CACHE_SERVE); otherwise it is offered as similar_result"
                     }
                 ]
             },
@@ -111,6 +244,48 @@ def api_docs():
                 "method": "GET",
                 "description": "Get callback data for a specific task ID"
             },
+            {
+                "path": "/api/tasks/<task_id>/events",
+                "method": "GET",
+                "description": "Server-Sent Events stream of task progress (text, first, complete, mp4_ready, merge_done)",
+                "parameters": [
+                    {
+                        "name": "until",
+                        "type": "string",
+                        "description": "Close the stream after this stage (default: 'complete')"
+                    },
+                    {
+                        "name": "timeout",
+                        "type": "integer",
+                        "description": "Maximum stream duration (seconds) (default: 600)"
+                    }
+                ]
+            },
+            {
+                "path": "/callbacks/stats",
+                "method": "GET",
+                "description": "Callback store size, eviction and expiration counters"
+            },
+            {
+                "path": "/api/suno/circuit-breakers",
+                "method": "GET",
+                "description": "State of the per-endpoint Suno API circuit breakers"
+            },
+            {
+                "path": "/api/suno/stats",
+                "method": "GET",
+                "description": "Suno status cache, background task poller, generation dedup, lyrics and semantic prompt cache counters"
+            },
+            {
+                "path": "/api/media-cache/stats",
+                "method": "GET",
+                "description": "Content-addressed media cache size, hit and eviction counters"
+            },
+            {
+                "path": "/api/idempotency/stats",
+                "method": "GET",
+                "description": "Idempotency key store counters (POST generation endpoints accept an Idempotency-Key header or idempotency_key / request_id field)"
+            },
             {
                 "path": "/simulate-callback",
                 "method": "POST",
@@ -171,7 +346,7 @@ def api_docs():
             {
                 "path": "/api/merge-video-audio",
                 "method": "POST",
-                "description": "Merge video and audio",
+                "description": "Merge video and audio (202 with the merge job if it takes longer than MERGE_SYNC_TIMEOUT)",
                 "parameters": [
                     {
                         "name": "video_url",
@@ -227,9 +402,94 @@ def api_docs():
                         "name": "output_path",
                         "type": "string",
                         "description": "Output file path (default: 'result.mp4')"
+                    },
+                    {
+                        "name": "deterministic_offset",
+                        "type": "boolean",
+                        "description": "With a random audio offset (or when energy analysis is unavailable), derive it from the input URLs instead (default: MERGE_DETERMINISTIC_OFFSET)"
+                    },
+                    {
+                        "name": "use_cache",
+                        "type": "boolean",
+                        "description": "Return the existing result of a previous merge of the same URLs (default: true)"
+                    },
+                    {
+                        "name": "audio_offset",
+                        "type": "string",
+                        "description": "How the audio start is chosen: energy (most energetic stretch of the track) or random (default: MERGE_AUDIO_OFFSET)"
+                    },
+                    {
+                        "name": "streaming",
+                        "type": "boolean",
+                        "description": "Let ffmpeg read the URLs directly and stream fragmented MP4 to S3 while encoding, without temporary files (default: MERGE_STREAMING)"
+                    },
+                    {
+                        "name": "task_id",
+                        "type": "string",
+                        "description": "Task ID whose event stream receives the merge_done stage (optional)"
                     }
                 ]
             },
+            {
+                "path": "/api/merge-jobs",
+                "method": "POST",
+                "description": "Queue a video/audio merge and return its job ID immediately (503 when the merge queue is full)",
+                "parameters": [
+                    {
+                        "name": "video_url",
+                        "type": "string",
+                        "description": "Video URL (required)"
+                    },
+                    {
+                        "name": "audio_url",
+                        "type": "string",
+                        "description": "Audio URL (required)"
+                    },
+                    {
+                        "name": "deterministic_offset",
+                        "type": "boolean",
+                        "description": "With a random audio offset (or when energy analysis is unavailable), derive it from the input URLs instead (default: MERGE_DETERMINISTIC_OFFSET)"
+                    },
+                    {
+                        "name": "use_cache",
+                        "type": "boolean",
+                        "description": "Return the existing result of a previous merge of the same URLs (default: true)"
+                    },
+                    {
+                        "name": "audio_offset",
+                        "type": "string",
+                        "description": "How the audio start is chosen: energy (most energetic stretch of the track) or random (default: MERGE_AUDIO_OFFSET)"
+                    },
+                    {
+                        "name": "streaming",
+                        "type": "boolean",
+                        "description": "Let ffmpeg read the URLs directly and stream fragmented MP4 to S3 while encoding, without temporary files (default: MERGE_STREAMING)"
+                    },
+                    {
+                        "name": "task_id",
+                        "type": "string",
+                        "description": "Task ID whose event stream receives the merge_done stage (optional)"
+                    }
+                ]
+            },
+            {
+                "path": "/api/merge-jobs/<job_id>",
+                "method": "GET",
+                "description": "Get the status of a merge job (queued, running, succeeded, failed)",
+                "parameters": []
+            },
+            {
+                "path": "/api/merge-jobs/<job_id>/result",
+                "method": "GET",
+                "description": "Get the result of a merge job (202 while it is queued or running)",
+                "parameters": []
+            },
+            {
+                "path": "/api/merge-jobs/stats",
+                "method": "GET",
+                "description": "Get merge pool, queue and merge cache counters",
+                "parameters": []
+            },
             {
                 "path": "/api/webhook/segmind",
                 "method": "POST",
@@ -322,6 +582,7 @@ def api_docs():
 
 # Music generation endpoint
 @app.route('/api/generate', methods=['POST'])
+@idempotent(idempotency_store)
 def generate_audio():
     data = request.json
     
@@ -331,6 +592,18 @@ def generate_audio():
         instrumental = data.get('instrumental', False)
         model_version = data.get('model_version', 'v4')
         
+        # Completed generation of a near-duplicate prompt with the same settings
+        music_params = {"genre": genre, "instrumental": bool(instrumental), "model_version": model_version}
+        prompt_vector, similar = find_similar_generation("music", prompt, music_params)
+        if similar and data.get('reuse_similar', SEMANTIC_CACHE_SERVE):
+            return jsonify({
+                "success": True,
+                "task_id": similar["result"]["task_id"],
+                "status": "completed",
+                "semantic_match": similar,
+                "message": "Served existing generation of a similar prompt"
+            })
+        
         # Request music generation
         result = generate_music_with_suno(
             prompt=prompt,
@@ -350,14 +623,22 @@ def generate_audio():
                 "details": result
             }), 500
         
+        # Poll in the background in case the webhook is lost
+        task_poller.track(response_task_id)
+        semantic_cache.add_pending(response_task_id, "music", music_params, prompt_vector, prompt)
+        
         # Return immediate response (changed to asynchronous processing)
-        return jsonify({
+        response = {
             "success": True,
             "task_id": response_task_id,
             "status": "processing",
             "message": "Music generation started. Check status at /api/check-status",
             "check_status_endpoint": f"/api/check-status"
-        })
+        }
+        if similar:
+            # Offer the existing generation alongside the new job
+            response["similar_result"] = similar
+        return jsonify(response)
         
     except Exception as e:
         print(f"Error generating audio: {str(e)}")
@@ -367,7 +648,7 @@ def generate_audio():
 
 # Lyrics generation endpoint
 @app.route('/api/generate-lyrics', methods=['POST'])
-def generate_lyrics_endpoint():
+async def generate_lyrics_endpoint():
     try:
         # Get request data
         data = request.get_json()
@@ -388,10 +669,8 @@ def generate_lyrics_endpoint():
         if not suno_api_key:
             return jsonify({"error": "SUNO_API_KEY is not set"}), 500
         
-        # Generate lyrics using Suno API
-        from modules.music.generator import generate_lyrics
-        
-        lyrics = generate_lyrics(prompt)
+        # Generate lyrics using Suno API (pooled async client)
+        lyrics = await generate_lyrics_async(prompt)
         
         if not lyrics:
             return jsonify({"error": "Lyrics generation failed"}), 500
@@ -434,9 +713,21 @@ def check_api_key():
 @app.route('/api/download/<filename>')
 def download_file(filename):
     try:
-        file_path = os.path.join(OUTPUT_DIR, filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
+        # safe_join rejects names escaping OUTPUT_DIR
+        file_path = safe_join(os.path.abspath(OUTPUT_DIR), filename)
+        if not (file_path and os.path.isfile(file_path)):
+            # Content-addressed objects of the media cache (/api/download-from-url)
+            file_path = safe_join(get_media_cache().root, filename[:2], filename)
+        if file_path and os.path.isfile(file_path):
+            # conditional: Range / If-Range (206), If-None-Match / If-Modified-Since (304)
+            # The file is streamed with wsgi.file_wrapper (sendfile), or X-Sendfile if enabled
+            return send_file(
+                file_path,
+                as_attachment=True,
+                conditional=True,
+                etag=file_etag(file_path),
+                max_age=DOWNLOAD_MAX_AGE
+            )
         else:
             return jsonify({"error": "File not found"}), 404
     except Exception as e:
@@ -491,7 +782,7 @@ def download_from_url():
 
 # Status check endpoint
 @app.route('/api/check-status', methods=['POST'])
-def check_status():
+async def check_status():
     try:
         # Get request data
         data = request.get_json()
@@ -503,10 +794,8 @@ def check_status():
         if not task_id:
             return jsonify({"error": "Task ID is required"}), 400
             
-        # Call status check module
-        from modules.music.generator import check_generation_status
-        
-        status_result = check_generation_status(task_id)
+        # Call status check module (pooled async client, shares the status cache)
+        status_result = await check_generation_status_async(task_id)
         
         if not status_result:
             return jsonify({
@@ -544,10 +833,11 @@ def check_status():
 def callback():
     if request.method == 'GET':
         # For GET requests, display current callback data
+        has_callbacks = len(callback_store) > 0
         return jsonify({
-            "status": "Callback data available" if callback_data else "No callback data available",
-            "message": "Callbacks have been received" if callback_data else "No callbacks have been received yet",
-            "data": callback_data
+            "status": "Callback data available" if has_callbacks else "No callback data available",
+            "message": "Callbacks have been received" if has_callbacks else "No callbacks have been received yet",
+            "data": callback_store.snapshot()
         })
     
     # For POST requests
@@ -560,52 +850,10 @@ def callback():
         
         print(f"★★★ Received callback data: {json.dumps(data, ensure_ascii=False)[:500]}... ★★★")
         
-        # Get task ID (matching Suno's callback format)
-        task_ids = set()  # Store all possible task IDs
-        
-        # Collect all task IDs from callback data
-        def collect_task_ids(obj):
-            if isinstance(obj, dict):
-                for k, v in obj.items():
-                    if k in ["task_id", "taskId"] and isinstance(v, str):
-                        task_ids.add(v)
-                    # Extract task ID from title field
-                    if k == "title" and isinstance(v, str) and "Generated Music" in v:
-                        title_task_id = v.split("Generated Music")[-1].strip()
-                        if title_task_id:
-                            task_ids.add(title_task_id)
-                    collect_task_ids(v)
-            elif isinstance(obj, list):
-                for item in obj:
-                    collect_task_ids(item)
-        
-        collect_task_ids(data)
-        
-        print(f"★★★ Found task IDs in callback data: {task_ids} ★★★")
-        
-        if not task_ids:
-            print(f"Warning: No task_id found in callback data")
-            # Generate temporary ID
-            task_id = str(uuid.uuid4())
-            task_ids.add(task_id)
-            print(f"Generated temporary task_id: {task_id}")
-        
-        # Store callback data
-        callback_time = datetime.now().isoformat()
-        callback_info = {
-            "data": data,
-            "timestamp": callback_time
-        }
-        
-        # Store with all found task IDs
-        for task_id in task_ids:
-            callback_data[task_id] = callback_info
-            print(f"★★★ Stored callback data for task_id: {task_id} ★★★")
-        
-        print(f"★★★ Available callback keys after storing: {list(callback_data.keys())} ★★★")
+        task_ids = record_callback(data)
         
         # Return normal response
-        return jsonify({"success": True, "task_ids": list(task_ids)})
+        return jsonify({"success": True, "task_ids": task_ids})
         
     except Exception as e:
         print(f"Error processing callback: {str(e)}")
@@ -619,9 +867,10 @@ def list_callbacks():
     Endpoint to list all stored callback data
     """
     try:
-        print(f"Listing all callbacks. Available keys: {list(callback_data.keys())}")
+        callback_items = callback_store.items()
+        print(f"Listing all callbacks. Count: {len(callback_items)}")
         
-        if not callback_data:
+        if not callback_items:
             return jsonify({
                 "status": "No callback data available",
                 "message": "No callbacks have been received yet"
@@ -629,7 +878,7 @@ def list_callbacks():
         
         # Create callback data summary
         callback_summary = {}
-        for task_id, data in callback_data.items():
+        for task_id, data in callback_items:
             callback_summary[task_id] = {
                 "timestamp": data.get("timestamp"),
                 "status": data.get("data", {}).get("code", "unknown"),
@@ -639,7 +888,7 @@ def list_callbacks():
         return jsonify({
             "status": "success",
             "message": "All callback data",
-            "count": len(callback_data),
+            "count": len(callback_items),
             "callbacks": callback_summary
         })
     except Exception as e:
@@ -651,6 +900,181 @@ def list_callbacks():
             "message": f"Error listing callbacks: {str(e)}"
         }), 500
 
+def publish_stored_stage(task_id):
+    """
+    Publish the stage of a task's stored callback unless this worker already published it
+    """
+    key, cb = callback_store.find(task_id)
+    stage = callback_stage(cb.get("data")) if cb else None
+    if stage and stage not in {event["stage"] for event in task_events.history(task_id)}:
+        task_events.publish(task_id, stage, cb.get("data"), event_id=cb.get("seq"))
+
+SSE_HEADERS = [
+    ('Cache-Control', 'no-cache'),
+    ('X-Accel-Buffering', 'no')
+]
+SSE_BUSY_MESSAGE = "Too many open event streams, poll /callbacks instead or retry later"
+
+def event_stream_options(args, headers):
+    """
+    Function to read event stream options from a request
+
+    Args:
+        args: Query parameters
+        headers: Request headers
+
+    Returns:
+        Tuple of (last event ID received, closing stage, timeout)
+    """
+    until = args.get('until', STAGE_COMPLETE) or None
+    timeout = float(args.get('timeout', 600))
+    last_event_id = headers.get('Last-Event-ID', args.get('last_event_id', '0'))
+    after = int(last_event_id) if str(last_event_id).isdigit() else 0
+    return after, until, timeout
+
+def stored_stage_poll(task_id):
+    """
+    Callbacks stored by other workers are not published to this worker's broker:
+    streams re-check the shared store while idle
+    """
+    return (lambda: publish_stored_stage(task_id)) if callback_store.shared else None
+
+@app.route('/api/tasks/<task_id>/events', methods=['GET'])
+def task_events_stream(task_id):
+    """
+    Server-Sent Events endpoint pushing each progress stage of a task
+
+    Served here (Flask streams a sync generator) each open stream holds one
+    worker thread until it ends. Under hypercorn, asgi_app serves this path
+    with task_events_stream_async instead, where idle streams hold no thread.
+    """
+    if not sse_slots.acquire(blocking=False):
+        response = jsonify({"error": SSE_BUSY_MESSAGE})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    try:
+        after, until, timeout = event_stream_options(request.args, request.headers)
+        
+        # Seed history from stored callback data (callback may have landed before subscribing,
+        # or on another worker process when the store is shared)
+        publish_stored_stage(task_id)
+        
+        print(f"Event stream opened for task_id: {task_id} (until: {until}, subscribers: {task_events.subscriber_count() + 1})")
+        
+        events = task_events.stream(task_id, after=after, until=until, timeout=timeout, poll=stored_stage_poll(task_id), poll_interval=SSE_POLL_INTERVAL)
+        response = app.response_class(
+            stream_with_context(events),
+            mimetype='text/event-stream',
+            headers=dict(SSE_HEADERS)
+        )
+        # Runs when the server closes the response, even if the stream never started
+        response.call_on_close(sse_slots.release)
+        return response
+    except Exception as e:
+        sse_slots.release()
+        print(f"Error opening event stream for task_id {task_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+# ASGI entry point (hypercorn app:asgi_app): Flask serves every route except event
+# streams, which run as coroutines so thousands of idle clients cost no threads
+asgi_app = AsyncRouteDispatcher(app)
+
+@asgi_app.route(r'/api/tasks/(?P<task_id>[^/]+)/events')
+async def task_events_stream_async(args, headers, task_id):
+    """
+    Async Server-Sent Events endpoint (same behaviour as task_events_stream)
+    """
+    if not sse_slots.acquire(blocking=False):
+        body = json.dumps({"error": SSE_BUSY_MESSAGE}).encode('utf-8')
+        return StreamResponse(503, [('Content-Type', 'application/json'), ('Retry-After', '5')], body)
+    try:
+        after, until, timeout = event_stream_options(args, headers)
+        await asyncio.to_thread(publish_stored_stage, task_id)
+        
+        print(f"Event stream opened for task_id: {task_id} (until: {until}, subscribers: {task_events.subscriber_count() + 1})")
+        
+        events = task_events.stream_async(task_id, after=after, until=until, timeout=timeout, poll=stored_stage_poll(task_id), poll_interval=SSE_POLL_INTERVAL)
+        return StreamResponse(200, [('Content-Type', 'text/event-stream; charset=utf-8')] + SSE_HEADERS, events, on_close=sse_slots.release)
+    except Exception as e:
+        sse_slots.release()
+        print(f"Error opening event stream for task_id {task_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        body = json.dumps({"error": str(e)}).encode('utf-8')
+        return StreamResponse(500, [('Content-Type', 'application/json')], body)
+
+@app.route('/callbacks/stats', methods=['GET'])
+def callback_stats():
+    """
+    Endpoint to get callback store counters (for sizing nodes)
+    """
+    try:
+        return jsonify({
+            "status": "success",
+            "stats": callback_store.stats()
+        })
+    except Exception as e:
+        print(f"Error getting callback stats: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"Error getting callback stats: {str(e)}"
+        }), 500
+
+@app.route('/api/suno/circuit-breakers', methods=['GET'])
+def suno_circuit_breakers():
+    """
+    Endpoint to get Suno API circuit breaker states (for monitoring)
+    """
+    states = breaker_states()
+    return jsonify({
+        "status": "success",
+        "open": sorted(name for name, state in states.items() if state["state"] != "closed"),
+        "breakers": states
+    })
+
+@app.route('/api/suno/stats', methods=['GET'])
+def suno_stats():
+    """
+    Endpoint to get Suno client cache counters (for monitoring)
+    """
+    return jsonify({
+        "status": "success",
+        "status_cache": status_cache.stats(),
+        "task_poller": task_poller.stats(),
+        "generation_dedup": generation_dedup.stats(),
+        "lyrics_cache": lyrics_cache.stats(),
+        "semantic_cache": semantic_cache.stats()
+    })
+
+@app.route('/api/media-cache/stats', methods=['GET'])
+def media_cache_stats():
+    """
+    Endpoint to get media cache size and hit counters
+    """
+    try:
+        return jsonify({
+            "status": "success",
+            "stats": get_media_cache().stats()
+        })
+    except Exception as e:
+        print(f"Error getting media cache stats: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"Error getting media cache stats: {str(e)}"
+        }), 500
+
+@app.route('/api/idempotency/stats', methods=['GET'])
+def idempotency_stats():
+    """
+    Endpoint to get idempotency key store counters
+    """
+    return jsonify({
+        "status": "success",
+        "stats": idempotency_store.stats()
+    })
+
 @app.route('/callback/<task_id>', methods=['GET'])
 def get_callback(task_id):
     """
@@ -658,67 +1082,32 @@ def get_callback(task_id):
     """
     try:
         print(f"Accessing callback data for task_id: {task_id}")
-        print(f"Available callback keys: {list(callback_data.keys())}")
         
-        # Search for exact match
-        if task_id in callback_data:
-            print(f"Found exact match for task_id: {task_id}")
+        # Exact match, or partial match with a short title ID (indexed lookup)
+        key, cb = callback_store.find(task_id)
+        if cb is None:
+            # Fall back to audio ID lookup
+            cb = callback_store.find_by_audio_id(task_id)
+            key = task_id if cb is not None else None
+        
+        if cb is not None:
+            print(f"Found callback data: {key} for task_id: {task_id}")
+            message = f"Callback data for task_id: {task_id}"
+            if key != task_id:
+                message += f" (matched with {key})"
             return jsonify({
                 "status": "success",
-                "message": f"Callback data for task_id: {task_id}",
-                "task_id": task_id,
-                "timestamp": callback_data[task_id].get("timestamp"),
-                "data": callback_data[task_id].get("data")
+                "message": message,
+                "task_id": key,
+                "timestamp": cb.get("timestamp"),
+                "data": cb.get("data")
             })
         
-        # Search for partial match (keys containing part of task_id)
-        for key in callback_data.keys():
-            if task_id in key or key in task_id:
-                print(f"Found partial match: {key} for task_id: {task_id}")
-                return jsonify({
-                    "status": "success",
-                    "message": f"Callback data for task_id: {task_id} (matched with {key})",
-                    "task_id": key,
-                    "timestamp": callback_data[key].get("timestamp"),
-                    "data": callback_data[key].get("data")
-                })
-        
-        # Recursively search in callback data
-        for key, cb in callback_data.items():
-            def find_task_id(obj):
-                if isinstance(obj, dict):
-                    # Check task_id field
-                    if "task_id" in obj and obj["task_id"] == task_id:
-                        return True
-                    # Check title field
-                    if "title" in obj and isinstance(obj["title"], str):
-                        title_task_id = obj["title"].split("Generated Music")[-1].strip()
-                        if title_task_id and title_task_id in task_id:
-                            return True
-                    for v in obj.values():
-                        if find_task_id(v):
-                            return True
-                elif isinstance(obj, list):
-                    for item in obj:
-                        if find_task_id(item):
-                            return True
-                return False
-            
-            if find_task_id(cb.get("data", {})):
-                print(f"Found task_id in nested data: {key}")
-                return jsonify({
-                    "status": "success",
-                    "message": f"Callback data for task_id: {task_id} (found in {key})",
-                    "task_id": key,
-                    "timestamp": cb.get("timestamp"),
-                    "data": cb.get("data")
-                })
-        
-        print(f"Task ID {task_id} not found in callback_data")
+        print(f"Task ID {task_id} not found in callback data")
         return jsonify({
             "status": "not_found",
             "message": f"No callback data found for task_id: {task_id}",
-            "available_tasks": list(callback_data.keys())
+            "available_tasks": callback_store.keys()
         }), 404
     except Exception as e:
         print(f"Error retrieving callback data for task_id {task_id}: {str(e)}")
@@ -735,7 +1124,7 @@ def clear_callbacks():
     Endpoint to clear all stored callback data
     """
     try:
-        callback_data.clear()
+        callback_store.clear()
         return jsonify({
             "success": True,
             "message": "All callback data cleared"
@@ -747,6 +1136,7 @@ def clear_callbacks():
         }), 500
 
 @app.route('/api/generate-mp4', methods=['POST'])
+@idempotent(idempotency_store)
 def api_generate_mp4():
     """
     API endpoint for generating MP4 video
@@ -797,8 +1187,8 @@ def api_check_mp4_status():
             return jsonify({"error": "task_id is required"}), 400
         
         # Check callback data
-        if task_id in callback_data:
-            callback_info = callback_data[task_id]
+        callback_info = callback_store.get(task_id)
+        if callback_info:
             callback_data_content = callback_info.get("data", {})
             
             # Look for MP4 URL
@@ -822,8 +1212,9 @@ def api_check_mp4_status():
                 })
         
         # If no callback data, check status via API
+        # (fresh: the cached SUCCESS status predates the videoUrl)
         from modules.music.generator import check_generation_status
-        status_result = check_generation_status(task_id)
+        status_result = check_generation_status(task_id, fresh=True)
         
         if not status_result:
             return jsonify({
@@ -858,6 +1249,7 @@ def api_check_mp4_status():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/generate-with-callback', methods=['POST'])
+@idempotent(idempotency_store)
 def generate_audio_with_callback():
     data = request.json
     
@@ -871,6 +1263,21 @@ def generate_audio_with_callback():
         
         print(f"★★★ Received generate request with request_id: {request_id} ★★★")
         
+        # Completed generation of a near-duplicate prompt with the same settings
+        music_params = {"genre": genre, "instrumental": bool(instrumental), "model_version": model_version}
+        prompt_vector, similar = find_similar_generation("music", prompt, music_params)
+        if similar and data.get('reuse_similar', SEMANTIC_CACHE_SERVE):
+            return jsonify({
+                "success": True,
+                "task_id": similar["result"]["task_id"],
+                "request_id": request_id,
+                "status": "completed",
+                "callback_data": similar["result"]["callback_data"],
+                "matched_callback_id": similar["result"]["task_id"],
+                "semantic_match": {"prompt": similar["prompt"], "similarity": similar["similarity"]},
+                "message": "Served existing generation of a similar prompt"
+            })
+        
         # Request music generation
         result = generate_music_with_suno(
             prompt=prompt,
@@ -883,38 +1290,29 @@ def generate_audio_with_callback():
             return jsonify(result), 500
             
         # Get task ID
-        task_id = result.get('task_id')
+        task_id = result.get('response_task_id')
+        if not task_id:
+            return jsonify({
+                "error": "No taskId in response",
+                "details": result
+            }), 500
         print(f"★★★ Task ID: {task_id} for request_id: {request_id}, waiting for callback... ★★★")
         
         # Store request ID and task ID mapping for future extension
-        request_task_mapping = getattr(app, 'request_task_mapping', {})
-        request_task_mapping[request_id] = task_id
-        app.request_task_mapping = request_task_mapping
+        callback_store.link_request(request_id, task_id)
         
-        # Function to monitor callback data keys (for cases where task_id format is different)
+        # Poll in the background in case the webhook is lost
+        # (terminal results are stored as callbacks and wake the wait below)
+        task_poller.track(task_id)
+        semantic_cache.add_pending(task_id, "music", music_params, prompt_vector, prompt)
+        
+        # Function to look up callback data (for cases where task_id format is different)
+        # Nested task IDs and title IDs are indexed when the callback is stored
         def find_matching_callback():
-            # Exact match
-            if task_id in callback_data:
-                print(f"★★★ Found exact match callback for task_id: {task_id}, request_id: {request_id} ★★★")
-                return callback_data[task_id]
-            
-            # Partial match (search for keys containing part of task_id)
-            for key in callback_data.keys():
-                if task_id in key or key in task_id:
-                    print(f"★★★ Found callback with partial match: {key} for request_id: {request_id} ★★★")
-                    return callback_data[key]
-                    
-            # Search in JSON of callback data
-            for key, cb in callback_data.items():
-                cb_data = cb.get("data", {})
-                if isinstance(cb_data, dict):
-                    # Check data_obj for task_id
-                    data_obj = cb_data.get("data", {})
-                    if isinstance(data_obj, dict) and data_obj.get("task_id") == task_id:
-                        print(f"★★★ Found task_id in nested data: {key} for request_id: {request_id} ★★★")
-                        return cb
-                        
-            return None
+            key, cb = callback_store.find(task_id)
+            if cb is not None:
+                print(f"★★★ Found callback: {key} for task_id: {task_id}, request_id: {request_id} ★★★")
+            return cb
             
         # Check if callback has already arrived (already processed)
         cb_data = find_matching_callback()
@@ -930,76 +1328,73 @@ def generate_audio_with_callback():
                 "message": "Music generation completed (callback already received)"
             })
         
-        # Wait for callback
+        # Wait for callback (woken by callback() as soon as a matching payload is stored)
         start_time = time.time()
-        while time.time() - start_time < timeout:
-            # Search for matching callback
-            cb_data = find_matching_callback()
-            if cb_data:
-                print(f"★★★ Callback found for task {task_id}, request_id: {request_id} - returning immediately without waiting for timeout ★★★")
-                
-                # Return callback data immediately (without waiting for timeout)
+        cb_data = callback_notifier.wait(
+            [task_id, task_id[:SHORT_ID_LENGTH]],
+            find_matching_callback,
+            timeout
+        )
+        if cb_data:
+            print(f"★★★ Callback found for task {task_id}, request_id: {request_id} - returning immediately without waiting for timeout ★★★")
+            
+            # Return callback data immediately (without waiting for timeout)
+            return jsonify({
+                "success": True,
+                "task_id": task_id,
+                "request_id": request_id,
+                "status": "completed",
+                "callback_data": cb_data,
+                "matched_callback_id": task_id,
+                "message": "Music generation completed"
+            })
+        
+        # Use the latest status seen by the task poller (local state, no upstream request)
+        try:
+            status_result = status_cache.get(task_id)
+            
+            if status_result and str(status_result.get("status", "")).lower() == "success":
+                print(f"★★★ Task {task_id}, request_id: {request_id} completed successfully (via status check) ★★★")
                 return jsonify({
                     "success": True,
                     "task_id": task_id,
                     "request_id": request_id,
                     "status": "completed",
-                    "callback_data": cb_data,
-                    "matched_callback_id": task_id,
+                    "result": status_result,
                     "message": "Music generation completed"
                 })
-            
-            # Check status (skip if error occurs)
-            try:
-                from modules.music.generator import check_generation_status
-                status_result = check_generation_status(task_id)
-                
-                if status_result and status_result.get("status") == "success":
-                    print(f"★★★ Task {task_id}, request_id: {request_id} completed successfully (via status check) - returning immediately without waiting for timeout ★★★")
-                    return jsonify({
-                        "success": True,
-                        "task_id": task_id,
-                        "request_id": request_id,
-                        "status": "completed",
-                        "result": status_result,
-                        "message": "Music generation completed"
-                    })
-            except Exception as status_error:
-                print(f"Status check error (non-fatal) for request_id: {request_id}: {str(status_error)}")
-            
-            # Wait for a while
-            time.sleep(2)
-            
-            # Check if callback data exists (this check is done every time)
-            print(f"Waiting for callback, request_id: {request_id}, elapsed time: {int(time.time() - start_time)}s, available keys: {list(callback_data.keys())}")
+        except Exception as status_error:
+            print(f"Status check error (non-fatal) for request_id: {request_id}: {str(status_error)}")
         
         # If timeout reached, return available callback data if any
         print(f"Timeout reached for request_id: {request_id}. Looking for any available callback data.")
-        for key, value in callback_data.items():
-            # Check callback data creation time
-            callback_time = datetime.fromisoformat(value.get("timestamp", ""))
-            request_time = datetime.fromtimestamp(start_time)
-            
-            # Search for callback data created after request
-            if callback_time > request_time:
-                print(f"Found callback data created after request: {key} for request_id: {request_id}")
-                return jsonify({
-                    "success": True,
-                    "task_id": task_id,
-                    "request_id": request_id,
-                    "matched_callback_id": key,
-                    "status": "completed",
-                    "callback_data": value,
-                    "message": "Music generation completed (callback found after timeout)"
-                })
+        # Search for callback data created after request
+        request_time = datetime.fromtimestamp(start_time).isoformat()
+        key, value = callback_store.first_since(request_time)
+        if value is not None:
+            print(f"Found callback data created after request: {key} for request_id: {request_id}")
+            return jsonify({
+                "success": True,
+                "task_id": task_id,
+                "request_id": request_id,
+                "matched_callback_id": key,
+                "status": "completed",
+                "callback_data": value,
+                "message": "Music generation completed (callback found after timeout)"
+            })
         
-        return jsonify({
+        response = {
             "success": True,
             "task_id": task_id,
             "request_id": request_id,
             "status": "processing",
+            "timed_out": True,
             "message": f"Timeout reached. Processing is ongoing. Check status at /api/check-status"
-        })
+        }
+        if similar:
+            # Offer the existing generation while the new one is running
+            response["similar_result"] = similar
+        return jsonify(response)
         
     except Exception as e:
         print(f"Error generating audio with callback: {str(e)}")
@@ -1008,6 +1403,7 @@ def generate_audio_with_callback():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/generate-mp4-with-callback', methods=['POST'])
+@idempotent(idempotency_store)
 def api_generate_mp4_with_callback():
     """
     MP4 video is generated and waiting for callback API endpoint
@@ -1032,35 +1428,23 @@ def api_generate_mp4_with_callback():
             
         # If audio_id is not specified, check task_id callback data
         if not audio_id:
-            # Check task_id callback data
-            if task_id in callback_data:
-                cb_data = callback_data[task_id].get("data", {})
-                if "data" in cb_data and "data" in cb_data["data"]:
-                    music_items = cb_data["data"]["data"]
-                    if isinstance(music_items, list) and len(music_items) > 0:
-                        # Use first music item ID
-                        audio_id = music_items[0].get("id")
-                        print(f"Using first audio ID from callback data: {audio_id} for request_id: {request_id}")
+            # Use first music item ID from task_id callback data
+            audio_id = callback_store.first_audio_id(task_id)
+            if audio_id:
+                print(f"Using first audio ID from callback data: {audio_id} for request_id: {request_id}")
         
         if not audio_id:
             return jsonify({"error": "audio_idが指定されておらず、コールバックデータからも取得できませんでした"}), 400
             
         # Clear existing MP4 callback data (to prevent duplication)
-        mp4_callbacks_to_remove = []
-        for key in callback_data.keys():
-            cb_data = callback_data[key].get("data", {})
-            if "mp4_request_time" in cb_data and cb_data.get("original_task_id") == task_id and cb_data.get("audio_id") == audio_id:
-                mp4_callbacks_to_remove.append(key)
-                
-        for key in mp4_callbacks_to_remove:
+        for key in callback_store.remove_mp4_requests(task_id, audio_id):
             print(f"Removing old MP4 callback: {key} for request_id: {request_id}")
-            del callback_data[key]
         
         # Record MP4 request time
         mp4_request_time = datetime.now().isoformat()
         
-        # Record current callback_data keys (for detecting new callback)
-        callback_data_keys_before = set(callback_data.keys())
+        # Record current callback sequence number (for detecting new callback)
+        callback_seq_before = callback_store.sequence
         
         # Call MP4 generation function
         from modules.music.generator import generate_mp4_video
@@ -1074,9 +1458,7 @@ def api_generate_mp4_with_callback():
         print(f"★★★ MP4 Task ID: {mp4_task_id} for request_id: {request_id}, waiting for callback... ★★★")
         
         # Store request ID and task ID mapping
-        request_task_mapping = getattr(app, 'request_task_mapping', {})
-        request_task_mapping[request_id] = mp4_task_id
-        app.request_task_mapping = request_task_mapping
+        callback_store.link_request(request_id, mp4_task_id)
         
         # Store MP4 request information globally (for callback matching)
         mp4_request_info = {
@@ -1088,45 +1470,13 @@ def api_generate_mp4_with_callback():
         }
         
         # Function to identify MP4 callback
+        # Looks up the MP4 task ID index, then the newest MP4 callback stored after the request
+        # (original task ID is more likely to be music data, so it is excluded)
         def find_mp4_callback():
-            # Exact match (MP4 task ID)
-            if mp4_task_id in callback_data:
-                cb_data = callback_data[mp4_task_id]
-                # Check: Whether video_url exists in callback data
-                raw_data = cb_data.get("data", {})
-                if "data" in raw_data and "video_url" in raw_data.get("data", {}):
-                    print(f"★★★ Found MP4 callback by task_id: {mp4_task_id} for request_id: {request_id} ★★★")
-                    return cb_data
-            
-            # Search in callback data
-            for key, cb in callback_data.items():
-                if key == task_id:
-                    # Original task ID is more likely to be music data, so skip
-                    continue
-                    
-                # Check if new callback is added after request
-                if key not in callback_data_keys_before:
-                    print(f"Checking new callback: {key} for request_id: {request_id}")
-                    
-                    cb_data = cb.get("data", {})
-                    
-                    # MP4 callback feature: video_url key exists
-                    if "data" in cb_data and ("video_url" in cb_data.get("data", {}) or "stream_video_url" in cb_data.get("data", {})):
-                        print(f"★★★ Found MP4 callback with video URL in new callback: {key} for request_id: {request_id} ★★★")
-                        return cb
-                    
-                    # Check for video-related string in data keys or values
-                    if isinstance(cb_data, dict):
-                        data_found = False
-                        for k, v in cb_data.items():
-                            if isinstance(v, str) and (".mp4" in v.lower() or "video" in v.lower()):
-                                print(f"★★★ Found MP4 URL in callback data: {key}, value: {v[:30]}... for request_id: {request_id} ★★★")
-                                data_found = True
-                                break
-                        if data_found:
-                            return cb
-                        
-            return None
+            cb = callback_store.find_mp4(mp4_task_id, since=callback_seq_before, exclude=task_id)
+            if cb is not None:
+                print(f"★★★ Found MP4 callback for task_id: {mp4_task_id}, request_id: {request_id} ★★★")
+            return cb
         
         # Check if callback has already arrived
         cb_data = find_mp4_callback()
@@ -1158,82 +1508,70 @@ def api_generate_mp4_with_callback():
             # Return directly callback data content as it is
             return jsonify(raw_callback_data)
             
-        # Wait for MP4 task ID related callback
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            # Search MP4 callback
-            cb_data = find_mp4_callback()
-            if cb_data:
-                print(f"★★★ MP4 callback found for request_id: {request_id}, returning data ★★★")
-                
-                # Return callback data as it is (only data content)
-                raw_callback_data = cb_data.get("data", {})
-                
-                # If streaming URL is not included, add
-                if "data" in raw_callback_data and "video_url" in raw_callback_data["data"]:
-                    video_url = raw_callback_data["data"]["video_url"]
-                    
-                    # If streaming URL is not available, generate from usual URL
-                    if "stream_video_url" not in raw_callback_data["data"]:
-                        # Convert URL to streaming URL
-                        # Example: example.com/file.mp4 → example.com/stream/file.mp4
-                        stream_url = video_url
-                        if ".mp4" in video_url:
-                            stream_url = video_url.replace(".mp4", "_stream.mp4")
-                        
-                        # Add streaming URL
-                        raw_callback_data["data"]["stream_video_url"] = stream_url
-                        print(f"Added stream_video_url: {stream_url} for request_id: {request_id}")
-                
-                # Add request ID
-                if "data" in raw_callback_data:
-                    raw_callback_data["data"]["request_id"] = request_id
-                
-                # Return directly callback data content as it is
-                return jsonify(raw_callback_data)
+        # Wait for MP4 task ID related callback (woken by callback() on every new payload,
+        # since an MP4 callback may arrive under a different task ID)
+        cb_data = callback_notifier.wait([mp4_task_id, ANY_CALLBACK], find_mp4_callback, timeout)
+        if cb_data:
+            print(f"★★★ MP4 callback found for request_id: {request_id}, returning data ★★★")
+            
+            # Return callback data as it is (only data content)
+            raw_callback_data = cb_data.get("data", {})
             
-            # Check MP4 URL
-            try:
-                # Call status check API
-                from modules.music.generator import check_generation_status
-                status_result = check_generation_status(task_id)
+            # If streaming URL is not included, add
+            if "data" in raw_callback_data and "video_url" in raw_callback_data["data"]:
+                video_url = raw_callback_data["data"]["video_url"]
                 
-                if status_result:
-                    # Search MP4 URL
-                    mp4_url = status_result.get("videoUrl")
+                # If streaming URL is not available, generate from usual URL
+                if "stream_video_url" not in raw_callback_data["data"]:
+                    # Convert URL to streaming URL
+                    # Example: example.com/file.mp4 → example.com/stream/file.mp4
+                    stream_url = video_url
+                    if ".mp4" in video_url:
+                        stream_url = video_url.replace(".mp4", "_stream.mp4")
                     
-                    if mp4_url:
-                        print(f"★★★ MP4 URL found via status check: {mp4_url} for request_id: {request_id} ★★★")
-                        
-                        # Generate streaming URL
-                        stream_url = mp4_url
-                        if ".mp4" in mp4_url:
-                            stream_url = mp4_url.replace(".mp4", "_stream.mp4")
-                        
-                        # Return callback data in exactly the same format as callback data
-                        return jsonify({
-                            "code": 200,
-                            "data": {
-                                "task_id": mp4_task_id,
-                                "request_id": request_id,
-                                "video_url": mp4_url,
-                                "stream_video_url": stream_url
-                            },
-                            "msg": "All generated successfully."
-                        })
-            except Exception as status_error:
-                print(f"MP4 status check error (non-fatal) for request_id: {request_id}: {str(status_error)}")
+                    # Add streaming URL
+                    raw_callback_data["data"]["stream_video_url"] = stream_url
+                    print(f"Added stream_video_url: {stream_url} for request_id: {request_id}")
             
-            # Wait for a while
-            time.sleep(2)
+            # Add request ID
+            if "data" in raw_callback_data:
+                raw_callback_data["data"]["request_id"] = request_id
             
-            # Progress display
-            print(f"Waiting for MP4 callback, request_id: {request_id}, elapsed time: {int(time.time() - start_time)}s, available keys: {list(callback_data.keys())}")
-            # Periodically output new callback data for debugging
-            if int(time.time() - start_time) % 20 < 2:  # Output every 20 seconds
-                for key in callback_data.keys():
-                    if key not in callback_data_keys_before:
-                        print(f"New callback data found for key {key} for request_id: {request_id}: {json.dumps(callback_data[key].get('data', {}), ensure_ascii=False)[:200]}...")
+            # Return directly callback data content as it is
+            return jsonify(raw_callback_data)
+        
+        # Check MP4 URL once in case the callback was lost
+        try:
+            # Call status check API
+            # (fresh: the cached SUCCESS status predates the videoUrl)
+            from modules.music.generator import check_generation_status
+            status_result = check_generation_status(task_id, fresh=True)
+            
+            if status_result:
+                # Search MP4 URL
+                mp4_url = status_result.get("videoUrl")
+                
+                if mp4_url:
+                    print(f"★★★ MP4 URL found via status check: {mp4_url} for request_id: {request_id} ★★★")
+                    
+                    # Generate streaming URL
+                    stream_url = mp4_url
+                    if ".mp4" in mp4_url:
+                        stream_url = mp4_url.replace(".mp4", "_stream.mp4")
+                    
+                    # Return callback data in exactly the same format as callback data
+                    return jsonify({
+                        "code": 200,
+                        "data": {
+                            "task_id": mp4_task_id,
+                            "request_id": request_id,
+                            "video_url": mp4_url,
+                            "stream_video_url": stream_url
+                        },
+                        "msg": "All generated successfully."
+                    })
+        except Exception as status_error:
+            print(f"MP4 status check error (non-fatal) for request_id: {request_id}: {str(status_error)}")
         
         # If timeout reached
         return jsonify({
@@ -1257,6 +1595,7 @@ def api_generate_mp4_with_callback():
         }), 500
 
 @app.route('/api/generate-video', methods=['POST'])
+@idempotent(idempotency_store)
 async def generate_video():
     try:
         # Get request data
@@ -1278,6 +1617,20 @@ async def generate_video():
         print(f"🎬 Style: {style}")
         print(f"🎬 Prompt: {prompt}")
         print(f"🎬 Aspect ratio: {aspect_ratio}, Duration: {duration}s")
+        
+        # Completed generation of a near-duplicate prompt with the same settings
+        # (embedding inference runs in a thread to keep the event loop free)
+        video_params = {"aspect_ratio": aspect_ratio, "duration": duration, "style": style}
+        prompt_vector, similar = await asyncio.to_thread(find_similar_generation, "video", prompt, video_params)
+        if similar and data.get('reuse_similar', SEMANTIC_CACHE_SERVE):
+            return jsonify({
+                "success": True,
+                "request_id": similar["result"]["request_id"],
+                "status": "completed",
+                "semantic_match": similar,
+                "message": "Served existing generation of a similar prompt"
+            })
+        
         # Execute video generation
         from modules.video.generator import generate_video_from_text
         result = await generate_video_from_text(
@@ -1287,6 +1640,12 @@ async def generate_video():
             style=style
         )
         
+        if result.get("success"):
+            semantic_cache.add_pending(result.get("request_id"), "video", video_params, prompt_vector, prompt)
+            if similar:
+                # Offer the existing generation alongside the new job
+                result["similar_result"] = similar
+        
         # Return success response
         return jsonify(result)
         
@@ -1297,6 +1656,7 @@ async def generate_video():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/merge-video-audio', methods=['POST'])
+@idempotent(idempotency_store)
 def merge_video_audio_endpoint():
 
     try:
@@ -1312,11 +1672,19 @@ def merge_video_audio_endpoint():
         if not video_url or not audio_url:
             return jsonify({"error": "video_url and audio_url are required"}), 400
         
-        # Merge video and audio
-        result = merge_video_audio(
-            video_url=video_url,
-            audio_url=audio_url
-        )
+        # Task ID to report merge progress to (optional, for /api/tasks/<task_id>/events)
+        task_id = data.get('task_id')
+        
+        # Merge video and audio in the merge pool
+        try:
+            job_id = get_merge_engine().submit(video_url, audio_url, merge_options(data), on_done=merge_progress_reporter(task_id))
+        except QueueFullError as e:
+            return merge_queue_full_response(e)
+        try:
+            result = get_merge_engine().wait(job_id, timeout=MERGE_SYNC_TIMEOUT)
+        except TimeoutError:
+            # Still running: hand out the job instead of holding the worker thread
+            return merge_job_accepted_response(job_id)
         
         if not result.get('success'):
             return jsonify(result), 500
@@ -1333,6 +1701,114 @@ def merge_video_audio_endpoint():
             "message": "Failed to merge video and audio"
         }), 500
 
+def merge_options(data):
+    """
+    Function to get merge_video_audio keyword arguments from a request body
+    """
+    return {
+        "deterministic_offset": bool(data.get('deterministic_offset', MERGE_DETERMINISTIC_OFFSET)),
+        "use_cache": bool(data.get('use_cache', True)),
+        "streaming": bool(data.get('streaming', MERGE_STREAMING)),
+        "audio_offset": str(data.get('audio_offset', MERGE_AUDIO_OFFSET)).lower()
+    }
+
+def merge_progress_reporter(task_id):
+    """
+    Function to get the on_done callback publishing a merge's outcome to a task's event stream
+    """
+    if not task_id:
+        return None
+    return lambda job_id, result: task_events.publish(task_id, STAGE_MERGE_DONE if result.get('success') else STAGE_ERROR, result)
+
+def merge_job_accepted_response(job_id):
+    return jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "status_url": f"/api/merge-jobs/{job_id}",
+        "result_url": f"/api/merge-jobs/{job_id}/result"
+    }), 202
+
+def merge_queue_full_response(error):
+    response = jsonify({
+        "error": str(error),
+        "message": "Too many merges in progress, retry later"
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+@app.route('/api/merge-jobs', methods=['POST'])
+@idempotent(idempotency_store)
+def submit_merge_job():
+    """
+    Endpoint to queue a merge and return its job ID without waiting for it
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Invalid JSON data"}), 400
+        
+        video_url = data.get('video_url')
+        audio_url = data.get('audio_url')
+        if not video_url or not audio_url:
+            return jsonify({"error": "video_url and audio_url are required"}), 400
+        
+        task_id = data.get('task_id')
+        try:
+            job_id = get_merge_engine().submit(video_url, audio_url, merge_options(data), on_done=merge_progress_reporter(task_id))
+        except QueueFullError as e:
+            return merge_queue_full_response(e)
+        
+        return merge_job_accepted_response(job_id)
+        
+    except Exception as e:
+        print(f"Error queueing merge job: {str(e)}")
+        return jsonify({
+            "error": str(e),
+            "message": "Failed to queue merge job"
+        }), 500
+
+@app.route('/api/merge-jobs/stats', methods=['GET'])
+def merge_job_stats():
+    """
+    Endpoint to get merge pool and merge cache counters
+    """
+    try:
+        return jsonify({
+            "status": "success",
+            "stats": {
+                "merge_engine": get_merge_engine().stats(),
+                "merge_cache": merge_cache.stats()
+            }
+        })
+    except Exception as e:
+        print(f"Error getting merge stats: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"Error getting merge stats: {str(e)}"
+        }), 500
+
+@app.route('/api/merge-jobs/<job_id>', methods=['GET'])
+def merge_job_status(job_id):
+    """
+    Endpoint to get the status of a merge job
+    """
+    job = get_merge_engine().get(job_id)
+    if job is None:
+        return jsonify({"error": f"Merge job not found: {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/api/merge-jobs/<job_id>/result', methods=['GET'])
+def merge_job_result(job_id):
+    """
+    Endpoint to get the result of a merge job (202 until it finishes)
+    """
+    job = get_merge_engine().get(job_id)
+    if job is None:
+        return jsonify({"error": f"Merge job not found: {job_id}"}), 404
+    if job["result"] is None:
+        return jsonify({"job_id": job_id, "status": job["status"]}), 202
+    return jsonify(job["result"]), 200 if job["result"].get('success') else 500
+
 @app.route('/api/webhook/segmind', methods=['POST'])
 def segmind_webhook():
     try:
@@ -1406,6 +1882,7 @@ def generate_veo():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/generate-veo3', methods=['POST'])
+@idempotent(idempotency_store)
 def generate_veo3():
     try:
         # Initialize Veo3 client
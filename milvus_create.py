@@ -1,10 +1,8 @@
 import os
 import time
-import torch
-import numpy as np
-from transformers import BertTokenizer, BertModel
 from pymilvus import MilvusClient, DataType
 from dotenv import load_dotenv
+from modules.embedding import get_embedding
 
 # Load environment variables from .env file
 load_dotenv()
@@ -69,22 +67,8 @@ for idx, item in enumerate(music_data):
 print(f"Data prepared. Count: {len(csv_ids)}")
 
 # --- ② BERT text encoding (for genre and description) ---
-model_name = "bert-base-uncased"  # Changed to English BERT model
-tokenizer = BertTokenizer.from_pretrained(model_name)
-model = BertModel.from_pretrained(model_name)
-model.eval()
-
-def get_embedding(text):
-    if not text:
-        text = ""
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    # Get the [CLS] token vector and normalize (for cosine similarity comparison)
-    cls_vector = outputs.last_hidden_state[:, 0, :]
-    vec = cls_vector.squeeze().numpy()
-    norm = np.linalg.norm(vec)
-    return (vec / norm).tolist() if norm > 0 else vec.tolist()
+# bert-base-uncased [CLS] vectors (EMBEDDING_MODEL, 768-dim). The API server's semantic prompt
+# cache uses a different model (PROMPT_EMBEDDING_MODEL) and dimension: do not reuse this collection for it
 
 # Combine genre and description for encoding
 combined_texts = [f"{genre} {desc}" for genre, desc in zip(genres, descriptions)]
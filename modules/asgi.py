@@ -0,0 +1,114 @@
+import asyncio
+import re
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl
+
+from hypercorn.app_wrappers import WSGIWrapper
+from werkzeug.datastructures import Headers, MultiDict
+
+# Same request body limit hypercorn applies to WSGI apps
+WSGI_MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class StreamResponse:
+    """
+    Response of an async route
+
+    body is either bytes or an async iterator of str chunks; on_close runs
+    once the response is finished or the client went away (also when the
+    body was never started).
+    """
+
+    __slots__ = ("status", "headers", "body", "on_close")
+
+    def __init__(self, status: int, headers: List[Tuple[str, str]], body: Union[bytes, AsyncIterator[str]], on_close: Optional[Callable[[], None]] = None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.on_close = on_close
+
+
+class AsyncRouteDispatcher:
+    """
+    ASGI app serving selected GET routes from coroutines and everything else
+    from a WSGI (Flask) app
+
+    The WSGI app runs in the event loop's thread pool exactly as hypercorn
+    runs a plain WSGI app. Async routes hold no thread while they wait, so
+    long-lived streams (Server-Sent Events) scale to many idle clients.
+    """
+
+    def __init__(self, wsgi_app, max_body_size: int = WSGI_MAX_BODY_SIZE):
+        self.wsgi = WSGIWrapper(wsgi_app, max_body_size)
+        self.routes: List[Tuple["re.Pattern", Callable[..., Awaitable[StreamResponse]]]] = []
+
+    def route(self, pattern: str):
+        """
+        Register an async GET route
+
+        Args:
+            pattern: Regular expression matched against the whole path (named groups become keyword arguments)
+
+        Returns:
+            Decorator registering handler(args, headers, **groups) -> StreamResponse
+        """
+        def decorator(handler):
+            self.routes.append((re.compile(pattern), handler))
+            return handler
+        return decorator
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["method"] == "GET":
+            for pattern, handler in self.routes:
+                match = pattern.fullmatch(scope["path"])
+                if match:
+                    await self._serve(handler, match, scope, receive, send)
+                    return
+        loop = asyncio.get_running_loop()
+
+        def call_soon(func, *args):
+            return asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+
+        await self.wsgi(scope, receive, send, partial(loop.run_in_executor, None), call_soon)
+
+    async def _serve(self, handler, match, scope, receive, send) -> None:
+        args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        headers = Headers([(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]])
+        response = await handler(args, headers, **match.groupdict())
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers]
+            })
+            if isinstance(response.body, bytes):
+                await send({"type": "http.response.body", "body": response.body, "more_body": False})
+                return
+            # Stop streaming as soon as the client disconnects
+            streaming = asyncio.ensure_future(self._send_chunks(response.body, send))
+            disconnect = asyncio.ensure_future(self._wait_disconnect(receive))
+            try:
+                await asyncio.wait({streaming, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in (streaming, disconnect):
+                    task.cancel()
+                await asyncio.gather(streaming, disconnect, return_exceptions=True)
+        finally:
+            if not isinstance(response.body, bytes):
+                await response.body.aclose()
+            if response.on_close is not None:
+                response.on_close()
+
+    @staticmethod
+    async def _send_chunks(body: AsyncIterator[str], send) -> None:
+        async for chunk in body:
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    @staticmethod
+    async def _wait_disconnect(receive) -> Any:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return message
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from modules.callback.store import is_mp4_callback
+
+# Stage names pushed to clients
+STAGE_TEXT = "text"
+STAGE_FIRST = "first"
+STAGE_COMPLETE = "complete"
+STAGE_MP4_READY = "mp4_ready"
+STAGE_MERGE_DONE = "merge_done"
+STAGE_ERROR = "error"
+
+SUNO_STAGES = {STAGE_TEXT, STAGE_FIRST, STAGE_COMPLETE}
+
+
+def callback_stage(data: Any) -> Optional[str]:
+    """
+    Classify a callback payload into a progress stage
+
+    Args:
+        data: Callback payload
+
+    Returns:
+        Stage name, or None if the payload is not a known progress callback
+    """
+    if not isinstance(data, dict):
+        return None
+    code = data.get("code")
+    if code is not None and code != 200:
+        return STAGE_ERROR
+    if is_mp4_callback(data):
+        return STAGE_MP4_READY
+    inner = data.get("data")
+    if isinstance(inner, dict):
+        callback_type = str(inner.get("callbackType", "")).lower()
+        if callback_type in SUNO_STAGES:
+            return callback_type
+        if callback_type == "error":
+            return STAGE_ERROR
+    return None
+
+
+class _Subscription:
+    __slots__ = ("task_id", "queue")
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.queue = queue.Queue()
+
+    def put(self, event):
+        self.queue.put(event)
+
+
+class _AsyncSubscription:
+    """Subscription read by a coroutine (events are handed over to its loop)"""
+
+    __slots__ = ("task_id", "queue", "loop")
+
+    def __init__(self, task_id, loop):
+        self.task_id = task_id
+        self.queue = asyncio.Queue()
+        self.loop = loop
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # Loop already closed: the stream is gone
+            pass
+
+
+class TaskEventBroker:
+    """
+    Fan-out of per-task progress events to Server-Sent Events clients
+
+    callback() publishes a stage each time a payload lands; subscribers get
+    it pushed immediately instead of polling. A short history per task is
+    kept so that clients connecting (or reconnecting with Last-Event-ID)
+    after a stage was published still receive it.
+
+    Event IDs come from the callback store's sequence when one is given, so
+    a client reconnecting to another worker process sharing the store can
+    resume from its Last-Event-ID.
+    """
+
+    def __init__(self, history_size: int = 20, max_tasks: int = 10000, sequence: Optional[Callable[[], int]] = None):
+        """
+        Args:
+            history_size: Number of events kept per task for replay
+            max_tasks: Number of tasks whose history is kept (least recently published dropped first)
+            sequence: Current sequence number of the (shared) callback store, used as
+                ID of events published without one (None: per-task counter)
+        """
+        self.history_size = history_size
+        self.max_tasks = max_tasks
+        self._sequence = sequence
+        self._lock = threading.Lock()
+        self._history: "OrderedDict[str, deque]" = OrderedDict()
+        self._next_id: Dict[str, int] = {}
+        self._subscribers: Dict[str, set] = {}
+
+    def publish(self, task_id: str, stage: str, data: Any = None, event_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Publish a progress event for a task
+
+        Args:
+            task_id: Task ID
+            stage: Stage name
+            data: Event payload
+            event_id: Store sequence number of the callback the event comes from
+                (default: current store sequence)
+
+        Returns:
+            Published event
+        """
+        if event_id is None and self._sequence is not None:
+            event_id = self._sequence()
+        with self._lock:
+            # IDs stay increasing per task even if the store sequence lags behind
+            event_id = max(event_id or 0, self._next_id.get(task_id, 0) + 1)
+            self._next_id[task_id] = event_id
+            event = {
+                "id": event_id,
+                "task_id": task_id,
+                "stage": stage,
+                "timestamp": datetime.now().isoformat(),
+                "data": data
+            }
+            history = self._history.get(task_id)
+            if history is None:
+                history = self._history[task_id] = deque(maxlen=self.history_size)
+            history.append(event)
+            self._history.move_to_end(task_id)
+            while len(self._history) > self.max_tasks:
+                old_task_id, _ = self._history.popitem(last=False)
+                if old_task_id not in self._subscribers:
+                    self._next_id.pop(old_task_id, None)
+            subscribers = list(self._subscribers.get(task_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+        return event
+
+    def history(self, task_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [event for event in self._history.get(task_id, ()) if event["id"] > after]
+
+    def subscribe(self, task_id: str, after: int = 0, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Subscribe to a task's events, replaying history after an event ID
+
+        Args:
+            task_id: Task ID
+            after: Last event ID already received by the client
+            loop: Event loop of a subscribing coroutine (its queue is an asyncio.Queue)
+
+        Returns:
+            Subscription whose queue receives events
+        """
+        subscription = _Subscription(task_id) if loop is None else _AsyncSubscription(task_id, loop)
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(subscription)
+            for event in self._history.get(task_id, ()):
+                if event["id"] > after:
+                    subscription.put(event)
+        return subscription
+
+    def unsubscribe(self, subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.task_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.task_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def stream(self, task_id: str, after: int = 0, until: Optional[str] = STAGE_COMPLETE, timeout: float = 600, heartbeat: float = 15, poll: Optional[Callable[[], None]] = None, poll_interval: Optional[float] = None) -> Iterator[str]:
+        """
+        Generate a Server-Sent Events stream for a task
+
+        Args:
+            task_id: Task ID
+            after: Last event ID already received by the client (Last-Event-ID)
+            until: Close the stream after this stage (None to wait for timeout)
+            timeout: Maximum stream duration (seconds)
+            heartbeat: Interval of keep-alive comments (seconds)
+            poll: Function publishing stages found in a store shared with other
+                processes (whose callbacks are not published to this broker)
+            poll_interval: Run poll() at least this often (default: heartbeat)
+
+        Yields:
+            SSE formatted messages
+        """
+        subscription = self.subscribe(task_id, after)
+        wait = heartbeat if poll is None or poll_interval is None else min(heartbeat, poll_interval)
+        try:
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + timeout
+            next_heartbeat = time.monotonic() + heartbeat
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield format_sse({"task_id": task_id, "stage": "timeout"}, event="timeout")
+                    return
+                try:
+                    event = subscription.queue.get(timeout=min(remaining, wait))
+                except queue.Empty:
+                    if poll is not None:
+                        poll()
+                        if not subscription.queue.empty():
+                            continue
+                    if time.monotonic() >= next_heartbeat:
+                        # Keep-alive comment so proxies do not close an idle stream
+                        next_heartbeat = time.monotonic() + heartbeat
+                        yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, event=event["stage"], event_id=event["id"])
+                if event["stage"] == STAGE_ERROR or (until and event["stage"] == until):
+                    return
+        finally:
+            self.unsubscribe(subscription)
+
+    async def stream_async(self, task_id: str, after: int = 0, until: Optional[str] = STAGE_COMPLETE, timeout: float = 600, heartbeat: float = 15, poll: Optional[Callable[[], None]] = None, poll_interval: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Async counterpart of stream (an idle client holds no thread)
+
+        Same arguments as stream; poll() runs in a worker thread.
+
+        Yields:
+            SSE formatted messages
+        """
+        subscription = self.subscribe(task_id, after, loop=asyncio.get_running_loop())
+        wait = heartbeat if poll is None or poll_interval is None else min(heartbeat, poll_interval)
+        try:
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + timeout
+            next_heartbeat = time.monotonic() + heartbeat
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield format_sse({"task_id": task_id, "stage": "timeout"}, event="timeout")
+                    return
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=min(remaining, wait))
+                except asyncio.TimeoutError:
+                    if poll is not None:
+                        await asyncio.to_thread(poll)
+                        # Let events published by poll() reach the queue
+                        await asyncio.sleep(0)
+                        if not subscription.queue.empty():
+                            continue
+                    if time.monotonic() >= next_heartbeat:
+                        next_heartbeat = time.monotonic() + heartbeat
+                        yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, event=event["stage"], event_id=event["id"])
+                if event["stage"] == STAGE_ERROR or (until and event["stage"] == until):
+                    return
+        finally:
+            self.unsubscribe(subscription)
+
+
+def format_sse(data: Any, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """
+    Format a Server-Sent Events message
+
+    Args:
+        data: JSON serializable payload
+        event: Event name
+        event_id: Event ID (sent back by the browser as Last-Event-ID)
+
+    Returns:
+        SSE message
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    lines.extend(f"data: {line}" for line in payload.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
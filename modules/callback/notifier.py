@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Waiters registered on this key are woken by every notification
+ANY_CALLBACK = "*"
+
+
+class _AsyncWaiter:
+    """Wakes an asyncio.Event from any thread"""
+
+    __slots__ = ("loop", "event")
+
+    def __init__(self, loop, event):
+        self.loop = loop
+        self.event = event
+
+    def set(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # Event loop already closed (waiter gave up)
+            pass
+
+
+class CompletionNotifier:
+    """
+    Registry that lets request handlers wait for callbacks without polling
+
+    Handlers register interest in one or more keys (task IDs) and block on
+    wait() / wait_async(). callback() calls notify() with the keys of every
+    stored payload, which wakes matching waiters immediately. Waiters re-run
+    their lookup function after each wake-up, so a notification never has to
+    carry the payload itself.
+
+    When the callback store is shared with other processes, a callback may be
+    stored by a worker that cannot notify us; poll_interval makes waiters
+    re-run their (local) lookup periodically in that case.
+    """
+
+    def __init__(self, poll_interval: Optional[float] = None):
+        """
+        Args:
+            poll_interval: Default interval for re-running lookups without a notification (seconds)
+        """
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, set] = {}
+
+    def _register(self, keys, waiter):
+        with self._lock:
+            for key in keys:
+                self._waiters.setdefault(key, set()).add(waiter)
+
+    def _unregister(self, keys, waiter):
+        with self._lock:
+            for key in keys:
+                waiters = self._waiters.get(key)
+                if waiters is None:
+                    continue
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    def notify(self, keys: Iterable[str]) -> int:
+        """
+        Wake every waiter registered on any of the keys
+
+        Args:
+            keys: Keys (task IDs) of the stored callback
+
+        Returns:
+            Number of waiters woken
+        """
+        with self._lock:
+            woken = set()
+            for key in list(keys) + [ANY_CALLBACK]:
+                woken.update(self._waiters.get(key, ()))
+        for waiter in woken:
+            waiter.set()
+        return len(woken)
+
+    def waiting(self) -> int:
+        """Number of keys with at least one waiter"""
+        with self._lock:
+            return len(self._waiters)
+
+    def wait(self, keys: Iterable[str], check: Callable[[], Any], timeout: float, poll_interval: Optional[float] = None) -> Any:
+        """
+        Block the calling thread until check() returns a result or timeout expires
+
+        Args:
+            keys: Keys to wait on (use ANY_CALLBACK to wake on every callback)
+            check: Lookup function returning the result or None
+            timeout: Maximum wait time (seconds)
+            poll_interval: Re-run check() at least this often (seconds), for
+                stores shared with other processes that cannot notify us
+                (default: notifier poll_interval)
+
+        Returns:
+            Result of check() or None on timeout
+        """
+        keys = list(keys)
+        poll_interval = self.poll_interval if poll_interval is None else poll_interval
+        waiter = threading.Event()
+        # Register before the first check so a callback arriving in between is not missed
+        self._register(keys, waiter)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                result = check()
+                if result is not None:
+                    return result
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                waiter.wait(remaining if poll_interval is None else min(remaining, poll_interval))
+                waiter.clear()
+        finally:
+            self._unregister(keys, waiter)
+
+    async def wait_async(self, keys: Iterable[str], check: Callable[[], Any], timeout: float, poll_interval: Optional[float] = None) -> Any:
+        """
+        Asyncio counterpart of wait(); does not block the event loop
+
+        Args:
+            keys: Keys to wait on (use ANY_CALLBACK to wake on every callback)
+            check: Lookup function returning the result or None
+            timeout: Maximum wait time (seconds)
+            poll_interval: Re-run check() at least this often (seconds)
+                (default: notifier poll_interval)
+
+        Returns:
+            Result of check() or None on timeout
+        """
+        keys = list(keys)
+        poll_interval = self.poll_interval if poll_interval is None else poll_interval
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = _AsyncWaiter(loop, event)
+        self._register(keys, waiter)
+        try:
+            deadline = loop.time() + timeout
+            while True:
+                result = check()
+                if result is not None:
+                    return result
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(event.wait(), remaining if poll_interval is None else min(remaining, poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            self._unregister(keys, waiter)
@@ -0,0 +1,453 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.callback.store import (
+    SHORT_ID_LENGTH,
+    CallbackBackend,
+    estimate_size,
+    extract_audio_ids,
+    extract_task_ids,
+    is_mp4_callback,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS callbacks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mp4 INTEGER NOT NULL DEFAULT 0,
+    mp4_task_id TEXT,
+    mp4_audio_id TEXT,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_callbacks_timestamp ON callbacks(timestamp);
+CREATE INDEX IF NOT EXISTS idx_callbacks_expires_at ON callbacks(expires_at);
+CREATE INDEX IF NOT EXISTS idx_callbacks_accessed_at ON callbacks(accessed_at);
+CREATE INDEX IF NOT EXISTS idx_callbacks_mp4 ON callbacks(mp4, seq);
+CREATE INDEX IF NOT EXISTS idx_callbacks_mp4_request ON callbacks(mp4_task_id, mp4_audio_id);
+
+CREATE TABLE IF NOT EXISTS callback_keys (
+    key TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL REFERENCES callbacks(seq) ON DELETE CASCADE,
+    prefix TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_callback_keys_seq ON callback_keys(seq);
+CREATE INDEX IF NOT EXISTS idx_callback_keys_prefix ON callback_keys(prefix);
+
+CREATE TABLE IF NOT EXISTS callback_audio (
+    audio_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL REFERENCES callbacks(seq) ON DELETE CASCADE,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_callback_audio_seq ON callback_audio(seq);
+
+CREATE TABLE IF NOT EXISTS request_tasks (
+    request_id TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_request_tasks_task_id ON request_tasks(task_id);
+CREATE INDEX IF NOT EXISTS idx_request_tasks_created_at ON request_tasks(created_at);
+
+CREATE TABLE IF NOT EXISTS store_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_counters (name, value) VALUES
+    ('entries', 0), ('resident_bytes', 0), ('evictions', 0), ('expirations', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_callbacks_insert AFTER INSERT ON callbacks BEGIN
+    UPDATE store_counters SET value = value + 1 WHERE name = 'entries';
+    UPDATE store_counters SET value = value + NEW.size WHERE name = 'resident_bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_callbacks_delete AFTER DELETE ON callbacks BEGIN
+    UPDATE store_counters SET value = value - 1 WHERE name = 'entries';
+    UPDATE store_counters SET value = value - OLD.size WHERE name = 'resident_bytes';
+END;
+"""
+
+# Reads refresh accessed_at at most this often (seconds) to keep reads mostly write-free
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCallbackStore(CallbackBackend):
+    """
+    Callback / task state backend stored in a SQLite database (WAL mode)
+
+    Several worker processes can open the same database file: the worker that
+    receives a Suno callback writes it, and the worker blocked in a
+    *-with-callback endpoint sees it on its next lookup. Task IDs, short title
+    IDs, audio IDs and request IDs are indexed columns, so every lookup is an
+    index seek. TTL, entry count and byte budget behave like CallbackStore;
+    counters are kept in the database and shared by all workers.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, busy_timeout: float = 5.0):
+        """
+        Args:
+            path: Database file path
+            ttl: Default time to live of a payload (seconds, None for no expiry)
+            max_entries: Maximum number of stored payloads (None for unlimited)
+            max_bytes: Maximum estimated size of stored payloads (None for unlimited)
+            busy_timeout: Time to wait for another process's write lock (seconds)
+        """
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock up front to avoid upgrade deadlocks"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _info(row) -> Dict[str, Any]:
+        """Build callback info from a (seq, data, timestamp, ...) row"""
+        return {
+            "data": json.loads(row[1]),
+            "timestamp": row[2],
+            "seq": row[0]
+        }
+
+    def _live_row(self, conn, seq) -> Optional[Dict[str, Any]]:
+        """Load a payload if it has not expired (refreshing accessed_at), else None"""
+        row = conn.execute(
+            "SELECT seq, data, timestamp, expires_at, accessed_at FROM callbacks WHERE seq = ?",
+            (seq,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[3] is not None and row[3] <= now:
+            with self._write() as wconn:
+                deleted = wconn.execute("DELETE FROM callbacks WHERE seq = ?", (seq,)).rowcount
+                if deleted:
+                    self._bump(wconn, "expirations", deleted)
+            return None
+        if row[4] < now - ACCESS_RESOLUTION:
+            conn.execute("UPDATE callbacks SET accessed_at = ? WHERE seq = ?", (now, seq))
+        return self._info(row)
+
+    @staticmethod
+    def _bump(conn, name, amount=1):
+        conn.execute("UPDATE store_counters SET value = value + ? WHERE name = ?", (amount, name))
+
+    @staticmethod
+    def _counter(conn, name) -> int:
+        row = conn.execute("SELECT value FROM store_counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    # ------------------------------------------------------------------
+    # Ingest
+    # ------------------------------------------------------------------
+    def add(self, data: Any, ttl: Optional[float] = None) -> List[str]:
+        """
+        Store a callback payload and index it
+
+        Args:
+            data: Callback payload
+            ttl: Time to live of this payload (seconds, default: store TTL)
+
+        Returns:
+            List of task IDs the payload was stored under
+        """
+        task_ids = extract_task_ids(data)
+        if not task_ids:
+            print(f"Warning: No task_id found in callback data")
+            # Generate temporary ID
+            task_id = str(uuid.uuid4())
+            task_ids.append(task_id)
+            print(f"Generated temporary task_id: {task_id}")
+
+        serialized = json.dumps(data, ensure_ascii=False, default=str)
+        size = estimate_size(data)
+        audio_ids = extract_audio_ids(data)
+        mp4_task_id = mp4_audio_id = None
+        if isinstance(data, dict) and "mp4_request_time" in data:
+            mp4_task_id, mp4_audio_id = data.get("original_task_id"), data.get("audio_id")
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+
+        with self._write() as conn:
+            seq = conn.execute(
+                "INSERT INTO callbacks (data, timestamp, size, mp4, mp4_task_id, mp4_audio_id, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (serialized, datetime.now().isoformat(), size, int(is_mp4_callback(data)),
+                 mp4_task_id, mp4_audio_id, now + ttl if ttl is not None else None, now)
+            ).lastrowid
+
+            # Rebind keys; payloads left without any key are removed
+            previous = {row[0] for row in conn.execute(
+                f"SELECT DISTINCT seq FROM callback_keys WHERE key IN ({','.join('?' * len(task_ids))})",
+                task_ids
+            )}
+            conn.executemany(
+                "INSERT OR REPLACE INTO callback_keys (key, seq, prefix) VALUES (?, ?, ?)",
+                [(task_id, seq, task_id[:SHORT_ID_LENGTH]) for task_id in task_ids]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO callback_audio (audio_id, seq, position) VALUES (?, ?, ?)",
+                [(audio_id, seq, position) for position, audio_id in enumerate(audio_ids)]
+            )
+            for old_seq in previous:
+                conn.execute(
+                    "DELETE FROM callbacks WHERE seq = ? AND NOT EXISTS (SELECT 1 FROM callback_keys WHERE seq = ?)",
+                    (old_seq, old_seq)
+                )
+
+            self._enforce_limits(conn, seq)
+
+        return task_ids
+
+    def _enforce_limits(self, conn, newest):
+        """Evict least recently used payloads until the store is within its limits"""
+        while True:
+            over_entries = self.max_entries is not None and self._counter(conn, "entries") > self.max_entries
+            over_bytes = self.max_bytes is not None and self._counter(conn, "resident_bytes") > self.max_bytes
+            if not over_entries and not over_bytes:
+                break
+            row = conn.execute(
+                "SELECT seq FROM callbacks WHERE seq != ? ORDER BY accessed_at, seq LIMIT 1",
+                (newest,)
+            ).fetchone()
+            if row is None:
+                # Never evict the payload that was just stored
+                break
+            conn.execute("DELETE FROM callbacks WHERE seq = ?", (row[0],))
+            self._bump(conn, "evictions")
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def _seq_for_key(self, conn, key) -> Optional[int]:
+        row = conn.execute("SELECT seq FROM callback_keys WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connection()
+        seq = self._seq_for_key(conn, task_id)
+        return self._live_row(conn, seq) if seq is not None else None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM callback_keys").fetchone()[0]
+
+    def find(self, task_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Find callback info for a task ID, allowing short title IDs
+
+        Args:
+            task_id: Task ID
+
+        Returns:
+            Tuple of (matched key, callback info), or (None, None)
+        """
+        if not task_id:
+            return None, None
+        conn = self._connection()
+        info = self.get(task_id)
+        if info is not None:
+            return task_id, info
+        rows = conn.execute(
+            "SELECT key, seq FROM callback_keys WHERE prefix = ?",
+            (task_id[:SHORT_ID_LENGTH],)
+        ).fetchall()
+        for key, seq in rows:
+            if task_id in key or key in task_id:
+                info = self._live_row(conn, seq)
+                if info is not None:
+                    return key, info
+        return None, None
+
+    def find_by_audio_id(self, audio_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connection()
+        row = conn.execute("SELECT seq FROM callback_audio WHERE audio_id = ?", (audio_id,)).fetchone()
+        return self._live_row(conn, row[0]) if row else None
+
+    def first_audio_id(self, task_id: str) -> Optional[str]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT a.audio_id FROM callback_keys k JOIN callback_audio a ON a.seq = k.seq "
+            "JOIN callbacks c ON c.seq = k.seq "
+            "WHERE k.key = ? AND (c.expires_at IS NULL OR c.expires_at > ?) ORDER BY a.position LIMIT 1",
+            (task_id, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_mp4(self, mp4_task_id: str, since: int = 0, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        conn = self._connection()
+        if mp4_task_id:
+            row = conn.execute(
+                "SELECT c.seq FROM callback_keys k JOIN callbacks c ON c.seq = k.seq WHERE k.key = ? AND c.mp4 = 1",
+                (mp4_task_id,)
+            ).fetchone()
+            if row:
+                info = self._live_row(conn, row[0])
+                if info is not None:
+                    return info
+        row = conn.execute(
+            "SELECT c.seq FROM callbacks c WHERE c.mp4 = 1 AND c.seq > ? "
+            "AND (c.expires_at IS NULL OR c.expires_at > ?) "
+            "AND NOT EXISTS (SELECT 1 FROM callback_keys k WHERE k.seq = c.seq AND k.key = ?) "
+            "ORDER BY c.seq DESC LIMIT 1",
+            (since, time.time(), exclude or "")
+        ).fetchone()
+        return self._live_row(conn, row[0]) if row else None
+
+    def first_since(self, timestamp: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT c.seq, c.data, c.timestamp, k.key FROM callbacks c JOIN callback_keys k ON k.seq = c.seq "
+            "WHERE c.timestamp > ? AND (c.expires_at IS NULL OR c.expires_at > ?) ORDER BY c.seq LIMIT 1",
+            (timestamp, time.time())
+        ).fetchone()
+        if row is None:
+            return None, None
+        return row[3], self._info(row)
+
+    @property
+    def sequence(self) -> int:
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'callbacks'").fetchone()
+        return row[0] if row else 0
+
+    def keys(self) -> List[str]:
+        return [row[0] for row in self._connection().execute("SELECT key FROM callback_keys ORDER BY seq")]
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self._connection().execute(
+            "SELECT c.seq, c.data, c.timestamp, k.key FROM callback_keys k JOIN callbacks c ON c.seq = k.seq "
+            "WHERE c.expires_at IS NULL OR c.expires_at > ? ORDER BY c.seq",
+            (time.time(),)
+        ).fetchall()
+        return [(row[3], self._info(row)) for row in rows]
+
+    # ------------------------------------------------------------------
+    # Request ID mapping
+    # ------------------------------------------------------------------
+    def link_request(self, request_id: str, task_id: str) -> None:
+        with self._write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO request_tasks (request_id, task_id, created_at) VALUES (?, ?, ?)",
+                (request_id, task_id, time.time())
+            )
+
+    def task_for_request(self, request_id: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT task_id FROM request_tasks WHERE request_id = ?",
+            (request_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    # ------------------------------------------------------------------
+    # Removal
+    # ------------------------------------------------------------------
+    def remove_mp4_requests(self, task_id: str, audio_id: str) -> List[str]:
+        with self._write() as conn:
+            rows = conn.execute(
+                "SELECT k.key, c.seq FROM callbacks c JOIN callback_keys k ON k.seq = c.seq "
+                "WHERE c.mp4_task_id = ? AND c.mp4_audio_id = ?",
+                (task_id, audio_id)
+            ).fetchall()
+            for seq in {row[1] for row in rows}:
+                conn.execute("DELETE FROM callbacks WHERE seq = ?", (seq,))
+        return [row[0] for row in rows]
+
+    def delete(self, task_id: str) -> bool:
+        with self._write() as conn:
+            seq = self._seq_for_key(conn, task_id)
+            if seq is None:
+                return False
+            conn.execute("DELETE FROM callback_keys WHERE key = ?", (task_id,))
+            conn.execute(
+                "DELETE FROM callbacks WHERE seq = ? AND NOT EXISTS (SELECT 1 FROM callback_keys WHERE seq = ?)",
+                (seq, seq)
+            )
+            return True
+
+    def clear(self) -> None:
+        with self._write() as conn:
+            conn.execute("DELETE FROM callbacks")
+            conn.execute("DELETE FROM request_tasks")
+
+    # ------------------------------------------------------------------
+    # Expiry
+    # ------------------------------------------------------------------
+    def sweep(self) -> int:
+        """
+        Drop every expired payload and request mapping
+
+        Returns:
+            Number of payloads dropped
+        """
+        now = time.time()
+        with self._write() as conn:
+            dropped = conn.execute(
+                "DELETE FROM callbacks WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (now,)
+            ).rowcount
+            if dropped:
+                self._bump(conn, "expirations", dropped)
+            if self.ttl is not None:
+                conn.execute("DELETE FROM request_tasks WHERE created_at <= ?", (now - self.ttl,))
+            if self.max_entries is not None:
+                conn.execute(
+                    "DELETE FROM request_tasks WHERE request_id IN ("
+                    "SELECT request_id FROM request_tasks ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        counters = dict(conn.execute("SELECT name, value FROM store_counters").fetchall())
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": counters.get("entries", 0),
+            "keys": len(self),
+            "resident_bytes": counters.get("resident_bytes", 0),
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0),
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes
+        }
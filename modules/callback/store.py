@@ -0,0 +1,699 @@
+import heapq
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Suno titles look like "Generated Music <first 8 chars of request task ID>"
+TITLE_MARKER = "Generated Music"
+SHORT_ID_LENGTH = 8
+
+
+def extract_task_ids(data: Any) -> List[str]:
+    """
+    Collect every task ID contained in a callback payload
+
+    Args:
+        data: Callback payload (Suno or fal format)
+
+    Returns:
+        List of task IDs (taskId / task_id fields and IDs embedded in titles)
+    """
+    task_ids = []
+
+    def collect(obj):
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                if k in ["task_id", "taskId"] and isinstance(v, str) and v not in task_ids:
+                    task_ids.append(v)
+                # Extract task ID from title field
+                if k == "title" and isinstance(v, str) and TITLE_MARKER in v:
+                    title_task_id = v.split(TITLE_MARKER)[-1].strip()
+                    if title_task_id and title_task_id not in task_ids:
+                        task_ids.append(title_task_id)
+                collect(v)
+        elif isinstance(obj, list):
+            for item in obj:
+                collect(item)
+
+    collect(data)
+    return task_ids
+
+
+def extract_audio_ids(data: Any) -> List[str]:
+    """
+    Collect audio IDs from a Suno music callback (data.data[*].id)
+
+    Args:
+        data: Callback payload
+
+    Returns:
+        List of audio IDs in payload order
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("data"), dict):
+        return []
+    items = data["data"].get("data")
+    if not isinstance(items, list):
+        return []
+    return [item["id"] for item in items if isinstance(item, dict) and isinstance(item.get("id"), str)]
+
+
+def is_mp4_callback(data: Any) -> bool:
+    """
+    Check whether a callback payload is an MP4 generation callback
+
+    Args:
+        data: Callback payload
+
+    Returns:
+        True if the payload carries a video URL
+    """
+    if not isinstance(data, dict):
+        return False
+
+    # MP4 callback feature: video_url key exists
+    inner = data.get("data")
+    if isinstance(inner, dict) and ("video_url" in inner or "stream_video_url" in inner):
+        return True
+
+    # Check for video-related string in top-level values
+    for v in data.values():
+        if isinstance(v, str) and (".mp4" in v.lower() or "video" in v.lower()):
+            return True
+    return False
+
+
+def estimate_size(data: Any) -> int:
+    """
+    Estimate the resident size of a callback payload
+
+    Args:
+        data: Callback payload
+
+    Returns:
+        Size of the payload serialized as UTF-8 JSON (bytes)
+    """
+    try:
+        return len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(data).encode("utf-8"))
+
+
+class _Entry:
+    __slots__ = ("seq", "info", "keys", "audio_ids", "mp4", "mp4_request", "size", "expires_at")
+
+    def __init__(self, seq, info):
+        self.seq = seq
+        self.info = info
+        self.keys = set()
+        self.audio_ids = []
+        self.mp4 = False
+        self.mp4_request = None
+        self.size = 0
+        self.expires_at = None
+
+
+class CallbackBackend:
+    """
+    Interface of callback / task state backends
+
+    CallbackStore keeps state in this process's memory. SQLiteCallbackStore
+    (modules.callback.sqlite_store) keeps it in a database file that several
+    worker processes can share. Backends that other processes write to set
+    shared = True so waiters know they must poll instead of relying only on
+    in-process notifications.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
+
+    def add(self, data: Any, ttl: Optional[float] = None) -> List[str]:
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def __contains__(self, task_id):
+        return self.get(task_id) is not None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def find(self, task_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def find_by_audio_id(self, audio_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def first_audio_id(self, task_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def find_mp4(self, mp4_task_id: str, since: int = 0, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def first_since(self, timestamp: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    @property
+    def sequence(self) -> int:
+        raise NotImplementedError
+
+    def keys(self) -> List[str]:
+        raise NotImplementedError
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self.items())
+
+    def link_request(self, request_id: str, task_id: str) -> None:
+        raise NotImplementedError
+
+    def task_for_request(self, request_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def find_by_request(self, request_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Find callback info for a client request ID
+
+        Args:
+            request_id: Client request ID
+
+        Returns:
+            Tuple of (matched key, callback info), or (None, None)
+        """
+        task_id = self.task_for_request(request_id)
+        if not task_id:
+            return None, None
+        return self.find(task_id)
+
+    def remove_mp4_requests(self, task_id: str, audio_id: str) -> List[str]:
+        raise NotImplementedError
+
+    def delete(self, task_id: str) -> bool:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def start_sweeper(self, interval: float = 60) -> None:
+        """
+        Start a daemon thread that calls sweep() periodically
+
+        Args:
+            interval: Sweep interval (seconds)
+        """
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._sweeper_stop.clear()
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                try:
+                    dropped = self.sweep()
+                    if dropped:
+                        print(f"Callback store sweeper dropped {dropped} expired callbacks")
+                except Exception as e:
+                    print(f"Callback store sweeper error: {str(e)}")
+
+        self._sweeper = threading.Thread(target=run, name="callback-store-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._sweeper_stop.set()
+
+
+class CallbackStore(CallbackBackend):
+    """
+    Thread-safe in-memory store for callback payloads (single-process backend)
+
+    Each payload is stored once and reachable under every task ID found in it.
+    Secondary indexes (short title IDs, audio IDs, request IDs, MP4 task IDs)
+    are built at ingest time so that every lookup is O(1).
+
+    Memory is bounded by an optional per-entry TTL, a maximum number of
+    payloads and a byte budget. When a limit is exceeded the least recently
+    used payloads are evicted; expired payloads are dropped on access and by
+    the background sweeper (start_sweeper()).
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            ttl: Default time to live of a payload (seconds, None for no expiry)
+            max_entries: Maximum number of stored payloads (None for unlimited)
+            max_bytes: Maximum estimated size of stored payloads (None for unlimited)
+        """
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._seq = 0
+        # task ID -> entry
+        self._keys: Dict[str, _Entry] = {}
+        # seq -> entry (insertion order)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # seq -> entry (least recently used first)
+        self._lru: "OrderedDict[int, _Entry]" = OrderedDict()
+        # (expires_at, seq) min-heap, stale items are skipped lazily
+        self._expiry_heap: List[Tuple[float, int]] = []
+        self._resident_bytes = 0
+        self._evictions = 0
+        self._expirations = 0
+        # first SHORT_ID_LENGTH chars of a key -> keys sharing that prefix
+        self._prefix_index: Dict[str, set] = {}
+        self._audio_index: Dict[str, _Entry] = {}
+        self._mp4_index: Dict[str, _Entry] = {}
+        # seq -> entry of MP4 payloads only (insertion order), for the find_mp4() fallback
+        self._mp4_entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # (original task ID, audio ID) -> entry, for payloads carrying mp4_request_time
+        self._mp4_request_index: Dict[Tuple[str, str], _Entry] = {}
+        # request ID -> task ID (oldest first, capped at max_entries)
+        self._requests: "OrderedDict[str, str]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # Ingest
+    # ------------------------------------------------------------------
+    def add(self, data: Any, ttl: Optional[float] = None) -> List[str]:
+        """
+        Store a callback payload and index it
+
+        Args:
+            data: Callback payload
+            ttl: Time to live of this payload (seconds, default: store TTL)
+
+        Returns:
+            List of task IDs the payload was stored under
+        """
+        task_ids = extract_task_ids(data)
+        if not task_ids:
+            print(f"Warning: No task_id found in callback data")
+            # Generate temporary ID
+            task_id = str(uuid.uuid4())
+            task_ids.append(task_id)
+            print(f"Generated temporary task_id: {task_id}")
+
+        info = {
+            "data": data,
+            "timestamp": datetime.now().isoformat()
+        }
+        size = estimate_size(data)
+
+        with self._lock:
+            self._seq += 1
+            info["seq"] = self._seq
+            entry = _Entry(self._seq, info)
+            entry.size = size
+            ttl = self.ttl if ttl is None else ttl
+            if ttl is not None:
+                entry.expires_at = time.monotonic() + ttl
+                heapq.heappush(self._expiry_heap, (entry.expires_at, entry.seq))
+            entry.audio_ids = extract_audio_ids(data)
+            entry.mp4 = is_mp4_callback(data)
+            if isinstance(data, dict) and "mp4_request_time" in data:
+                entry.mp4_request = (data.get("original_task_id"), data.get("audio_id"))
+
+            self._entries[entry.seq] = entry
+            self._lru[entry.seq] = entry
+            self._resident_bytes += entry.size
+            for task_id in task_ids:
+                self._bind(task_id, entry)
+            for audio_id in entry.audio_ids:
+                self._audio_index[audio_id] = entry
+            if entry.mp4:
+                self._mp4_entries[entry.seq] = entry
+                for task_id in task_ids:
+                    self._mp4_index[task_id] = entry
+            if entry.mp4_request:
+                self._mp4_request_index[entry.mp4_request] = entry
+
+            self._enforce_limits(entry)
+
+        return task_ids
+
+    def _enforce_limits(self, newest):
+        """Evict least recently used payloads until the store is within its limits"""
+        while len(self._lru) > 1:
+            over_entries = self.max_entries is not None and len(self._lru) > self.max_entries
+            over_bytes = self.max_bytes is not None and self._resident_bytes > self.max_bytes
+            if not over_entries and not over_bytes:
+                break
+            victim = next(iter(self._lru.values()))
+            if victim is newest:
+                # Never evict the payload that was just stored
+                break
+            self._drop(victim)
+            self._evictions += 1
+
+    def _bind(self, key, entry):
+        previous = self._keys.get(key)
+        if previous is not None and previous is not entry:
+            self._unbind(key)
+            if not previous.keys:
+                self._drop(previous)
+        self._keys[key] = entry
+        entry.keys.add(key)
+        self._prefix_index.setdefault(key[:SHORT_ID_LENGTH], set()).add(key)
+
+    def _unbind(self, key):
+        entry = self._keys.pop(key, None)
+        if entry is None:
+            return None
+        entry.keys.discard(key)
+        prefix = key[:SHORT_ID_LENGTH]
+        bucket = self._prefix_index.get(prefix)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._prefix_index[prefix]
+        if self._mp4_index.get(key) is entry:
+            del self._mp4_index[key]
+        return entry
+
+    def _drop(self, entry):
+        """Remove an entry and every index pointing at it"""
+        for key in list(entry.keys):
+            self._unbind(key)
+        if self._entries.pop(entry.seq, None) is not None:
+            self._resident_bytes -= entry.size
+        self._lru.pop(entry.seq, None)
+        self._mp4_entries.pop(entry.seq, None)
+        for audio_id in entry.audio_ids:
+            if self._audio_index.get(audio_id) is entry:
+                del self._audio_index[audio_id]
+        if entry.mp4_request and self._mp4_request_index.get(entry.mp4_request) is entry:
+            del self._mp4_request_index[entry.mp4_request]
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def _live(self, entry):
+        """Return the entry if it has not expired (marking it recently used), else None"""
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._drop(entry)
+            self._expirations += 1
+            return None
+        self._lru.move_to_end(entry.seq)
+        return entry
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get callback info stored under an exact task ID
+
+        Args:
+            task_id: Task ID
+
+        Returns:
+            Callback info ({"data", "timestamp"}) or None
+        """
+        with self._lock:
+            entry = self._live(self._keys.get(task_id))
+            return entry.info if entry else None
+
+    def __contains__(self, task_id):
+        with self._lock:
+            return self._live(self._keys.get(task_id)) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+    def find(self, task_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Find callback info for a task ID, allowing short title IDs
+
+        Exact matches win. Otherwise a key that contains or is contained in
+        the task ID and shares its first SHORT_ID_LENGTH characters matches
+        (the "Generated Music <id>" title form).
+
+        Args:
+            task_id: Task ID
+
+        Returns:
+            Tuple of (matched key, callback info), or (None, None)
+        """
+        if not task_id:
+            return None, None
+        with self._lock:
+            entry = self._live(self._keys.get(task_id))
+            if entry is not None:
+                return task_id, entry.info
+            for key in list(self._prefix_index.get(task_id[:SHORT_ID_LENGTH], ())):
+                if task_id in key or key in task_id:
+                    entry = self._live(self._keys.get(key))
+                    if entry is not None:
+                        return key, entry.info
+        return None, None
+
+    def find_by_audio_id(self, audio_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the music callback containing an audio ID
+
+        Args:
+            audio_id: Audio ID
+
+        Returns:
+            Callback info or None
+        """
+        with self._lock:
+            entry = self._live(self._audio_index.get(audio_id))
+            return entry.info if entry else None
+
+    def first_audio_id(self, task_id: str) -> Optional[str]:
+        """
+        Get the first audio ID of a task's music callback
+
+        Args:
+            task_id: Task ID
+
+        Returns:
+            Audio ID or None
+        """
+        with self._lock:
+            entry = self._live(self._keys.get(task_id))
+            if entry and entry.audio_ids:
+                return entry.audio_ids[0]
+        return None
+
+    def find_mp4(self, mp4_task_id: str, since: int = 0, exclude: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find an MP4 callback
+
+        Looks up the MP4 task ID first, then falls back to the most recent
+        MP4 callback stored after the given sequence number.
+
+        Args:
+            mp4_task_id: MP4 generation task ID
+            since: Only consider fallback callbacks stored after this sequence number
+            exclude: Key whose callback should never be returned by the fallback
+
+        Returns:
+            Callback info or None
+        """
+        with self._lock:
+            entry = self._live(self._mp4_index.get(mp4_task_id)) if mp4_task_id else None
+            if entry is not None:
+                return entry.info
+            # Newest MP4 payloads first; only those stored after `since` are visited
+            expired = []
+            found = None
+            now = time.monotonic()
+            for seq, entry in reversed(self._mp4_entries.items()):
+                if seq <= since:
+                    break
+                if exclude and exclude in entry.keys:
+                    continue
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    expired.append(entry)
+                    continue
+                found = entry
+                break
+            for entry in expired:
+                self._drop(entry)
+                self._expirations += 1
+            if found is not None:
+                self._lru.move_to_end(found.seq)
+                return found.info
+        return None
+
+    def first_since(self, timestamp: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Get the oldest callback stored after a point in time
+
+        Args:
+            timestamp: ISO format timestamp
+
+        Returns:
+            Tuple of (key, callback info), or (None, None)
+        """
+        with self._lock:
+            found = None
+            for seq in reversed(self._entries):
+                entry = self._entries[seq]
+                if entry.info.get("timestamp", "") <= timestamp:
+                    break
+                found = entry
+            if found is not None and found.keys:
+                return next(iter(found.keys)), found.info
+        return None, None
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the most recently stored callback"""
+        with self._lock:
+            return self._seq
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._keys)
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return [(key, entry.info) for key, entry in self._keys.items()]
+
+
+    # ------------------------------------------------------------------
+    # Request ID mapping
+    # ------------------------------------------------------------------
+    def link_request(self, request_id: str, task_id: str) -> None:
+        """
+        Store request ID and task ID mapping
+
+        Args:
+            request_id: Client request ID
+            task_id: Task ID returned by the upstream API
+        """
+        with self._lock:
+            self._requests[request_id] = task_id
+            self._requests.move_to_end(request_id)
+            if self.max_entries is not None:
+                while len(self._requests) > self.max_entries:
+                    self._requests.popitem(last=False)
+
+    def task_for_request(self, request_id: str) -> Optional[str]:
+        with self._lock:
+            return self._requests.get(request_id)
+
+    # ------------------------------------------------------------------
+    # Removal
+    # ------------------------------------------------------------------
+    def remove_mp4_requests(self, task_id: str, audio_id: str) -> List[str]:
+        """
+        Remove stored MP4 request callbacks for a task / audio pair
+
+        Args:
+            task_id: Original music task ID
+            audio_id: Audio ID
+
+        Returns:
+            List of removed keys
+        """
+        with self._lock:
+            entry = self._mp4_request_index.get((task_id, audio_id))
+            if entry is None:
+                return []
+            keys = list(entry.keys)
+            self._drop(entry)
+            return keys
+
+    def delete(self, task_id: str) -> bool:
+        with self._lock:
+            entry = self._unbind(task_id)
+            if entry is None:
+                return False
+            if not entry.keys:
+                self._drop(entry)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._entries.clear()
+            self._lru.clear()
+            self._expiry_heap.clear()
+            self._resident_bytes = 0
+            self._prefix_index.clear()
+            self._audio_index.clear()
+            self._mp4_index.clear()
+            self._mp4_entries.clear()
+            self._mp4_request_index.clear()
+            self._requests.clear()
+
+    # ------------------------------------------------------------------
+    # Expiry
+    # ------------------------------------------------------------------
+    def sweep(self) -> int:
+        """
+        Drop every expired payload
+
+        Returns:
+            Number of payloads dropped
+        """
+        dropped = 0
+        with self._lock:
+            now = time.monotonic()
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, seq = heapq.heappop(self._expiry_heap)
+                entry = self._entries.get(seq)
+                if entry is not None and entry.expires_at == expires_at:
+                    self._drop(entry)
+                    self._expirations += 1
+                    dropped += 1
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get store counters for sizing nodes
+
+        Returns:
+            Dictionary of entry count, key count, resident bytes, evictions and expirations
+        """
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "keys": len(self._keys),
+                "resident_bytes": self._resident_bytes,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes
+            }
+
+
+def create_callback_store(backend: Optional[str] = None, path: Optional[str] = None, **limits) -> CallbackBackend:
+    """
+    Create the callback / task state backend
+
+    Args:
+        backend: "memory" (single process) or "sqlite" (shared by worker processes)
+        path: Database file path for the sqlite backend
+        **limits: ttl, max_entries and max_bytes
+
+    Returns:
+        Callback backend instance
+    """
+    backend = (backend or "memory").lower()
+    if backend == "memory":
+        return CallbackStore(**limits)
+    if backend == "sqlite":
+        from modules.callback.sqlite_store import SQLiteCallbackStore
+        return SQLiteCallbackStore(path or "callbacks.db", **limits)
+    raise ValueError(f"Unknown callback store backend: {backend}")
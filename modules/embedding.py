@@ -0,0 +1,110 @@
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# BERT model used for genre search (milvus_create.py; the collection was built from its [CLS] vectors)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "bert-base-uncased")
+EMBEDDING_DIM = 768
+# Sentence-embedding model used for prompt similarity (semantic prompt cache):
+# trained for cosine similarity of mean-pooled vectors, unlike raw BERT [CLS]
+PROMPT_EMBEDDING_MODEL = os.getenv("PROMPT_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# model name -> (tokenizer, model)
+_models = {}
+_load_lock = threading.Lock()
+# Inference on one shared model is serialized (torch modules are not re-entrant across threads)
+_infer_lock = threading.Lock()
+
+
+def load_model(name=EMBEDDING_MODEL):
+    """
+    Function to load a tokenizer and model (once per process)
+
+    torch and transformers are only imported here, so importing this module
+    is cheap and callers can treat an ImportError as "embeddings unavailable".
+
+    Args:
+        name: Hugging Face model name
+
+    Returns:
+        Tuple of tokenizer and model
+    """
+    if name not in _models:
+        with _load_lock:
+            if name not in _models:
+                from transformers import AutoTokenizer, AutoModel
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                model = AutoModel.from_pretrained(name)
+                model.eval()
+                _models[name] = (tokenizer, model)
+    return _models[name]
+
+
+def model_loaded(name=EMBEDDING_MODEL):
+    """
+    Function to check whether a model is already loaded in this process
+
+    Args:
+        name: Hugging Face model name
+
+    Returns:
+        True if load_model(name) returns without loading
+    """
+    return name in _models
+
+
+def _normalize(vec):
+    norm = np.linalg.norm(vec)
+    return (vec / norm).tolist() if norm > 0 else vec.tolist()
+
+
+def get_embedding(text):
+    """
+    Function to encode text as a normalized BERT [CLS] vector
+
+    Args:
+        text: Text to encode
+
+    Returns:
+        List of EMBEDDING_DIM floats (unit length, so inner product is cosine similarity)
+    """
+    import torch
+
+    if not text:
+        text = ""
+    tokenizer, model = load_model(EMBEDDING_MODEL)
+    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
+    with _infer_lock, torch.no_grad():
+        outputs = model(**inputs)
+    # Get the [CLS] token vector and normalize (for cosine similarity comparison)
+    cls_vector = outputs.last_hidden_state[:, 0, :]
+    return _normalize(cls_vector.squeeze().numpy())
+
+
+def get_prompt_embedding(text):
+    """
+    Function to encode a prompt as a normalized mean-pooled sentence embedding
+
+    Args:
+        text: Text to encode
+
+    Returns:
+        List of floats (unit length, so inner product is cosine similarity)
+    """
+    import torch
+
+    if not text:
+        text = ""
+    tokenizer, model = load_model(PROMPT_EMBEDDING_MODEL)
+    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=256)
+    with _infer_lock, torch.no_grad():
+        outputs = model(**inputs)
+    # Mean of the token vectors (padding excluded)
+    mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+    mean_vector = (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+    return _normalize(mean_vector.squeeze(0).numpy())
@@ -0,0 +1,317 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from flask import Response, jsonify, make_response, request
+
+from modules.music.singleflight import Flight
+
+# Load environment variables
+load_dotenv()
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000))
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", 64 * 1024 * 1024))
+
+# Responses the client is expected to retry are not stored
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+# Claim outcomes
+REPLAY = "replay"
+WAIT = "wait"
+LEAD = "lead"
+CONFLICT = "conflict"
+
+
+class _Record:
+    __slots__ = ("fingerprint", "expires_at", "status", "body", "mimetype", "flight")
+
+    def __init__(self, fingerprint, expires_at, flight):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.flight = flight
+        self.status = None
+        self.body = None
+        self.mimetype = None
+
+
+class IdempotencyStore:
+    """
+    Bounded store of responses keyed by (endpoint, idempotency key)
+
+    A request carrying a key that was already answered gets the stored
+    response back; one arriving while the first is still running waits for
+    it. Keys expire after ttl seconds, and the store is bounded by entry
+    count and total response bytes (oldest dropped first). Server errors
+    (5xx), 408/425/429 and waits that timed out (see timed_out_body) are not
+    stored so that the client can retry them; requests waiting on the
+    leader still get its response.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, max_bytes: int = IDEMPOTENCY_MAX_BYTES):
+        """
+        Args:
+            ttl: Key lifetime (seconds)
+            max_entries: Maximum number of keys kept
+            max_bytes: Maximum total size of stored response bodies
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[Tuple[str, str], _Record]" = OrderedDict()
+        self._resident_bytes = 0
+        self._replays = 0
+        self._attached = 0
+        self._conflicts = 0
+        self._executions = 0
+
+    def _drop(self, scoped_key):
+        record = self._records.pop(scoped_key, None)
+        if record is not None and record.body is not None:
+            self._resident_bytes -= len(record.body)
+
+    def _enforce_limits(self):
+        now = time.monotonic()
+        # Records are kept in creation order, so expired ones are at the front
+        for scoped_key, record in list(self._records.items()):
+            if record.expires_at > now:
+                break
+            if record.flight is None:
+                self._drop(scoped_key)
+        for scoped_key, record in list(self._records.items()):
+            if len(self._records) <= self.max_entries and self._resident_bytes <= self.max_bytes:
+                break
+            if record.flight is None:
+                self._drop(scoped_key)
+
+    def claim(self, scope: str, key: str, fingerprint: str) -> Tuple[str, Any]:
+        """
+        Claim an idempotency key for a request
+
+        Args:
+            scope: Endpoint the key belongs to
+            key: Idempotency key sent by the client
+            fingerprint: Hash of the request body
+
+        Returns:
+            (REPLAY, record), (WAIT, flight), (LEAD, flight) or (CONFLICT, None)
+        """
+        scoped_key = (scope, key)
+        with self._lock:
+            record = self._records.get(scoped_key)
+            if record is not None and record.flight is None and record.expires_at <= time.monotonic():
+                self._drop(scoped_key)
+                record = None
+            if record is not None:
+                if record.fingerprint != fingerprint:
+                    self._conflicts += 1
+                    return CONFLICT, None
+                if record.flight is not None:
+                    self._attached += 1
+                    return WAIT, record.flight
+                self._replays += 1
+                return REPLAY, record
+            flight = Flight()
+            self._records[scoped_key] = _Record(fingerprint, time.monotonic() + self.ttl, flight)
+            self._executions += 1
+            self._enforce_limits()
+            return LEAD, flight
+
+    def complete(self, scope: str, key: str, flight: Flight, response: Optional[Response]) -> None:
+        """
+        Store the response of a leading request and release its waiters
+
+        Args:
+            scope: Endpoint the key belongs to
+            key: Idempotency key
+            flight: Flight returned by claim()
+            response: Response to store (None if the view raised)
+        """
+        scoped_key = (scope, key)
+        record = None
+        with self._lock:
+            current = self._records.get(scoped_key)
+            storable = (
+                response is not None
+                and response.status_code < 500
+                and response.status_code not in RETRYABLE_STATUS_CODES
+                and not response.is_streamed
+                and current is not None
+                and current.flight is flight
+                and not timed_out_body(response)
+            )
+            if storable:
+                body = response.get_data()
+                if len(body) <= self.max_bytes:
+                    current.status = response.status_code
+                    current.body = body
+                    current.mimetype = response.mimetype
+                    current.flight = None
+                    self._resident_bytes += len(body)
+                    record = current
+                    self._enforce_limits()
+            if record is None and current is not None and current.flight is flight:
+                # Not storable: forget the key so the next attempt runs again
+                del self._records[scoped_key]
+        if record is None and response is not None and not response.is_streamed:
+            # Requests that attached while the leader ran get its response all the same
+            record = _Record(None, 0.0, None)
+            record.status = response.status_code
+            record.body = response.get_data()
+            record.mimetype = response.mimetype
+        flight.finish(record)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._records),
+                "in_flight": sum(1 for record in self._records.values() if record.flight is not None),
+                "resident_bytes": self._resident_bytes,
+                "replays": self._replays,
+                "attached": self._attached,
+                "conflicts": self._conflicts,
+                "executions": self._executions,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes
+            }
+
+
+def timed_out_body(response: Response) -> bool:
+    """
+    Whether a JSON response reports a wait that timed out
+
+    Some endpoints answer 200 with the outcome in the body: a "code" that is
+    a server error or retryable status (the MP4 endpoints' 408), "status":
+    "timeout" (top level or under "data"), or "timed_out": true (the
+    with-callback endpoints). "processing" / "pending" replies that hand out
+    a task ID are the normal answer of a submission and are stored.
+
+    Args:
+        response: View response
+
+    Returns:
+        True if the response must not be replayed as final
+    """
+    if not response.is_json:
+        return False
+    try:
+        data = json.loads(response.get_data())
+    except ValueError:
+        return False
+    if not isinstance(data, dict):
+        return False
+    code = data.get("code")
+    if isinstance(code, int) and (code >= 500 or code in RETRYABLE_STATUS_CODES):
+        return True
+    if data.get("timed_out") is True:
+        return True
+    nested = data.get("data")
+    statuses = [data.get("status"), nested.get("status") if isinstance(nested, dict) else None]
+    return any(isinstance(status, str) and status.lower() == "timeout" for status in statuses)
+
+
+def request_idempotency_key() -> Optional[str]:
+    """
+    Get the idempotency key of the current request
+
+    Taken from the Idempotency-Key header, or the idempotency_key / request_id
+    field of the JSON body.
+
+    Returns:
+        Idempotency key, or None if the request has none
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key:
+        return key
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        key = data.get("idempotency_key") or data.get("request_id")
+        if key:
+            return str(key)
+    return None
+
+
+def _replay(record: _Record) -> Response:
+    response = Response(record.body, status=record.status, mimetype=record.mimetype)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _conflict(key: str):
+    return jsonify({
+        "error": "Idempotency key reused with a different request body",
+        "idempotency_key": key
+    }), 422
+
+
+def idempotent(store: IdempotencyStore):
+    """
+    Decorator making a POST view idempotent (sync and async views)
+
+    Requests without an idempotency key are passed through unchanged.
+
+    Args:
+        store: Idempotency store shared by the decorated views
+    """
+    def decorator(view):
+        def begin():
+            key = request_idempotency_key()
+            if not key:
+                return None, None, None
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            outcome, value = store.claim(request.path, key, fingerprint)
+            return key, outcome, value
+
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                key, outcome, value = begin()
+                if key is None:
+                    return await view(*args, **kwargs)
+                if outcome == CONFLICT:
+                    return _conflict(key)
+                if outcome == REPLAY:
+                    return _replay(value)
+                if outcome == WAIT:
+                    record = await value.wait_async()
+                    # The first attempt raised (no response to share): run it ourselves
+                    return _replay(record) if record is not None else await view(*args, **kwargs)
+                response = None
+                try:
+                    response = make_response(await view(*args, **kwargs))
+                    return response
+                finally:
+                    store.complete(request.path, key, value, response)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key, outcome, value = begin()
+            if key is None:
+                return view(*args, **kwargs)
+            if outcome == CONFLICT:
+                return _conflict(key)
+            if outcome == REPLAY:
+                return _replay(value)
+            if outcome == WAIT:
+                record = value.wait()
+                # The first attempt raised (no response to share): run it ourselves
+                return _replay(record) if record is not None else view(*args, **kwargs)
+            response = None
+            try:
+                response = make_response(view(*args, **kwargs))
+                return response
+            finally:
+                store.complete(request.path, key, value, response)
+        return wrapper
+    return decorator
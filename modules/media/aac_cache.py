@@ -0,0 +1,291 @@
+import errno
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import ffmpeg
+from dotenv import load_dotenv
+
+from modules.media.etag import file_etag
+from modules.music.singleflight import Flight
+from modules.paths import OUTPUT_DIR
+
+# Load environment variables
+load_dotenv()
+
+AAC_CACHE_ENABLED = os.getenv("AAC_CACHE_ENABLED", "true").lower() == "true"
+AAC_CACHE_DIR = os.getenv("AAC_CACHE_DIR", os.path.join(OUTPUT_DIR, "aac_cache"))
+AAC_CACHE_MAX_BYTES = int(os.getenv("AAC_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+AAC_BITRATE = os.getenv("AAC_BITRATE", "192k")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_accessed_at ON tracks(accessed_at);
+
+CREATE TABLE IF NOT EXISTS track_urls (
+    url TEXT PRIMARY KEY,
+    name TEXT NOT NULL REFERENCES tracks(name) ON DELETE CASCADE
+);
+"""
+
+# Lookups refresh accessed_at at most this often (seconds)
+ACCESS_RESOLUTION = 60.0
+
+
+class AACCache:
+    """
+    On-disk cache of audio tracks transcoded to AAC
+
+    Each source track is encoded once per content (sha256) and bitrate into
+    an .m4a file; merges then copy the AAC stream instead of re-encoding it.
+    Source URLs are mapped to their encoded track, so a known URL needs no
+    download at all. Files are evicted least recently used first under
+    max_bytes; the index is SQLite (WAL), shared by worker and merge
+    processes. Merges use checkout() copies, so evicting a track never
+    breaks a merge that is reading it.
+    """
+
+    def __init__(self, root: str = AAC_CACHE_DIR, max_bytes: int = AAC_CACHE_MAX_BYTES, bitrate: str = AAC_BITRATE):
+        """
+        Args:
+            root: Cache directory
+            max_bytes: Disk budget of encoded tracks
+            bitrate: AAC bitrate ("192k")
+        """
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.bitrate = bitrate
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self._hits = 0
+        self._encodes = 0
+        self._evictions = 0
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def path_for_name(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def _touch(self, name):
+        """Path of an indexed track, or None if its file is gone"""
+        path = self.path_for_name(name)
+        conn = self._connection()
+        if not os.path.exists(path):
+            conn.execute("DELETE FROM tracks WHERE name = ?", (name,))
+            return None
+        row = conn.execute("SELECT accessed_at FROM tracks WHERE name = ?", (name,)).fetchone()
+        now = time.time()
+        if row is not None and now - row[0] >= ACCESS_RESOLUTION:
+            conn.execute("UPDATE tracks SET accessed_at = ? WHERE name = ?", (now, name))
+        return path
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """
+        Get the encoded track of a source URL without downloading it
+
+        Args:
+            url: Source audio URL
+
+        Returns:
+            Path of the .m4a file or None
+        """
+        row = self._connection().execute(
+            "SELECT name FROM track_urls WHERE url = ?", (url,)
+        ).fetchone()
+        path = self._touch(row[0]) if row else None
+        if path is not None:
+            with self._lock:
+                self._hits += 1
+        return path
+
+    def encode(self, source_path: str, url: Optional[str] = None) -> str:
+        """
+        Get the encoded track of a local audio file, transcoding it once
+
+        Args:
+            source_path: Source audio file
+            url: URL the file was downloaded from (remembered for lookup_url())
+
+        Returns:
+            Path of the .m4a file
+
+        Raises:
+            ffmpeg.Error: If the transcode failed
+        """
+        name = f"{file_etag(source_path)}-{self.bitrate}.m4a"
+        with self._lock:
+            flight = self._flights.get(name)
+            leader = flight is None
+            if leader:
+                flight = self._flights[name] = Flight()
+        if not leader:
+            path = flight.wait()
+            if path is None:
+                raise Exception(f"Encoding {source_path} to AAC failed")
+            self._map_url(url, name)
+            return path
+
+        path = None
+        try:
+            path = self._touch(name) if self._indexed(name) else None
+            if path is None:
+                path = self._encode(source_path, name)
+            else:
+                with self._lock:
+                    self._hits += 1
+            self._map_url(url, name)
+        finally:
+            with self._lock:
+                self._flights.pop(name, None)
+            flight.finish(path)
+        return path
+
+    def _indexed(self, name):
+        return self._connection().execute("SELECT 1 FROM tracks WHERE name = ?", (name,)).fetchone() is not None
+
+    def _map_url(self, url, name):
+        if url:
+            self._connection().execute("INSERT OR REPLACE INTO track_urls (url, name) VALUES (?, ?)", (url, name))
+
+    def _encode(self, source_path, name):
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.m4a")
+        started = time.time()
+        try:
+            (
+                ffmpeg
+                .input(source_path)
+                .output(tmp_path, vn=None, acodec="aac", audio_bitrate=self.bitrate, format="ipod")
+                .run(overwrite_output=True, quiet=True)
+            )
+            path = self.path_for_name(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Atomic: readers see either no track or the complete one
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._connection().execute(
+            "INSERT OR REPLACE INTO tracks (name, size, accessed_at) VALUES (?, ?, ?)",
+            (name, os.path.getsize(path), time.time())
+        )
+        with self._lock:
+            self._encodes += 1
+        print(f"Encoded {source_path} to AAC in {time.time() - started:.2f}s")
+        self.evict(keep=name)
+        return path
+
+    def checkout(self, path: str, dest_path: str) -> Optional[str]:
+        """
+        Give a merge its own reference to a cached track
+
+        The track is hard-linked to dest_path (copied when the job's scratch
+        directory is on another filesystem, e.g. tmpfs), so another
+        process's evict() removing the cache entry cannot pull the file
+        from under ffmpeg.
+
+        Args:
+            path: Track path from lookup_url() or encode()
+            dest_path: Path in the job's scratch directory
+
+        Returns:
+            dest_path, or None if the track was evicted in the meantime
+        """
+        try:
+            try:
+                os.link(path, dest_path)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copyfile(path, dest_path)
+        except FileNotFoundError:
+            return None
+        return dest_path
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Remove least recently used tracks until the cache fits max_bytes
+
+        Args:
+            keep: Track never evicted (the one just encoded)
+
+        Returns:
+            Number of tracks removed
+        """
+        conn = self._connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tracks").fetchone()[0]
+        removed = 0
+        if total <= self.max_bytes:
+            return 0
+        for name, size in conn.execute(
+            "SELECT name, size FROM tracks WHERE name != ? ORDER BY accessed_at",
+            (keep or "",)
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM tracks WHERE name = ?", (name,))
+            try:
+                os.remove(self.path_for_name(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        if removed:
+            with self._lock:
+                self._evictions += removed
+            print(f"AAC cache evicted {removed} tracks")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        tracks, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tracks").fetchone()
+        with self._lock:
+            return {
+                "tracks": tracks,
+                "resident_bytes": size,
+                "max_bytes": self.max_bytes,
+                "bitrate": self.bitrate,
+                "hits": self._hits,
+                "encodes": self._encodes,
+                "evictions": self._evictions
+            }
+
+
+_aac_cache: Optional[AACCache] = None
+_aac_cache_lock = threading.Lock()
+
+
+def get_aac_cache() -> AACCache:
+    """
+    Function to get the process-wide AAC track cache (created on first use)
+
+    Returns:
+        Shared AACCache
+    """
+    global _aac_cache
+    if _aac_cache is None:
+        with _aac_cache_lock:
+            if _aac_cache is None:
+                _aac_cache = AACCache()
+    return _aac_cache
@@ -0,0 +1,272 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from modules.media.etag import hash_file, remember_digest
+from modules.music.singleflight import Flight
+from modules.paths import OUTPUT_DIR
+
+# Load environment variables
+load_dotenv()
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(OUTPUT_DIR, "media_cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    name TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_objects_accessed_at ON objects(accessed_at);
+
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    name TEXT NOT NULL REFERENCES objects(name) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_urls_name ON urls(name);
+"""
+
+# Lookups refresh accessed_at at most this often (seconds)
+ACCESS_RESOLUTION = 60.0
+
+
+def normalize_url(url: str) -> str:
+    """Cache key of a URL (the fragment is never sent to the server)"""
+    return url.split("#", 1)[0].strip()
+
+
+def url_extension(url: str) -> str:
+    """File extension of a URL path (".mp4", ".wav", ... or "")"""
+    ext = os.path.splitext(normalize_url(url).split("?", 1)[0])[1].lower()
+    return ext if ext.isascii() and len(ext) <= 8 and ext[1:].isalnum() else ""
+
+
+class MediaCache:
+    """
+    Content-addressed on-disk cache of downloaded media
+
+    Objects are stored once per content hash as <sha256><ext> (so URLs
+    serving the same bytes share a file and names never collide); a SQLite
+    index (WAL, shared by worker processes) maps URLs to digests and keeps
+    the access time used for LRU eviction under max_bytes. Downloads go to
+    a temporary file that is renamed into place, so readers never see a
+    partial object, and concurrent requests for one URL in a process share
+    a single transfer.
+    """
+
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        """
+        Args:
+            root: Cache directory
+            max_bytes: Disk budget of cached objects
+        """
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def path_for_name(self, name: str) -> str:
+        """Path of a cached object from its file name (<sha256><ext>)"""
+        return os.path.join(self.root, name[:2], name)
+
+    def lookup(self, url: str) -> Optional[str]:
+        """
+        Get the cached file of a URL without downloading
+
+        Args:
+            url: Media URL
+
+        Returns:
+            Local path or None on a miss
+        """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT o.name, o.accessed_at FROM urls u JOIN objects o ON o.name = u.name WHERE u.url = ?",
+            (normalize_url(url),)
+        ).fetchone()
+        if row is None:
+            return None
+        name, accessed_at = row
+        path = self.path_for_name(name)
+        if not os.path.exists(path):
+            # Removed behind our back: forget it
+            conn.execute("DELETE FROM objects WHERE name = ?", (name,))
+            return None
+        now = time.time()
+        if now - accessed_at >= ACCESS_RESOLUTION:
+            conn.execute("UPDATE objects SET accessed_at = ? WHERE name = ?", (now, name))
+        return path
+
+    def fetch(self, url: str, download: Callable[[str, str], Any]) -> Optional[str]:
+        """
+        Get the cached file of a URL, downloading it once if needed
+
+        Args:
+            url: Media URL
+            download: Function writing the URL's content to a given path (raises on failure)
+
+        Returns:
+            Local path of the cached object, or None if the download failed
+        """
+        key = normalize_url(url)
+        path = self.lookup(key)
+        if path is not None:
+            with self._lock:
+                self._hits += 1
+            print(f"Media cache hit: {url}")
+            return path
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self._misses += 1
+            else:
+                self._coalesced += 1
+        if not leader:
+            return flight.wait()
+
+        path = None
+        try:
+            # Another flight may have finished between the lookup and our claim
+            path = self.lookup(key) or self._download(key, download)
+        except Exception as e:
+            print(f"Error downloading {url} into media cache: {str(e)}")
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.finish(path)
+        return path
+
+    def _download(self, url, download):
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+        try:
+            download(url, tmp_path)
+            digest = hash_file(tmp_path)
+            name = digest + url_extension(url)
+            path = self.path_for_name(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            size = os.path.getsize(tmp_path)
+            if os.path.exists(path):
+                # Same content already cached under another URL
+                os.remove(tmp_path)
+            else:
+                # Atomic: readers see either no object or the complete one
+                os.replace(tmp_path, path)
+            remember_digest(path, digest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO objects (name, digest, size, accessed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET accessed_at = excluded.accessed_at",
+                (name, digest, size, time.time())
+            )
+            conn.execute("INSERT OR REPLACE INTO urls (url, name) VALUES (?, ?)", (url, name))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.evict(keep=name)
+        return path
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Remove least recently used objects until the cache fits max_bytes
+
+        Args:
+            keep: Object name never evicted (the object just stored)
+
+        Returns:
+            Number of objects removed
+        """
+        conn = self._connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        removed = 0
+        if total <= self.max_bytes:
+            return 0
+        for name, size in conn.execute(
+            "SELECT name, size FROM objects WHERE name != ? ORDER BY accessed_at",
+            (keep or "",)
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM objects WHERE name = ?", (name,))
+            try:
+                os.remove(self.path_for_name(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        if removed:
+            with self._lock:
+                self._evictions += removed
+            print(f"Media cache evicted {removed} objects")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        objects, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+        urls = conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        with self._lock:
+            return {
+                "objects": objects,
+                "urls": urls,
+                "resident_bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions
+            }
+
+
+_media_cache: Optional[MediaCache] = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaCache:
+    """
+    Function to get the process-wide media cache (created on first use)
+
+    Returns:
+        Shared MediaCache
+    """
+    global _media_cache
+    if _media_cache is None:
+        with _media_cache_lock:
+            if _media_cache is None:
+                _media_cache = MediaCache()
+    return _media_cache
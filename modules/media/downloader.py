@@ -0,0 +1,141 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from dotenv import load_dotenv
+
+from modules.music.session import get_download_session, get_timeout, DOWNLOAD_READ_TIMEOUT
+
+# Load environment variables
+load_dotenv()
+
+# Number of parallel ranges per download
+DOWNLOAD_PARTS = int(os.getenv("DOWNLOAD_PARTS", 4))
+# Objects smaller than this are fetched in a single stream (bytes)
+PARALLEL_MIN_SIZE = int(os.getenv("DOWNLOAD_PARALLEL_MIN_SIZE", 8 * 1024 * 1024))
+# Read size of streamed responses (large reads keep syscall and Python overhead low)
+DOWNLOAD_BUFFER_SIZE = int(os.getenv("DOWNLOAD_BUFFER_SIZE", 1024 * 1024))
+
+CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class RangeNotSatisfied(Exception):
+    """The server ignored or rejected a range request"""
+
+
+def _write_stream(response: requests.Response, f, expected: Optional[int] = None, limit: Optional[int] = None) -> int:
+    written = 0
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+        if limit is not None and written + len(chunk) > limit:
+            chunk = chunk[:limit - written]
+        if chunk:
+            f.write(chunk)
+            written += len(chunk)
+        if limit is not None and written >= limit:
+            break
+    if expected is not None and written != expected:
+        raise Exception(f"Incomplete download: {written} of {expected} bytes")
+    return written
+
+
+def _fetch_range(url: str, dest_path: str, start: int, end: int, validator: Optional[str], timeout) -> int:
+    headers = {"Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"}
+    if validator:
+        # Fail (200 instead of 206) rather than mix two versions of the object
+        headers["If-Range"] = validator
+    with get_download_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code != 206:
+            raise RangeNotSatisfied(f"Range {start}-{end} answered with {response.status_code}")
+        match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+        if not match or int(match.group(1)) != start or int(match.group(2)) != end:
+            raise RangeNotSatisfied(f"Unexpected Content-Range: {response.headers.get('Content-Range')}")
+        with open(dest_path, "r+b") as f:
+            f.seek(start)
+            return _write_stream(response, f, end - start + 1)
+
+
+def download_to_file(url: str, dest_path: str, parts: int = DOWNLOAD_PARTS, min_parallel_size: int = PARALLEL_MIN_SIZE) -> int:
+    """
+    Download a URL into a file, in parallel ranges when the server supports them
+
+    The first request asks for the open-ended range "bytes=0-": its
+    Content-Range gives the total size, and the response itself is the
+    download. Small objects (and servers that ignore ranges) are simply
+    streamed from it; for large objects it supplies the first part while
+    the remaining `parts - 1` ranges are fetched concurrently and written
+    at their offsets into a preallocated file.
+
+    Args:
+        url: URL to download
+        dest_path: File to write (overwritten)
+        parts: Number of parallel ranges
+        min_parallel_size: Objects smaller than this are not split (bytes)
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        Exception: If the download failed
+    """
+    timeout = get_timeout(DOWNLOAD_READ_TIMEOUT)
+    # identity: range offsets must refer to the bytes written to the file
+    response = get_download_session().get(url, headers={"Range": "bytes=0-", "Accept-Encoding": "identity"}, stream=True, timeout=timeout)
+    with response:
+        if response.status_code not in (200, 206):
+            raise Exception(f"Download failed: {response.status_code} - {response.text[:500]}")
+        length = response.headers.get("Content-Length")
+        expected = int(length) if length and "Content-Encoding" not in response.headers else None
+        total = None
+        if response.status_code == 206:
+            match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            if not match or int(match.group(1)) != 0:
+                raise Exception(f"Unexpected Content-Range: {response.headers.get('Content-Range')}")
+            if match.group(3) != "*":
+                total = int(match.group(3))
+        if total is None or total < min_parallel_size or parts <= 1:
+            # Ranges not supported (200) or not worth it: this response is the whole object
+            with open(dest_path, "wb") as f:
+                return _write_stream(response, f, expected)
+
+        validator = response.headers.get("ETag")
+        if validator and validator.startswith("W/"):
+            # Weak validators are not allowed in If-Range
+            validator = None
+        validator = validator or response.headers.get("Last-Modified")
+
+        # Preallocate so every part can write at its offset
+        with open(dest_path, "wb") as f:
+            f.truncate(total)
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, total)
+                except OSError:
+                    pass
+
+        part_size = -(-total // parts)
+        ranges = [(start, min(start + part_size, total) - 1) for start in range(part_size, total, part_size)]
+        print(f"Downloading {total} bytes in {len(ranges) + 1} ranges: {url}")
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="range-download") as executor:
+                futures = [executor.submit(_fetch_range, url, dest_path, start, end, validator, timeout) for start, end in ranges]
+                # First part from the open response (the rest of its body is not read)
+                with open(dest_path, "r+b") as f:
+                    written = _write_stream(response, f, part_size, limit=part_size)
+                written += sum(future.result() for future in futures)
+        except RangeNotSatisfied as e:
+            print(f"Parallel download not possible ({str(e)}), falling back to a single stream")
+        else:
+            return written
+
+    return _download_single(url, dest_path, timeout)
+
+
+def _download_single(url: str, dest_path: str, timeout) -> int:
+    with get_download_session().get(url, headers={"Accept-Encoding": "identity"}, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            raise Exception(f"Download failed: {response.status_code} - {response.text[:500]}")
+        length = response.headers.get("Content-Length")
+        with open(dest_path, "wb") as f:
+            return _write_stream(response, f, int(length) if length and "Content-Encoding" not in response.headers else None)
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+HASH_CHUNK_SIZE = 1024 * 1024
+ETAG_CACHE_MAX_ENTRIES = 10000
+
+# (path, size, mtime_ns) -> sha256 hex digest
+_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _stat_key(path: str) -> Tuple[str, int, int]:
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _remember(key, digest):
+    with _lock:
+        _digests[key] = digest
+        _digests.move_to_end(key)
+        while len(_digests) > ETAG_CACHE_MAX_ENTRIES:
+            _digests.popitem(last=False)
+
+
+def hash_file(path: str) -> str:
+    """
+    Compute the SHA-256 of a file
+
+    Args:
+        path: File path
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_etag(path: str) -> str:
+    """
+    Strong ETag of a file derived from its content hash
+
+    Digests are cached by path, size and modification time, so a file is
+    hashed once (or never, if its writer called remember_digest()).
+
+    Args:
+        path: File path
+
+    Returns:
+        ETag value (without quotes)
+    """
+    key = _stat_key(path)
+    with _lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+    if digest is None:
+        digest = hash_file(path)
+        _remember(key, digest)
+    return digest
+
+
+def remember_digest(path: str, digest: Optional[str]) -> None:
+    """
+    Record the content hash of a file that was just written
+
+    Args:
+        path: File path
+        digest: SHA-256 hex digest computed while writing
+    """
+    if digest:
+        _remember(_stat_key(path), digest)
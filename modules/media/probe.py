@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import ffmpeg
+from dotenv import load_dotenv
+
+from modules.media.etag import file_etag
+from modules.paths import OUTPUT_DIR
+
+# Load environment variables
+load_dotenv()
+
+# SQLite file of probe results (shared by worker and merge processes, survives restarts)
+PROBE_CACHE_PATH = os.getenv("PROBE_CACHE_PATH", os.path.join(OUTPUT_DIR, "probe_cache.db"))
+# Results kept in memory per process
+PROBE_CACHE_MAX_ENTRIES = int(os.getenv("PROBE_CACHE_MAX_ENTRIES", 1024))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    key TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS probe_urls (
+    url TEXT PRIMARY KEY,
+    key TEXT NOT NULL REFERENCES probes(key) ON DELETE CASCADE
+);
+"""
+
+STREAM_FIELDS = ("index", "codec_type", "codec_name", "profile", "sample_rate", "channels", "channel_layout", "width", "height", "r_frame_rate", "bit_rate", "duration")
+
+
+def summarize_probe(probe: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce ffprobe output to what merges use
+
+    Args:
+        probe: ffmpeg.probe() result
+
+    Returns:
+        Dictionary with duration, format_name, bit_rate, size and streams
+    """
+    fmt = probe.get("format", {})
+    return {
+        "duration": float(fmt["duration"]) if fmt.get("duration") else None,
+        "format_name": fmt.get("format_name"),
+        "bit_rate": int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+        "size": int(fmt["size"]) if fmt.get("size") else None,
+        "streams": [
+            {field: stream[field] for field in STREAM_FIELDS if field in stream}
+            for stream in probe.get("streams", [])
+        ]
+    }
+
+
+class ProbeCache:
+    """
+    Cache of ffprobe metadata keyed by content hash and source URL
+
+    A downloaded file is probed once per content (sha256, so the same track
+    behind different URLs is probed once); the URL is then mapped to that
+    result, so later merges of a known URL skip both the hash and the
+    ffprobe process. Results live in SQLite and in a small per-process
+    LRU in front of it.
+    """
+
+    def __init__(self, path: str = PROBE_CACHE_PATH, max_entries: int = PROBE_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            path: SQLite file of probe results
+            max_entries: Results kept in memory
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # url -> metadata
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._hits = 0
+        self._content_hits = 0
+        self._misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, url, metadata):
+        with self._lock:
+            self._memory[url] = metadata
+            self._memory.move_to_end(url)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _load(self, key):
+        row = self._connection().execute("SELECT metadata FROM probes WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, key, url, metadata):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO probes (key, metadata, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(metadata), time.time())
+        )
+        if url:
+            conn.execute("INSERT OR REPLACE INTO probe_urls (url, key) VALUES (?, ?)", (url, key))
+
+    def get_url(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the metadata of a URL probed before, without any I/O on the media
+
+        Args:
+            url: Media URL
+
+        Returns:
+            Metadata or None
+        """
+        with self._lock:
+            metadata = self._memory.get(url)
+            if metadata is not None:
+                self._memory.move_to_end(url)
+                self._hits += 1
+                return metadata
+        try:
+            row = self._connection().execute(
+                "SELECT p.metadata FROM probe_urls u JOIN probes p ON p.key = u.key WHERE u.url = ?",
+                (url,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Probe cache read failed: {str(e)}")
+            row = None
+        if row is None:
+            return None
+        metadata = json.loads(row[0])
+        self._remember(url, metadata)
+        with self._lock:
+            self._hits += 1
+        return metadata
+
+    def probe_file(self, path: str, url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get the metadata of a local file, probing it only if its content is unknown
+
+        Args:
+            path: Local media file
+            url: URL the file was downloaded from (remembered for get_url())
+
+        Returns:
+            Metadata (see summarize_probe)
+
+        Raises:
+            ffmpeg.Error: If ffprobe failed
+        """
+        if url:
+            metadata = self.get_url(url)
+            if metadata is not None:
+                return metadata
+        key = file_etag(path)
+        metadata = self._load(key)
+        if metadata is None:
+            with self._lock:
+                self._misses += 1
+            metadata = summarize_probe(ffmpeg.probe(path))
+        else:
+            with self._lock:
+                self._content_hits += 1
+        self._store(key, url, metadata)
+        if url:
+            self._remember(url, metadata)
+        return metadata
+
+    def probe_url(self, url: str) -> Dict[str, Any]:
+        """
+        Get the metadata of a remote file (ffprobe reads only its headers on a miss)
+
+        Args:
+            url: Media URL
+
+        Returns:
+            Metadata (see summarize_probe)
+
+        Raises:
+            ffmpeg.Error: If ffprobe failed
+        """
+        metadata = self.get_url(url)
+        if metadata is not None:
+            return metadata
+        with self._lock:
+            self._misses += 1
+        metadata = summarize_probe(ffmpeg.probe(url))
+        # Content unknown: keyed by the URL alone
+        self._store("url:" + hashlib.sha256(url.encode("utf-8")).hexdigest(), url, metadata)
+        self._remember(url, metadata)
+        return metadata
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._connection().execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+        with self._lock:
+            return {
+                "entries": entries,
+                "memory_entries": len(self._memory),
+                "hits": self._hits,
+                "content_hits": self._content_hits,
+                "misses": self._misses,
+                "path": self.path
+            }
+
+
+probe_cache = ProbeCache()
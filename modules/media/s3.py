@@ -0,0 +1,198 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# S3-compatible endpoint used instead of AWS (MinIO, LocalStack, ... for local runs and tests)
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or os.getenv("AWS_REGION") or None
+# Files above this size are uploaded as concurrent multipart uploads (bytes)
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", 16 * 1024 * 1024))
+# Parts of one file transferred in parallel
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 10))
+# Files of a batch uploaded in parallel
+S3_BATCH_CONCURRENCY = int(os.getenv("S3_BATCH_CONCURRENCY", 4))
+# HTTP connections kept by the shared client (every concurrent part needs one)
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", max(S3_MAX_CONCURRENCY * S3_BATCH_CONCURRENCY, 10)))
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class S3Uploader:
+    """
+    Long-lived S3 uploader shared by all threads of a process
+
+    One boto3 client (thread-safe; credentials resolved once, connections
+    kept alive in a pool sized for the transfer concurrency) and one tuned
+    TransferConfig are reused by every upload, instead of building a client
+    per call. With S3_ENDPOINT_URL the same code talks to a local
+    S3-compatible server.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION,
+        multipart_threshold: int = S3_MULTIPART_THRESHOLD,
+        multipart_chunksize: int = S3_MULTIPART_CHUNKSIZE,
+        max_concurrency: int = S3_MAX_CONCURRENCY,
+        batch_concurrency: int = S3_BATCH_CONCURRENCY,
+        max_pool_connections: int = S3_MAX_POOL_CONNECTIONS
+    ):
+        """
+        Args:
+            endpoint_url: S3-compatible endpoint (None for AWS)
+            region: AWS region (None for the default chain)
+            multipart_threshold: Size above which uploads are multipart (bytes)
+            multipart_chunksize: Size of multipart parts (bytes)
+            max_concurrency: Parts of one file transferred in parallel
+            batch_concurrency: Files of a batch uploaded in parallel
+            max_pool_connections: HTTP connections kept by the client
+        """
+        self.endpoint_url = endpoint_url
+        self.batch_concurrency = batch_concurrency
+        config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": 5, "mode": "adaptive"},
+            # Local stand-ins rarely resolve bucket subdomains
+            s3={"addressing_style": "path"} if endpoint_url else None
+        )
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region, config=config)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+        self._lock = threading.Lock()
+        self._uploads = 0
+        self._bytes = 0
+        self._errors = 0
+
+    def object_url(self, bucket_name: str, key: str) -> str:
+        """Public URL of an object"""
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{bucket_name}/{key}"
+        return f"https://{bucket_name}.s3.amazonaws.com/{key}"
+
+    def upload_file(self, file_path: str, bucket_name: str, key: str, content_type: Optional[str] = None, callback: Optional[Callable[[int], None]] = None) -> str:
+        """
+        Upload a file
+
+        Args:
+            file_path: Local file
+            bucket_name: Bucket name
+            key: Object key
+            content_type: Content-Type of the object
+            callback: Function called with the number of bytes sent since the previous call
+
+        Returns:
+            Object URL
+
+        Raises:
+            ClientError, BotoCoreError: If the upload failed
+        """
+        extra_args = {"ContentType": content_type} if content_type else None
+        try:
+            self.client.upload_file(file_path, bucket_name, key, ExtraArgs=extra_args, Config=self.transfer_config, Callback=callback)
+        except (ClientError, BotoCoreError):
+            with self._lock:
+                self._errors += 1
+            raise
+        with self._lock:
+            self._uploads += 1
+            self._bytes += os.path.getsize(file_path)
+        return self.object_url(bucket_name, key)
+
+    def upload_many(self, files: List[Tuple[str, str, Optional[str]]], bucket_name: str, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        Upload several files concurrently
+
+        Args:
+            files: List of (file path, object key, content type)
+            bucket_name: Bucket name
+            progress: Function called with (bytes sent, total bytes) of the whole batch
+
+        Returns:
+            Dictionary of object key -> URL (or None when that upload failed)
+        """
+        total = sum(os.path.getsize(path) for path, _, _ in files)
+        sent = [0]
+        sent_lock = threading.Lock()
+
+        def on_bytes(count):
+            with sent_lock:
+                sent[0] += count
+                done = sent[0]
+            if progress is not None:
+                progress(done, total)
+
+        def upload(item):
+            path, key, content_type = item
+            try:
+                return key, self.upload_file(path, bucket_name, key, content_type, callback=on_bytes)
+            except (ClientError, BotoCoreError) as e:
+                print(f"Error uploading {path} to S3: {e}")
+                return key, None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.batch_concurrency, len(files))), thread_name_prefix="s3-upload") as executor:
+            return dict(executor.map(upload, files))
+
+    def object_exists(self, bucket_name: str, key: str) -> bool:
+        """
+        Check whether an object exists (HEAD)
+
+        Returns:
+            True if it exists (False if it does not or the check failed)
+        """
+        try:
+            self.client.head_object(Bucket=bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                print(f"Error checking S3 object {key}: {e}")
+            return False
+        except BotoCoreError as e:
+            print(f"Error checking S3 object {key}: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "uploads": self._uploads,
+                "bytes": self._bytes,
+                "errors": self._errors,
+                "endpoint_url": self.endpoint_url,
+                "multipart_threshold": self.transfer_config.multipart_threshold,
+                "multipart_chunksize": self.transfer_config.multipart_chunksize,
+                "max_concurrency": self.transfer_config.max_request_concurrency
+            }
+
+
+_s3_uploader: Optional[S3Uploader] = None
+_s3_uploader_lock = threading.Lock()
+
+
+def get_s3_uploader() -> S3Uploader:
+    """
+    Function to get the process-wide S3 uploader (created on first use)
+
+    Returns:
+        Shared S3Uploader
+    """
+    global _s3_uploader
+    if _s3_uploader is None:
+        with _s3_uploader_lock:
+            if _s3_uploader is None:
+                _s3_uploader = S3Uploader()
+    return _s3_uploader
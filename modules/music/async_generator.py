@@ -0,0 +1,351 @@
+import asyncio
+import atexit
+import json
+import threading
+import httpx
+from typing import Dict, Any, Optional
+
+from modules.music.generator import (
+    SUNO_API_KEY,
+    BASE_URL,
+    build_suno_headers,
+    handle_suno_response,
+    build_music_request,
+    parse_music_response,
+    parse_status_response,
+    audio_id_from_status,
+    build_mp4_request,
+    parse_mp4_response,
+    build_lyrics_request,
+    parse_lyrics_response,
+)
+from modules.music.session import POOL_MAXSIZE, CONNECT_TIMEOUT, READ_TIMEOUT
+from modules.music.status_cache import status_cache
+from modules.music.dedup import generation_dedup, request_dedup_key
+from modules.music.lyrics_cache import lyrics_cache
+from modules.music.resilience import SunoAPIError, get_breaker, next_retry_delay
+
+# Seconds given to in-flight requests when the client is closed at exit
+CLIENT_CLOSE_TIMEOUT = 5.0
+
+# httpx connections belong to the loop that opened them, and flask[async] runs
+# every view on a fresh loop: the pooled client lives on its own long-lived loop
+# thread, and requests from any loop are handed to it
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client_lock = threading.Lock()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Function to get the pooled async HTTP client (started on first use)
+
+    The client may only be used on its own loop; use send_async() from
+    other loops.
+
+    Returns:
+        Shared httpx AsyncClient
+    """
+    global _client, _client_loop
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="suno-async-client", daemon=True).start()
+
+                async def create():
+                    return httpx.AsyncClient(
+                        limits=httpx.Limits(max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE),
+                        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+                    )
+
+                _client_loop = loop
+                _client = asyncio.run_coroutine_threadsafe(create(), loop).result()
+                atexit.register(close_async_client)
+    return _client
+
+
+async def send_async(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Function to send a request on the pooled client from any event loop
+
+    Args:
+        method: HTTP method
+        url: Request URL
+        **kwargs: httpx request arguments (headers, json...)
+
+    Returns:
+        Response (body read)
+    """
+    client = get_async_client()
+    future = asyncio.run_coroutine_threadsafe(client.request(method, url, **kwargs), _client_loop)
+    # Cancelling the caller cancels the request on the client loop too
+    return await asyncio.wrap_future(future)
+
+
+def close_async_client() -> None:
+    """
+    Function to close the pooled client and stop its loop (registered with atexit)
+    """
+    global _client, _client_loop
+    with _client_lock:
+        client, loop = _client, _client_loop
+        _client = _client_loop = None
+    if client is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=CLIENT_CLOSE_TIMEOUT)
+    except Exception as e:
+        print(f"Error closing async Suno client: {str(e)}")
+    loop.call_soon_threadsafe(loop.stop)
+
+
+async def call_suno_api_async(endpoint, data, max_retries=3, retry_delay=None):
+    """
+    Async counterpart of call_suno_api (same retry policy and circuit breakers)
+
+    Args:
+        endpoint: API endpoint
+        data: Request data
+        max_retries: Maximum number of attempts
+        retry_delay: Backoff base delay (seconds, default: SUNO_RETRY_BASE_DELAY)
+
+    Returns:
+        API response
+
+    Raises:
+        SunoAPIError: If the call failed (CircuitOpenError if the circuit is open)
+    """
+    breaker = get_breaker(endpoint)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            print(f"Calling Suno API (async): {BASE_URL}{endpoint} (Attempt {attempt}/{max_retries})")
+            print(f"Request data: {json.dumps(data, ensure_ascii=False)}")
+
+            response = await send_async("POST", f"{BASE_URL}{endpoint}", headers=build_suno_headers(), json=data)
+
+            result = handle_suno_response(response.status_code, response.text, response.json, response.headers)
+            breaker.record_success()
+            return result
+
+        except httpx.HTTPError as e:
+            print(f"ERROR: Request failed: {str(e)}")
+            error = SunoAPIError(f"Request failed: {str(e)}", retryable=isinstance(e, httpx.TransportError))
+        except SunoAPIError as e:
+            error = e
+        except asyncio.CancelledError:
+            # Cancelled, not failed: just free the half-open probe slot
+            breaker.release_probe()
+            raise
+        except BaseException:
+            # Local error, the endpoint gave no verdict
+            breaker.release_probe()
+            raise
+
+        breaker.record_failure(error)
+        delay = next_retry_delay(error, attempt, max_retries, retry_delay)
+        if delay is None:
+            raise error
+        print(f"Retrying in {delay:.1f} seconds... (Attempt {attempt}/{max_retries})")
+        await asyncio.sleep(delay)
+
+
+async def generate_music_with_suno_async(prompt, reference_style=None, with_lyrics=True, model_version="v4") -> Dict[str, Any]:
+    """
+    Async counterpart of generate_music_with_suno
+
+    Args:
+        prompt: Music generation prompt
+        reference_style: Reference style (genre etc.)
+        with_lyrics: Whether to include lyrics (default: True)
+        model_version: Model version (v3.5, v4 etc.)
+
+    Returns:
+        Dictionary containing generated music information or error information
+    """
+    try:
+        print(f"\nGenerating music with Suno API (async)...")
+        print(f"Prompt: '{prompt}'")
+
+        # Check API key
+        if not SUNO_API_KEY:
+            print("ERROR: SUNO_API_KEY is not set")
+            return {"error": "SUNO_API_KEY is not set in environment variables"}
+
+        request_task_id, data = build_music_request(prompt, reference_style, with_lyrics, model_version)
+
+        # Send API request
+        async def submit():
+            try:
+                response_data = await call_suno_api_async("/api/v1/generate", data)
+                return parse_music_response(response_data, request_task_id)
+            except Exception as api_error:
+                print(f"API call failed: {str(api_error)}")
+                return {
+                    "error": f"API call failed: {str(api_error)}"
+                }
+
+        # Shares the dedup window with the sync client
+        return await generation_dedup.submit_async(request_dedup_key(data), submit)
+
+    except Exception as e:
+        print(f"Error generating music: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "error": f"An error occurred: {str(e)}"
+        }
+
+
+async def check_generation_status_async(task_id) -> Optional[Dict[str, Any]]:
+    """
+    Async counterpart of check_generation_status (shares its status cache)
+
+    Args:
+        task_id: Task ID
+
+    Returns:
+        Task status information
+    """
+    return await status_cache.get_or_fetch_async(task_id, lambda: fetch_generation_status_async(task_id))
+
+
+async def fetch_generation_status_async(task_id) -> Optional[Dict[str, Any]]:
+    """
+    Async counterpart of fetch_generation_status
+
+    Args:
+        task_id: Task ID
+
+    Returns:
+        Task status information
+    """
+    try:
+        print(f"\nChecking status for task {task_id} (async)...")
+
+        # Check API key
+        if not SUNO_API_KEY:
+            print("ERROR: SUNO_API_KEY is not set")
+            return None
+
+        result = await call_suno_api_async("/api/v1/status", {"taskId": task_id}, max_retries=1)
+        return parse_status_response(result)
+
+    except Exception as e:
+        print(f"Error checking status: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+async def get_wav_format_async(task_id) -> Optional[str]:
+    """
+    Async counterpart of get_wav_format
+
+    Args:
+        task_id: Task ID
+
+    Returns:
+        WAV format URL
+    """
+    try:
+        status_result = await check_generation_status_async(task_id)
+        if not status_result or status_result.get("status") != "success":
+            print("ERROR: Task not completed")
+            return None
+
+        wav_url = status_result.get("audioUrl")
+        if not wav_url:
+            print("No WAV URL in response")
+        return wav_url or None
+
+    except Exception as e:
+        print(f"Error getting WAV format: {str(e)}")
+        return None
+
+
+async def generate_mp4_video_async(task_id, audio_id=None, author="AI Music Creator", domain_name=None) -> Dict[str, Any]:
+    """
+    Async counterpart of generate_mp4_video
+
+    Args:
+        task_id: Task ID
+        audio_id: Audio ID (if not specified, get from task ID)
+        author: Author name
+        domain_name: Domain name
+
+    Returns:
+        URL of generated MP4 video
+    """
+    try:
+        print(f"\nGenerating MP4 video for task {task_id} (async)...")
+
+        # Check API key
+        if not SUNO_API_KEY:
+            print("ERROR: SUNO_API_KEY is not set")
+            return {"error": "SUNO_API_KEY is not set in environment variables"}
+
+        # If audio_id not specified, check status from task ID to get it
+        if not audio_id:
+            status_result = await check_generation_status_async(task_id)
+            if not status_result or status_result.get("status") != "success":
+                print("ERROR: Task not completed or audio_id not available")
+                return {"error": "Task not completed or audio_id not available"}
+
+            audio_id = audio_id_from_status(status_result)
+            if not audio_id:
+                print("ERROR: Could not find audio_id in task status")
+                return {"error": "Could not find audio_id in task status"}
+
+        data = build_mp4_request(task_id, audio_id, author, domain_name)
+        result = await call_suno_api_async("/api/v1/mp4/generate", data)
+        return parse_mp4_response(result, task_id, audio_id)
+
+    except Exception as e:
+        print(f"Error generating MP4 video: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return {"error": str(e)}
+
+
+async def generate_lyrics_async(prompt) -> Optional[str]:
+    """
+    Async counterpart of generate_lyrics
+
+    Args:
+        prompt: Lyrics generation prompt
+
+    Returns:
+        Generated lyrics
+    """
+    try:
+        print(f"\nGenerating lyrics with Suno API (async)...")
+        print(f"Prompt: '{prompt}'")
+
+        # Return cached lyrics for the same (normalized) prompt
+        cached = await lyrics_cache.get_async(prompt)
+        if cached:
+            print("Lyrics served from cache")
+            return cached
+
+        # Check API key
+        if not SUNO_API_KEY:
+            print("ERROR: SUNO_API_KEY is not set")
+            return None
+
+        result = await call_suno_api_async("/api/v1/lyrics", build_lyrics_request(prompt))
+        lyrics = parse_lyrics_response(result)
+        if lyrics:
+            # The disk tier write is blocking I/O: keep it off the event loop
+            await asyncio.to_thread(lyrics_cache.put, prompt, lyrics)
+        return lyrics
+
+    except Exception as e:
+        print(f"Error generating lyrics: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from modules.music.singleflight import Flight
+
+# Load environment variables
+load_dotenv()
+
+# Identical generation requests within this window reuse the first task (seconds, 0 disables)
+DEDUP_WINDOW = float(os.getenv("SUNO_DEDUP_WINDOW", 30))
+DEDUP_MAX_ENTRIES = int(os.getenv("SUNO_DEDUP_MAX_ENTRIES", 1000))
+
+# Request fields that are unique per submission and do not affect the generated music
+PER_REQUEST_FIELDS = {"taskId", "title", "callBackUrl"}
+
+
+def _normalize_text(value: str) -> str:
+    return re.sub(r"\s+", " ", value).strip()
+
+
+def request_dedup_key(data: Dict[str, Any]) -> str:
+    """
+    Build the deduplication key of a Suno generation request
+
+    Args:
+        data: Request data from build_music_request (after model and prompt rewriting)
+
+    Returns:
+        Hex digest of the normalized generation parameters
+    """
+    params = {}
+    for name, value in data.items():
+        if name in PER_REQUEST_FIELDS:
+            continue
+        if isinstance(value, str):
+            value = _normalize_text(value)
+            if name != "prompt":
+                value = value.casefold()
+        params[name] = value
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RequestDeduplicator:
+    """
+    Collapse identical generation requests submitted within a time window
+
+    The first request for a key is submitted; identical requests arriving
+    while it is in flight wait for its result, and those arriving within
+    window seconds after it succeeded get the same result (and task ID)
+    back. Failed submissions are shared with the waiters but not reused.
+    """
+
+    def __init__(self, window: float = DEDUP_WINDOW, max_entries: int = DEDUP_MAX_ENTRIES):
+        """
+        Args:
+            window: Reuse period of a successful submission (seconds, 0 disables)
+            max_entries: Number of remembered submissions (oldest dropped first)
+        """
+        self.window = window
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (expires_at, result)
+        self._results: "OrderedDict[str, tuple]" = OrderedDict()
+        self._flights: Dict[str, Flight] = {}
+        self._hits_in_flight = 0
+        self._hits_completed = 0
+        self._misses = 0
+
+    def _claim(self, key):
+        """Return (reused result, flight, is_leader) under the lock"""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._hits_completed += 1
+                    return entry[1], None, False
+                del self._results[key]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._hits_in_flight += 1
+                return None, flight, False
+            flight = self._flights[key] = Flight()
+            self._misses += 1
+            return None, flight, True
+
+    def _complete(self, key, flight, result):
+        with self._lock:
+            if isinstance(result, dict) and "error" not in result:
+                self._results[key] = (time.monotonic() + self.window, result)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+            self._flights.pop(key, None)
+        flight.finish(result)
+
+    @staticmethod
+    def _reused(result):
+        if not isinstance(result, dict) or "error" in result:
+            return result
+        return dict(result, deduplicated=True)
+
+    def submit(self, key: str, submit: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Submit a request unless an identical one is in flight or recently succeeded
+
+        Args:
+            key: Deduplication key (request_dedup_key)
+            submit: Function performing the submission
+
+        Returns:
+            Submission result (with "deduplicated": True when reused)
+        """
+        if self.window <= 0:
+            return submit()
+        result, flight, leader = self._claim(key)
+        if result is not None:
+            return self._reused(result)
+        if not leader:
+            return self._reused(flight.wait())
+        result = None
+        try:
+            result = submit()
+        finally:
+            self._complete(key, flight, result)
+        return result
+
+    async def submit_async(self, key: str, submit: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Asyncio counterpart of submit()
+
+        Args:
+            key: Deduplication key (request_dedup_key)
+            submit: Coroutine function performing the submission
+
+        Returns:
+            Submission result (with "deduplicated": True when reused)
+        """
+        if self.window <= 0:
+            return await submit()
+        result, flight, leader = self._claim(key)
+        if result is not None:
+            return self._reused(result)
+        if not leader:
+            return self._reused(await flight.wait_async())
+        result = None
+        try:
+            result = await submit()
+        finally:
+            self._complete(key, flight, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._hits_in_flight + self._hits_completed
+            total = hits + self._misses
+            return {
+                "window": self.window,
+                "entries": len(self._results),
+                "in_flight": len(self._flights),
+                "hits": hits,
+                "hits_in_flight": self._hits_in_flight,
+                "hits_completed": self._hits_completed,
+                "misses": self._misses,
+                "hit_rate": hits / total if total else 0.0
+            }
+
+
+generation_dedup = RequestDeduplicator()
@@ -3,8 +3,17 @@ import time
 import json
 import requests
 import uuid
+import shutil
 from dotenv import load_dotenv
 from typing import Dict, Any, Optional
+from modules.music.session import get_session, get_timeout
+from modules.music.status_cache import status_cache
+from modules.music.dedup import generation_dedup, request_dedup_key
+from modules.music.lyrics_cache import lyrics_cache
+from modules.media.cache import get_media_cache
+from modules.media.downloader import download_to_file
+from modules.paths import OUTPUT_DIR
+from modules.music.resilience import SunoAPIError, get_breaker, next_retry_delay, is_retryable_status, is_retryable_api_code, parse_retry_after
 
 # Load environment variables
 load_dotenv()
@@ -13,85 +22,230 @@ load_dotenv()
 SUNO_API_KEY = os.getenv("SUNO_API_KEY")
 CALLBACK_URL = os.getenv("CALLBACK_URL", "http://localhost:5001/callback")
 BASE_URL = "https://apibox.erweima.ai"
-OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'output')
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def call_suno_api(endpoint, data, max_retries=3, retry_delay=5):
+def build_suno_headers():
+    """
+    Function to build Suno API request headers
+    
+    Returns:
+        Request headers
+    """
+    return {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "Authorization": f"Bearer {SUNO_API_KEY}"
+    }
+
+def handle_suno_response(status_code, text, parse_json, headers=None):
+    """
+    Common function to check a Suno API response (shared by sync and async clients)
+    
+    Args:
+        status_code: HTTP status code
+        text: Response body text
+        parse_json: Function returning the parsed JSON body
+        headers: Response headers (for Retry-After)
+        
+    Returns:
+        API response
+        
+    Raises:
+        SunoAPIError: If the API returned an error (retryable or not)
+    """
+    print(f"Response status: {status_code}")
+    print(f"Response body: {text[:500]}...")  # Truncate long responses
+    
+    if status_code != 200:
+        print(f"ERROR: API returned status code {status_code}")
+        raise SunoAPIError(
+            f"API returned status code {status_code}: {text}",
+            status_code=status_code,
+            retryable=is_retryable_status(status_code),
+            retry_after=parse_retry_after((headers or {}).get("Retry-After"))
+        )
+        
+    try:
+        result = parse_json()
+    except ValueError as e:
+        print(f"ERROR: Failed to parse JSON response: {str(e)}")
+        print(f"Response text: {text}")
+        raise SunoAPIError(f"Failed to parse JSON response: {str(e)}", status_code=status_code)
+    
+    # Check for API errors based on response format
+    if result.get("code") != 200:
+        error_msg = f"API error: {result.get('msg')}"
+        print(f"ERROR: {error_msg}")
+        raise SunoAPIError(error_msg, status_code=result.get("code"), retryable=is_retryable_api_code(result.get("code")))
+    
+    return result
+
+def call_suno_api(endpoint, data, max_retries=3, retry_delay=None):
     """
     Common function to call Suno API (with retry functionality)
     
+    Only retryable errors (5xx, 408/429, timeouts, connection errors) are
+    retried, with jittered exponential backoff or the server's Retry-After.
+    Each endpoint has a circuit breaker that fails fast while Suno is down.
+    
     Args:
         endpoint: API endpoint
         data: Request data
-        max_retries: Maximum number of retries
-        retry_delay: Delay between retries (seconds)
+        max_retries: Maximum number of attempts
+        retry_delay: Backoff base delay (seconds, default: SUNO_RETRY_BASE_DELAY)
         
     Returns:
         API response
+        
+    Raises:
+        SunoAPIError: If the call failed (CircuitOpenError if the circuit is open)
     """
-    retry_count = 0
-    last_exception = None
+    breaker = get_breaker(endpoint)
+    attempt = 0
     
-    while retry_count < max_retries:
+    while True:
+        attempt += 1
+        breaker.before_call()
         try:
-            headers = {
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "Authorization": f"Bearer {SUNO_API_KEY}"
-            }
+            headers = build_suno_headers()
             
-            print(f"Calling Suno API: {BASE_URL}{endpoint} (Attempt {retry_count + 1}/{max_retries})")
+            print(f"Calling Suno API: {BASE_URL}{endpoint} (Attempt {attempt}/{max_retries})")
             print(f"Request data: {json.dumps(data, ensure_ascii=False)}")
             
-            response = requests.post(f"{BASE_URL}{endpoint}", headers=headers, json=data, timeout=60)
-            
-            print(f"Response status: {response.status_code}")
-            print(f"Response body: {response.text[:500]}...")  # Truncate long responses
-            
-            # Retry on 503 error
-            if response.status_code == 503:
-                retry_count += 1
-                print(f"Received 503 error. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                continue
-                
-            if response.status_code != 200:
-                print(f"ERROR: API returned status code {response.status_code}")
-                raise Exception(f"API returned status code {response.status_code}: {response.text}")
-                
-            try:
-                result = response.json()
-            except json.JSONDecodeError as e:
-                print(f"ERROR: Failed to parse JSON response: {str(e)}")
-                print(f"Response text: {response.text}")
-                raise Exception(f"Failed to parse JSON response: {str(e)}")
-            
-            # Check for API errors based on response format
-            if result.get("code") != 200:
-                error_msg = f"API error: {result.get('msg')}"
-                print(f"ERROR: {error_msg}")
-                raise Exception(error_msg)
+            # Use shared keep-alive session (pooled connections to the Suno API)
+            response = get_session().post(f"{BASE_URL}{endpoint}", headers=headers, json=data, timeout=get_timeout())
             
+            result = handle_suno_response(response.status_code, response.text, response.json, response.headers)
+            breaker.record_success()
             return result
             
         except requests.exceptions.RequestException as e:
             print(f"ERROR: Request failed: {str(e)}")
-            last_exception = Exception(f"Request failed: {str(e)}")
-            retry_count += 1
-            print(f"Retrying in {retry_delay} seconds... (Attempt {retry_count}/{max_retries})")
-            time.sleep(retry_delay)
-        except Exception as e:
+            error = SunoAPIError(
+                f"Request failed: {str(e)}",
+                retryable=isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError))
+            )
+        except SunoAPIError as e:
+            error = e
+        except BaseException as e:
+            # Local error, the endpoint gave no verdict: free the half-open probe slot
             print(f"ERROR: {str(e)}")
-            last_exception = e
-            retry_count += 1
-            print(f"Retrying in {retry_delay} seconds... (Attempt {retry_count}/{max_retries})")
-            time.sleep(retry_delay)
-    
-    # If all retries failed
-    if last_exception:
-        raise last_exception
+            breaker.release_probe()
+            raise
+        
+        breaker.record_failure(error)
+        delay = next_retry_delay(error, attempt, max_retries, retry_delay)
+        if delay is None:
+            raise error
+        print(f"Retrying in {delay:.1f} seconds... (Attempt {attempt}/{max_retries})")
+        time.sleep(delay)
+
+def build_music_request(prompt, reference_style=None, with_lyrics=True, model_version="v4"):
+    """
+    Function to build Suno music generation request data (shared by sync and async clients)
+    
+    Args:
+        prompt: Music generation prompt
+        reference_style: Reference style (genre etc.)
+        with_lyrics: Whether to include lyrics (default: True)
+        model_version: Model version (v3.5, v4 etc.)
+        
+    Returns:
+        Tuple of request task ID and request data
+    """
+    # Model version format - correction
+    # Convert to exact format accepted by Suno API
+    if model_version.lower() == "v3.5" or model_version.lower() == "v3_5" or model_version == "3.5":
+        formatted_model = "V3_5"  # Capital V, underscore
+    elif model_version.lower() == "v4" or model_version == "4":
+        formatted_model = "V4"    # Capital V
+    else:
+        # Default to V4
+        formatted_model = "V4"
+        
+    print(f"Formatted model: {formatted_model}")
+    
+    # Generate task ID (unique identifier)
+    request_task_id = str(uuid.uuid4())
+    
+    # Set callback URL
+    callback_url = CALLBACK_URL + "/api/callback/generate/music"
+    # Ensure https (Suno callback requires https)
+    if not callback_url.startswith("https://"):
+        callback_url = callback_url.replace("http://", "https://")
+    print(f"Using callback URL: {callback_url}")
+    # Check callback URL for local development environment
+    if "localhost" in callback_url or "127.0.0.1" in callback_url:
+        print(f"Warning: Callback to local URL may not be reachable from outside: {callback_url}")
+        print("Consider using a tunneling service like ngrok")
+    
+    print(f"Callback URL: {callback_url}")
+    
+    # For music with lyrics, add lyrics instruction to prompt
+    enhanced_prompt = prompt
+    if with_lyrics and "歌詞" not in prompt and "lyrics" not in prompt.lower():
+        # If prompt doesn't mention lyrics, add instruction automatically
+        if "日本語" in prompt or "Japanese" in prompt:
+            enhanced_prompt += "。日本語の歌詞を含めてください。"
+        else:
+            enhanced_prompt += ". "
+        print(f"Enhanced prompt for lyrics: '{enhanced_prompt}'")
+    
+    # Prepare request data (correct format based on Suno API documentation)
+    data = {
+        "prompt": enhanced_prompt,
+        "style": reference_style if reference_style else "",
+        "title": f"Generated Music {request_task_id[:8]}",
+        "customMode": True,
+        "instrumental": not with_lyrics,
+        "model": formatted_model,
+        "taskId": request_task_id,
+        "callBackUrl": callback_url
+    }
+    
+    # Add negative tags if available (optional)
+    negative_tags = os.getenv("SUNO_NEGATIVE_TAGS", "")
+    if negative_tags:
+        data["negativeTags"] = negative_tags
+    
+    print(f"Request data: {json.dumps(data, ensure_ascii=False)}")
+    
+    return request_task_id, data
+
+def parse_music_response(response_data, request_task_id):
+    """
+    Function to process Suno music generation response
+    
+    Args:
+        response_data: API response
+        request_task_id: Task ID sent with the request
+        
+    Returns:
+        Dictionary containing generated music information or error information
+    """
+    print(f"Response data: {json.dumps(response_data, ensure_ascii=False)}")
+    
+    # Process successful response
+    if response_data.get("code") == 200:
+        # Get taskId from response
+        response_task_id = response_data.get("data", {}).get("taskId")
+        if not response_task_id:
+            raise Exception("No taskId in response")
+        
+        result = {
+            "success": True,
+            "status": "pending",
+            "request_task_id": request_task_id,
+            "response_task_id": response_task_id,
+            "message": "Music generation request submitted successfully"
+        }
+        
+        return result
     else:
-        raise Exception("Maximum retries exceeded")
+        return {
+            "error": "API request failed",
+            "details": response_data
+        }
 
 def generate_music_with_suno(prompt, reference_style=None, with_lyrics=True, model_version="v4", wait_for_completion=False, max_wait_time=300):
     """
@@ -126,94 +280,21 @@ def generate_music_with_suno(prompt, reference_style=None, with_lyrics=True, mod
         # API endpoint
         api_endpoint = "/api/v1/generate"
         
-        # Model version format - correction
-        # Convert to exact format accepted by Suno API
-        if model_version.lower() == "v3.5" or model_version.lower() == "v3_5" or model_version == "3.5":
-            formatted_model = "V3_5"  # Capital V, underscore
-        elif model_version.lower() == "v4" or model_version == "4":
-            formatted_model = "V4"    # Capital V
-        else:
-            # Default to V4
-            formatted_model = "V4"
-            
-        print(f"Formatted model: {formatted_model}")
-        
-        # Generate task ID (unique identifier)
-        request_task_id = str(uuid.uuid4())
-        
-        # Set callback URL
-        callback_url = CALLBACK_URL + "/api/callback/generate/music"
-        # Ensure https (Suno callback requires https)
-        if not callback_url.startswith("https://"):
-            callback_url = callback_url.replace("http://", "https://")
-        print(f"Using callback URL: {callback_url}")
-        # Check callback URL for local development environment
-        if "localhost" in callback_url or "127.0.0.1" in callback_url:
-            print(f"Warning: Callback to local URL may not be reachable from outside: {callback_url}")
-            print("Consider using a tunneling service like ngrok")
-        
-        print(f"Callback URL: {callback_url}")
-        
-        # For music with lyrics, add lyrics instruction to prompt
-        enhanced_prompt = prompt
-        if with_lyrics and "歌詞" not in prompt and "lyrics" not in prompt.lower():
-            # If prompt doesn't mention lyrics, add instruction automatically
-            if "日本語" in prompt or "Japanese" in prompt:
-                enhanced_prompt += "。日本語の歌詞を含めてください。"
-            else:
-                enhanced_prompt += ". "
-            print(f"Enhanced prompt for lyrics: '{enhanced_prompt}'")
-        
-        # Prepare request data (correct format based on Suno API documentation)
-        data = {
-            "prompt": enhanced_prompt,
-            "style": reference_style if reference_style else "",
-            "title": f"Generated Music {request_task_id[:8]}",
-            "customMode": True,
-            "instrumental": not with_lyrics,
-            "model": formatted_model,
-            "taskId": request_task_id,
-            "callBackUrl": callback_url
-        }
-        
-        # Add negative tags if available (optional)
-        negative_tags = os.getenv("SUNO_NEGATIVE_TAGS", "")
-        if negative_tags:
-            data["negativeTags"] = negative_tags
-        
-        print(f"Request data: {json.dumps(data, ensure_ascii=False)}")
+        request_task_id, data = build_music_request(prompt, reference_style, with_lyrics, model_version)
         
         # Send API request
-        try:
-            response_data = call_suno_api(api_endpoint, data)
-            print(f"Response data: {json.dumps(response_data, ensure_ascii=False)}")
-            
-            # Process successful response
-            if response_data.get("code") == 200:
-                # Get taskId from response
-                response_task_id = response_data.get("data", {}).get("taskId")
-                if not response_task_id:
-                    raise Exception("No taskId in response")
-                
-                result = {
-                    "success": True,
-                    "status": "pending",
-                    "request_task_id": request_task_id,
-                    "response_task_id": response_task_id,
-                    "message": "Music generation request submitted successfully"
-                }
-                
-                return result
-            else:
+        def submit():
+            try:
+                response_data = call_suno_api(api_endpoint, data)
+                return parse_music_response(response_data, request_task_id)
+            except Exception as api_error:
+                print(f"API call failed: {str(api_error)}")
                 return {
-                    "error": "API request failed",
-                    "details": response_data
+                    "error": f"API call failed: {str(api_error)}"
                 }
-        except Exception as api_error:
-            print(f"API call failed: {str(api_error)}")
-            return {
-                "error": f"API call failed: {str(api_error)}"
-            }
+        
+        # Identical requests (double clicks, client retries) within the window reuse the first task
+        return generation_dedup.submit(request_dedup_key(data), submit)
     
     except Exception as e:
         print(f"Error generating music: {str(e)}")
@@ -224,10 +305,46 @@ def generate_music_with_suno(prompt, reference_style=None, with_lyrics=True, mod
             "error": f"An error occurred: {str(e)}"
         }
 
-def check_generation_status(task_id):
+def parse_status_response(result):
+    """
+    Function to get task status information from Suno status response
+    
+    Args:
+        result: API response
+        
+    Returns:
+        Task status information
+    """
+    # Get data from response
+    response_data = result.get("data", {})
+    
+    print(f"Status response: {json.dumps(response_data, ensure_ascii=False)}")
+    
+    return response_data
+
+def check_generation_status(task_id, fresh=False):
     """
     Function to check task status
     
+    Concurrent checks of one task share a single upstream request, and
+    results are cached briefly (terminal states until evicted).
+    
+    Args:
+        task_id: Task ID
+        fresh: Ignore the cached status (e.g. for the videoUrl, which is
+            added after the task reached SUCCESS)
+        
+    Returns:
+        Task status information
+    """
+    if fresh:
+        status_cache.invalidate(task_id)
+    return status_cache.get_or_fetch(task_id, lambda: fetch_generation_status(task_id))
+
+def fetch_generation_status(task_id):
+    """
+    Function to request task status from Suno API (bypassing the status cache)
+    
     Args:
         task_id: Task ID
         
@@ -250,12 +367,7 @@ def check_generation_status(task_id):
         # Call status check API - use correct endpoint
         result = call_suno_api("/api/v1/status", data, max_retries=1)
         
-        # Get data from response
-        response_data = result.get("data", {})
-        
-        print(f"Status response: {json.dumps(response_data, ensure_ascii=False)}")
-        
-        return response_data
+        return parse_status_response(result)
         
     except Exception as e:
         print(f"Error checking status: {str(e)}")
@@ -296,6 +408,101 @@ def get_wav_format(task_id):
         print(f"Error getting WAV format: {str(e)}")
         return None
 
+def audio_id_from_status(status_result):
+    """
+    Function to get the first audio ID from task status information
+    
+    Args:
+        status_result: Task status information
+        
+    Returns:
+        Audio ID or None
+    """
+    if "data" in status_result and isinstance(status_result["data"], list) and len(status_result["data"]) > 0:
+        return status_result["data"][0].get("id")
+    return None
+
+def build_mp4_request(task_id, audio_id, author="AI Music Creator", domain_name=None):
+    """
+    Function to build Suno MP4 generation request data
+    
+    Args:
+        task_id: Task ID
+        audio_id: Audio ID
+        author: Author name
+        domain_name: Domain name
+        
+    Returns:
+        Request data
+    """
+    # Set callback URL
+    callback_url = os.getenv("CALLBACK_URL")
+    if not callback_url:
+        print("WARNING: CALLBACK_URL is not set")
+        callback_url = "http://localhost:5001/callback"
+    
+    # Use default value if domain name not specified
+    if not domain_name:
+        domain_name = "https://vaibes.fun/"
+    
+    # Prepare request data
+    data = {
+        "taskId": task_id,
+        "audioId": audio_id,
+        "callBackUrl": callback_url,
+        "author": author,
+        "domainName": domain_name
+    }
+    
+    print(f"MP4 generation request data: {json.dumps(data, ensure_ascii=False)}")
+    
+    return data
+
+def parse_mp4_response(result, task_id, audio_id):
+    """
+    Function to process Suno MP4 generation response
+    
+    Args:
+        result: API response
+        task_id: Task ID
+        audio_id: Audio ID
+        
+    Returns:
+        MP4 generation result or error information
+    """
+    # Process response
+    response_data = result.get("data", {})
+    
+    # Process successful response
+    if result.get("code") == 200:
+        print(f"MP4 generation request submitted successfully")
+        
+        # Get MP4 URL from response
+        mp4_url = response_data.get("videoUrl")
+        
+        if mp4_url:
+            print(f"MP4 URL: {mp4_url}")
+            return {
+                "success": True,
+                "task_id": task_id,
+                "audio_id": audio_id,
+                "mp4_url": mp4_url
+            }
+        else:
+            # If no MP4 URL, return task ID for later status check
+            print("MP4 URL not available yet, check status later")
+            return {
+                "success": True,
+                "status": "pending",
+                "task_id": task_id,
+                "audio_id": audio_id,
+                "message": "MP4 generation request submitted, check status later"
+            }
+    else:
+        error_msg = f"MP4 generation failed: {result.get('msg')}"
+        print(f"ERROR: {error_msg}")
+        return {"error": error_msg}
+
 def generate_mp4_video(task_id, audio_id=None, author="AI Music Creator", domain_name=None):
     """
     Function to generate MP4 video using Suno API
@@ -325,69 +532,19 @@ def generate_mp4_video(task_id, audio_id=None, author="AI Music Creator", domain
                 return {"error": "Task not completed or audio_id not available"}
                 
             # Get audio ID (depends on API response format)
-            if "data" in status_result and isinstance(status_result["data"], list) and len(status_result["data"]) > 0:
-                audio_id = status_result["data"][0].get("id")
+            audio_id = audio_id_from_status(status_result)
             
             if not audio_id:
                 print("ERROR: Could not find audio_id in task status")
                 return {"error": "Could not find audio_id in task status"}
         
-        # Set callback URL
-        callback_url = os.getenv("CALLBACK_URL")
-        if not callback_url:
-            print("WARNING: CALLBACK_URL is not set")
-            callback_url = "http://localhost:5001/callback"
-        
-        # Use default value if domain name not specified
-        if not domain_name:
-            domain_name = "https://vaibes.fun/"
-        
         # Prepare request data
-        data = {
-            "taskId": task_id,
-            "audioId": audio_id,
-            "callBackUrl": callback_url,
-            "author": author,
-            "domainName": domain_name
-        }
-        
-        print(f"MP4 generation request data: {json.dumps(data, ensure_ascii=False)}")
+        data = build_mp4_request(task_id, audio_id, author, domain_name)
         
         # Call MP4 generation API
         result = call_suno_api("/api/v1/mp4/generate", data)
         
-        # Process response
-        response_data = result.get("data", {})
-        
-        # Process successful response
-        if result.get("code") == 200:
-            print(f"MP4 generation request submitted successfully")
-            
-            # Get MP4 URL from response
-            mp4_url = response_data.get("videoUrl")
-            
-            if mp4_url:
-                print(f"MP4 URL: {mp4_url}")
-                return {
-                    "success": True,
-                    "task_id": task_id,
-                    "audio_id": audio_id,
-                    "mp4_url": mp4_url
-                }
-            else:
-                # If no MP4 URL, return task ID for later status check
-                print("MP4 URL not available yet, check status later")
-                return {
-                    "success": True,
-                    "status": "pending",
-                    "task_id": task_id,
-                    "audio_id": audio_id,
-                    "message": "MP4 generation request submitted, check status later"
-                }
-        else:
-            error_msg = f"MP4 generation failed: {result.get('msg')}"
-            print(f"ERROR: {error_msg}")
-            return {"error": error_msg}
+        return parse_mp4_response(result, task_id, audio_id)
             
     except Exception as e:
         print(f"Error generating MP4 video: {str(e)}")
@@ -395,6 +552,47 @@ def generate_mp4_video(task_id, audio_id=None, author="AI Music Creator", domain
         traceback.print_exc()
         return {"error": str(e)}
 
+def build_lyrics_request(prompt):
+    """
+    Function to build Suno lyrics generation request data
+    
+    Args:
+        prompt: Lyrics generation prompt
+        
+    Returns:
+        Request data
+    """
+    # Generate task ID
+    task_id = str(uuid.uuid4())
+    
+    return {
+        "prompt": prompt,
+        "taskId": task_id
+    }
+
+def parse_lyrics_response(result):
+    """
+    Function to get lyrics from Suno lyrics generation response
+    
+    Args:
+        result: API response
+        
+    Returns:
+        Generated lyrics or None
+    """
+    # Get lyrics from response
+    response_data = result.get("data", {})
+    lyrics = response_data.get("lyrics")
+    
+    if not lyrics:
+        print("ERROR: No lyrics in response")
+        return None
+        
+    print(f"Lyrics generation successful!")
+    print(f"Lyrics: {lyrics}")
+    
+    return lyrics
+
 def generate_lyrics(prompt):
     """
     Function to generate lyrics using Suno API
@@ -409,34 +607,26 @@ def generate_lyrics(prompt):
         print(f"\nGenerating lyrics with Suno API...")
         print(f"Prompt: '{prompt}'")
         
+        # Return cached lyrics for the same (normalized) prompt
+        cached = lyrics_cache.get(prompt)
+        if cached:
+            print("Lyrics served from cache")
+            return cached
+        
         # Check API key
         if not SUNO_API_KEY:
             print("ERROR: SUNO_API_KEY is not set")
             return None
         
-        # Generate task ID
-        task_id = str(uuid.uuid4())
-        
         # Prepare request data
-        data = {
-            "prompt": prompt,
-            "taskId": task_id
-        }
+        data = build_lyrics_request(prompt)
         
         # Call lyrics generation API
         result = call_suno_api("/api/v1/lyrics", data)
         
-        # Get lyrics from response
-        response_data = result.get("data", {})
-        lyrics = response_data.get("lyrics")
-        
-        if not lyrics:
-            print("ERROR: No lyrics in response")
-            return None
-            
-        print(f"Lyrics generation successful!")
-        print(f"Lyrics: {lyrics}")
-        
+        lyrics = parse_lyrics_response(result)
+        if lyrics:
+            lyrics_cache.put(prompt, lyrics)
         return lyrics
         
     except Exception as e:
@@ -445,42 +635,59 @@ def generate_lyrics(prompt):
         traceback.print_exc()
         return None
 
+def link_file(src_path, dest_path):
+    """
+    Function to place a cached file at another path without copying when possible
+    
+    Args:
+        src_path: Existing file
+        dest_path: Destination path (replaced atomically)
+    """
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(src_path, tmp_path)
+    except OSError:
+        # Different filesystem (or no hard link support): copy instead
+        shutil.copyfile(src_path, tmp_path)
+    os.replace(tmp_path, dest_path)
+
 def download_file(url, filename=None, output_dir=None):
     """
     Function to download file from URL
     
+    Downloads go through the content-addressed media cache: a URL is
+    transferred once (concurrent requests share the transfer) and repeat
+    requests are served from disk.
+    
     Args:
         url: URL to download
-        filename: Filename to save (auto-generated if not specified)
+        filename: Filename to save (if neither filename nor output_dir is
+            specified, the cached object <sha256><ext> is returned as is)
         output_dir: Output directory (default if not specified)
         
     Returns:
         Local file path
     """
     try:
+        print(f"\nDownloading file from {url}...")
+        
+        cached_path = get_media_cache().fetch(url, download_to_file)
+        if not cached_path:
+            return None
+        
+        if not filename and not output_dir:
+            print(f"Download completed: {cached_path}")
+            return cached_path
+        
         if not output_dir:
             output_dir = OUTPUT_DIR
-            
         if not filename:
-            # Get filename from URL or use UUID
-            filename = os.path.basename(url.split('?')[0]) or f"file_{uuid.uuid4()}"
+            filename = os.path.basename(cached_path)
         
         local_path = os.path.join(output_dir, filename)
-        
-        print(f"\nDownloading file from {url} to {local_path}...")
-        
-        # Download file
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            print(f"Download completed: {local_path}")
-            return local_path
-        else:
-            print(f"Download failed: {response.status_code} - {response.text}")
-            return None
+        link_file(cached_path, local_path)
+        print(f"Download completed: {local_path}")
+        return local_path
             
     except Exception as e:
         print(f"Error downloading file: {str(e)}")
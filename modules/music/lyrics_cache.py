@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+LYRICS_CACHE_TTL = float(os.getenv("LYRICS_CACHE_TTL", 7 * 24 * 60 * 60))
+LYRICS_CACHE_MAX_ENTRIES = int(os.getenv("LYRICS_CACHE_MAX_ENTRIES", 1000))
+# SQLite file of the on-disk tier (empty to keep the cache in memory only)
+LYRICS_CACHE_PATH = os.getenv("LYRICS_CACHE_PATH", "")
+LYRICS_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LYRICS_CACHE_DISK_MAX_ENTRIES", 100000))
+# The on-disk tier is trimmed (expired and over-cap rows) once per this many writes of a process
+LYRICS_CACHE_TRIM_INTERVAL = int(os.getenv("LYRICS_CACHE_TRIM_INTERVAL", 100))
+
+DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lyrics (
+    key TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    lyrics TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lyrics_created_at ON lyrics(created_at);
+"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a lyrics prompt for cache lookups
+
+    NFKC folds full-width / half-width forms (common in Japanese input),
+    case is folded and runs of whitespace collapse to one space.
+
+    Args:
+        prompt: Lyrics generation prompt
+
+    Returns:
+        Normalized prompt
+    """
+    prompt = unicodedata.normalize("NFKC", prompt or "")
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+class LyricsCache:
+    """
+    LRU + TTL cache of generated lyrics keyed by normalized prompt
+
+    Hits are served from an in-memory OrderedDict. With a path, entries are
+    also written to a SQLite file (WAL mode) that survives restarts and is
+    shared by worker processes; memory misses fall back to it and promote
+    the entry.
+    """
+
+    def __init__(self, ttl: float = LYRICS_CACHE_TTL, max_entries: int = LYRICS_CACHE_MAX_ENTRIES, path: Optional[str] = LYRICS_CACHE_PATH or None, disk_max_entries: int = LYRICS_CACHE_DISK_MAX_ENTRIES):
+        """
+        Args:
+            ttl: Lifetime of cached lyrics (seconds)
+            max_entries: Number of entries kept in memory
+            path: SQLite file of the on-disk tier (None to disable)
+            disk_max_entries: Number of entries kept on disk (oldest dropped first; may be
+                exceeded by up to LYRICS_CACHE_TRIM_INTERVAL writes per process between trims)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+        self._lock = threading.Lock()
+        # key -> (expires_at, lyrics), wall clock so that disk entries keep their age
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._local = threading.local()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._disk_writes = 0
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection().executescript(DISK_SCHEMA)
+
+    @staticmethod
+    def key(prompt: str) -> str:
+        return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key, expires_at, lyrics):
+        self._memory[key] = (expires_at, lyrics)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, prompt: str) -> Optional[str]:
+        """
+        Look up cached lyrics for a prompt
+
+        Args:
+            prompt: Lyrics generation prompt
+
+        Returns:
+            Cached lyrics, or None on a miss
+        """
+        key = self.key(prompt)
+        now = time.time()
+        lyrics = self._get_memory(key, now)
+        if lyrics is not None:
+            return lyrics
+        return self._get_disk(key, now)
+
+    async def get_async(self, prompt: str) -> Optional[str]:
+        """
+        Async counterpart of get (the disk tier is read in a worker thread)
+
+        Args:
+            prompt: Lyrics generation prompt
+
+        Returns:
+            Cached lyrics, or None on a miss
+        """
+        key = self.key(prompt)
+        now = time.time()
+        lyrics = self._get_memory(key, now)
+        if lyrics is not None:
+            return lyrics
+        if not self.path:
+            return self._get_disk(key, now)
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    return entry[1]
+                del self._memory[key]
+        return None
+
+    def _get_disk(self, key, now):
+        """Read the disk tier (counts the miss if the prompt is not there either)"""
+        if self.path:
+            try:
+                row = self._connection().execute(
+                    "SELECT lyrics, created_at FROM lyrics WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Lyrics cache disk read failed: {str(e)}")
+                row = None
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[1] + self.ttl, row[0])
+                    self._disk_hits += 1
+                return row[0]
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, prompt: str, lyrics: str) -> None:
+        """
+        Cache lyrics generated for a prompt
+
+        Args:
+            prompt: Lyrics generation prompt
+            lyrics: Generated lyrics
+        """
+        key = self.key(prompt)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now + self.ttl, lyrics)
+            self._disk_writes += 1
+            # First write of the process, then every LYRICS_CACHE_TRIM_INTERVAL writes
+            trim = self._disk_writes % LYRICS_CACHE_TRIM_INTERVAL == 1
+        if self.path:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO lyrics (key, prompt, lyrics, created_at) VALUES (?, ?, ?, ?)",
+                    (key, prompt, lyrics, now)
+                )
+                if trim:
+                    self._trim(conn, now)
+            except sqlite3.Error as e:
+                print(f"Lyrics cache disk write failed: {str(e)}")
+
+    def _trim(self, conn, now):
+        """Drop expired rows and the oldest rows beyond disk_max_entries"""
+        conn.execute("DELETE FROM lyrics WHERE created_at <= ?", (now - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
+        if count > self.disk_max_entries:
+            conn.execute(
+                "DELETE FROM lyrics WHERE key IN (SELECT key FROM lyrics ORDER BY created_at LIMIT ?)",
+                (count - self.disk_max_entries,)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            self._connection().execute("DELETE FROM lyrics")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "entries": len(self._memory),
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "path": self.path
+            }
+        if self.path:
+            stats["disk_entries"] = self._connection().execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
+        return stats
+
+
+lyrics_cache = LyricsCache()
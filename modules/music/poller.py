@@ -0,0 +1,293 @@
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from modules.callback.events import callback_stage, STAGE_COMPLETE, STAGE_ERROR
+from modules.callback.store import CallbackBackend
+from modules.music.status_cache import is_terminal_status, SUCCESS_STATUSES
+
+# Load environment variables
+load_dotenv()
+
+# (task age limit, poll interval) in seconds: poll fast at first, slower with age
+DEFAULT_SCHEDULE: List[Tuple[float, float]] = [(60, 5), (180, 10), (600, 30), (float("inf"), 60)]
+POLLER_FIRST_DELAY = float(os.getenv("TASK_POLLER_FIRST_DELAY", 5))
+POLLER_MAX_AGE = float(os.getenv("TASK_POLLER_MAX_AGE", 1800))
+POLLER_WORKERS = int(os.getenv("TASK_POLLER_WORKERS", 4))
+
+# Marks payloads built from a status poll (top-level "source"; real webhooks have none)
+POLL_SOURCE = "status_poll"
+# Track fields the webhook sends in camelCase like the status API (the rest are snake_case)
+CAMEL_CASE_TRACK_FIELDS = {"createTime"}
+
+
+def webhook_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a track of the status API (sunoData item) to the webhook's field names
+
+    The status API uses camelCase (audioUrl, streamAudioUrl, imageUrl, ...);
+    the webhook's data.data items use snake_case (audio_url, ...).
+
+    Args:
+        track: Track from response.sunoData
+
+    Returns:
+        Track with webhook field names
+    """
+    if not isinstance(track, dict):
+        return track
+    return {
+        key if key in CAMEL_CASE_TRACK_FIELDS else re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", key).lower(): value
+        for key, value in track.items()
+    }
+
+
+def status_to_callback(task_id: str, status: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a terminal Suno task status into a callback payload
+
+    The payload is the envelope of Suno's webhook ({code, msg, data:
+    {callbackType, task_id, data: [tracks]}}) with tracks renamed to the
+    webhook's field names, so that the callback store indexes it (task ID,
+    audio IDs) and waiters and clients handle it like a real callback. It
+    differs only by the top-level "source": "status_poll" marker, and by
+    carrying whatever track fields the status API returned.
+
+    Args:
+        task_id: Task ID
+        status: Terminal task status information
+
+    Returns:
+        Callback payload
+    """
+    if str(status.get("status") or "").upper() in SUCCESS_STATUSES:
+        response = status.get("response") or {}
+        tracks = response.get("sunoData") or response.get("data") or []
+        return {
+            "code": 200,
+            "msg": "All generated successfully.",
+            "source": POLL_SOURCE,
+            "data": {
+                "callbackType": STAGE_COMPLETE,
+                "task_id": task_id,
+                "data": [webhook_track(track) for track in tracks]
+            }
+        }
+    return {
+        "code": status.get("errorCode") or 500,
+        "msg": status.get("errorMessage") or f"Task {status.get('status')}",
+        "source": POLL_SOURCE,
+        "data": {
+            "callbackType": STAGE_ERROR,
+            "task_id": task_id,
+            "data": []
+        }
+    }
+
+
+class _Task:
+    __slots__ = ("task_id", "created_at", "next_poll_at", "polls", "in_flight")
+
+    def __init__(self, task_id, created_at, next_poll_at):
+        self.task_id = task_id
+        self.created_at = created_at
+        self.next_poll_at = next_poll_at
+        self.polls = 0
+        self.in_flight = False
+
+
+class TaskPoller:
+    """
+    Central background poller for pending Suno tasks
+
+    Handlers register the task IDs they submit with track(). One scheduler
+    thread polls each pending task on an adaptive schedule (fast while
+    young, slower with age) and writes terminal results into the callback
+    store through on_result, exactly as if the webhook had arrived. Tasks
+    whose real callback lands first are dropped without polling. Upstream
+    status traffic therefore scales with pending tasks, not with waiting
+    clients, and lost or late webhooks are still resolved.
+    """
+
+    def __init__(
+        self,
+        check_status: Callable[[str], Optional[Dict[str, Any]]],
+        store: CallbackBackend,
+        on_result: Callable[[Dict[str, Any]], Any],
+        schedule: List[Tuple[float, float]] = DEFAULT_SCHEDULE,
+        first_delay: float = POLLER_FIRST_DELAY,
+        max_age: float = POLLER_MAX_AGE,
+        workers: int = POLLER_WORKERS
+    ):
+        """
+        Args:
+            check_status: Function returning a task's status information (or None on error)
+            store: Callback store checked for already delivered callbacks
+            on_result: Function storing a synthesized callback payload
+            schedule: List of (task age limit, poll interval) in seconds
+            first_delay: Delay before the first poll (gives the webhook a chance)
+            max_age: Tasks older than this are given up (seconds)
+            workers: Number of concurrent status requests
+        """
+        self.check_status = check_status
+        self.store = store
+        self.on_result = on_result
+        self.schedule = sorted(schedule)
+        self.first_delay = first_delay
+        self.max_age = max_age
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._tasks: Dict[str, _Task] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._polls = 0
+        self._resolved_by_poll = 0
+        self._resolved_by_callback = 0
+        self._expired = 0
+
+    def interval(self, age: float) -> float:
+        """Poll interval for a task of the given age (seconds)"""
+        for age_limit, interval in self.schedule:
+            if age < age_limit:
+                return interval
+        return self.schedule[-1][1]
+
+    def _schedule(self, task: _Task, at: float) -> None:
+        task.next_poll_at = at
+        heapq.heappush(self._heap, (at, next(self._counter), task.task_id))
+        self._cond.notify()
+
+    def track(self, task_id: Optional[str]) -> None:
+        """
+        Start polling a submitted task until it completes
+
+        Args:
+            task_id: Task ID returned by Suno
+        """
+        if not task_id:
+            return
+        with self._cond:
+            if task_id in self._tasks:
+                return
+            now = time.monotonic()
+            task = self._tasks[task_id] = _Task(task_id, now, now)
+            self._schedule(task, now + self.first_delay)
+
+    def untrack(self, task_id: str) -> None:
+        with self._cond:
+            self._tasks.pop(task_id, None)
+
+    def pending(self) -> List[str]:
+        with self._cond:
+            return list(self._tasks)
+
+    def _delivered(self, task_id: str) -> bool:
+        _, info = self.store.find(task_id)
+        return info is not None and callback_stage(info.get("data")) in (STAGE_COMPLETE, STAGE_ERROR)
+
+    def _poll(self, task: _Task) -> None:
+        resolved = False
+        try:
+            if self._delivered(task.task_id):
+                with self._cond:
+                    self._resolved_by_callback += 1
+                resolved = True
+                return
+            status = self.check_status(task.task_id)
+            with self._cond:
+                self._polls += 1
+                task.polls += 1
+            if is_terminal_status(status) and not self._delivered(task.task_id):
+                print(f"Task {task.task_id} resolved by status poll: {status.get('status')}")
+                self.on_result(status_to_callback(task.task_id, status))
+                with self._cond:
+                    self._resolved_by_poll += 1
+                resolved = True
+            elif is_terminal_status(status):
+                resolved = True
+        except Exception as e:
+            print(f"Error polling task {task.task_id}: {str(e)}")
+        finally:
+            with self._cond:
+                task.in_flight = False
+                if resolved:
+                    self._tasks.pop(task.task_id, None)
+                elif task.task_id in self._tasks:
+                    age = time.monotonic() - task.created_at
+                    if age >= self.max_age:
+                        print(f"Giving up polling task {task.task_id} after {age:.0f} seconds")
+                        self._tasks.pop(task.task_id, None)
+                        self._expired += 1
+                    else:
+                        self._schedule(task, time.monotonic() + self.interval(age))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    # Drop heap entries of untracked or rescheduled tasks
+                    while self._heap:
+                        at, _, task_id = self._heap[0]
+                        task = self._tasks.get(task_id)
+                        if task is None or task.in_flight or task.next_poll_at != at:
+                            heapq.heappop(self._heap)
+                            continue
+                        break
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, task_id = heapq.heappop(self._heap)
+                task = self._tasks[task_id]
+                task.in_flight = True
+            self._executor.submit(self._poll, task)
+
+    def start(self) -> "TaskPoller":
+        """
+        Start the scheduler thread (daemon)
+
+        Returns:
+            self
+        """
+        with self._cond:
+            if self._thread is not None:
+                return self
+            self._stopped = False
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="task-poller")
+            self._thread = threading.Thread(target=self._run, name="task-poller", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._tasks),
+                "polls": self._polls,
+                "resolved_by_poll": self._resolved_by_poll,
+                "resolved_by_callback": self._resolved_by_callback,
+                "expired": self._expired,
+                "max_age": self.max_age
+            }
@@ -0,0 +1,269 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Retry policy settings (seconds)
+RETRY_BASE_DELAY = float(os.getenv("SUNO_RETRY_BASE_DELAY", 1))
+RETRY_MAX_DELAY = float(os.getenv("SUNO_RETRY_MAX_DELAY", 20))
+# Give up instead of sleeping when the server asks us to wait longer than this
+RETRY_AFTER_MAX = float(os.getenv("SUNO_RETRY_AFTER_MAX", 30))
+
+# Circuit breaker settings
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("SUNO_BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("SUNO_BREAKER_RECOVERY_TIMEOUT", 30))
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# Suno "code" values worth retrying (430: call frequency too high, 455: maintenance)
+RETRYABLE_API_CODES = {430, 455}
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class SunoAPIError(Exception):
+    """
+    Error returned by (or while reaching) the Suno API
+
+    Attributes:
+        status_code: HTTP status code or Suno response code (None for network errors)
+        retryable: Whether the same request may succeed if retried
+        retry_after: Delay requested by the server (seconds), if any
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(SunoAPIError):
+    """Raised without calling the API while an endpoint's circuit is open"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(
+            f"Circuit open for {endpoint}: Suno API unavailable, retry in {retry_after:.0f} seconds",
+            status_code=503,
+            retryable=False,
+            retry_after=retry_after
+        )
+        self.endpoint = endpoint
+
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def is_retryable_api_code(code: Any) -> bool:
+    return isinstance(code, int) and (code in RETRYABLE_API_CODES or code >= 500)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header value
+
+    Args:
+        value: Header value (delay in seconds or HTTP date)
+
+    Returns:
+        Delay in seconds, or None if missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """
+    Exponential backoff with full jitter
+
+    Args:
+        attempt: Number of failed attempts so far (1 for the first retry)
+        base_delay: Delay cap of the first retry (seconds)
+        max_delay: Upper bound of any delay (seconds)
+
+    Returns:
+        Delay before the next attempt (seconds)
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+
+def next_retry_delay(error: Exception, attempt: int, max_retries: int, base_delay: Optional[float] = None) -> Optional[float]:
+    """
+    Decide whether (and after how long) a failed call should be retried
+
+    Args:
+        error: Error raised by the attempt
+        attempt: Number of failed attempts so far
+        max_retries: Maximum number of attempts
+        base_delay: Backoff base delay (default: SUNO_RETRY_BASE_DELAY)
+
+    Returns:
+        Delay in seconds, or None to give up
+    """
+    if attempt >= max_retries or not getattr(error, "retryable", False):
+        return None
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        # Honour the server's request, but do not hold a worker for minutes
+        return retry_after if retry_after <= RETRY_AFTER_MAX else None
+    return backoff_delay(attempt, RETRY_BASE_DELAY if base_delay is None else base_delay)
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker
+
+    After failure_threshold consecutive retryable failures (5xx, timeouts,
+    connection errors) the circuit opens and calls fail immediately with
+    CircuitOpenError. After recovery_timeout a single probe call is let
+    through (half open); its success closes the circuit, its failure opens
+    it again. Client errors (4xx, rejected parameters) do not count as
+    failures, but only a successful call closes a half-open circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._total_failures = 0
+        self._total_rejected = 0
+        self._times_opened = 0
+        self._last_error: Optional[str] = None
+
+    def before_call(self) -> None:
+        """
+        Check the circuit before calling the endpoint
+
+        Raises:
+            CircuitOpenError: If the circuit is open (or a half-open probe is already running)
+        """
+        with self._lock:
+            if self._state == STATE_OPEN:
+                remaining = self._opened_at + self.recovery_timeout - time.monotonic()
+                if remaining > 0:
+                    self._total_rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._state = STATE_HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == STATE_HALF_OPEN:
+                if self._probe_in_flight:
+                    self._total_rejected += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != STATE_CLOSED:
+                print(f"Circuit for {self.name} closed")
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """
+        Let another half-open probe through when a call ended without a verdict
+        (cancelled, or failed before the endpoint answered)
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self, error: Exception) -> None:
+        """
+        Record a failed call (only retryable errors count against the circuit)
+
+        Args:
+            error: Error raised by the call
+        """
+        with self._lock:
+            self._probe_in_flight = False
+            if not getattr(error, "retryable", False):
+                # Does not count, but only a successful probe closes the circuit
+                return
+            self._failures += 1
+            self._total_failures += 1
+            self._last_error = str(error)
+            if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != STATE_OPEN:
+                    self._times_opened += 1
+                    print(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self._state == STATE_OPEN:
+                retry_in = max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+            return {
+                "endpoint": self.name,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_timeout": self.recovery_timeout,
+                "retry_in": retry_in,
+                "total_failures": self._total_failures,
+                "total_rejected": self._total_rejected,
+                "times_opened": self._times_opened,
+                "last_error": self._last_error
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """
+    Function to get the circuit breaker of an endpoint (created on first use)
+
+    Args:
+        endpoint: API endpoint
+
+    Returns:
+        Circuit breaker shared by all threads and event loops of this process
+    """
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """
+    Function to get the state of every circuit breaker (for monitoring)
+
+    Returns:
+        Dictionary of endpoint to breaker state
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
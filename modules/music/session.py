@@ -0,0 +1,106 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from typing import Optional, Tuple
+
+# Load environment variables
+load_dotenv()
+
+# Connection pool settings
+# Number of per-host pools kept alive, and maximum connections per host
+POOL_CONNECTIONS = int(os.getenv("SUNO_POOL_CONNECTIONS", 10))
+POOL_MAXSIZE = int(os.getenv("SUNO_POOL_MAXSIZE", 20))
+# Block (instead of opening extra, non-pooled connections) when a host's pool is exhausted
+POOL_BLOCK = os.getenv("SUNO_POOL_BLOCK", "true").lower() == "true"
+
+# Timeouts (seconds)
+CONNECT_TIMEOUT = float(os.getenv("SUNO_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("SUNO_READ_TIMEOUT", 60))
+DOWNLOAD_READ_TIMEOUT = float(os.getenv("DOWNLOAD_READ_TIMEOUT", 120))
+
+# Media downloads use their own pools (never blocking), so long transfers
+# and parallel ranges cannot hold up Suno API calls or wait behind them
+DOWNLOAD_POOL_MAXSIZE = int(os.getenv("DOWNLOAD_POOL_MAXSIZE", 32))
+
+_session: Optional[requests.Session] = None
+_download_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _new_session(pool_maxsize: int, pool_block: bool) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Function to get the shared keep-alive HTTP session
+
+    The session is created once per process. Its connection pools are
+    thread-safe, so Suno API calls from every request thread reuse open
+    TCP/TLS connections instead of handshaking each time.
+
+    Returns:
+        Shared requests session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _new_session(POOL_MAXSIZE, POOL_BLOCK)
+    return _session
+
+
+def get_download_session() -> requests.Session:
+    """
+    Function to get the shared keep-alive HTTP session for media downloads
+
+    Separate from get_session(): its pools never block, so a burst of
+    downloads opens extra connections instead of queueing behind (or in
+    front of) Suno API calls.
+
+    Returns:
+        Shared requests session
+    """
+    global _download_session
+    if _download_session is None:
+        with _session_lock:
+            if _download_session is None:
+                _download_session = _new_session(DOWNLOAD_POOL_MAXSIZE, False)
+    return _download_session
+
+
+def get_timeout(read_timeout: Optional[float] = None) -> Tuple[float, float]:
+    """
+    Function to get (connect, read) timeout for a request
+
+    Args:
+        read_timeout: Read timeout (default: SUNO_READ_TIMEOUT)
+
+    Returns:
+        Tuple of connect timeout and read timeout (seconds)
+    """
+    return (CONNECT_TIMEOUT, READ_TIMEOUT if read_timeout is None else read_timeout)
+
+
+def close_session() -> None:
+    """
+    Function to close the shared sessions and their pooled connections
+    """
+    global _session, _download_session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        if _download_session is not None:
+            _download_session.close()
+            _download_session = None
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+from typing import Any
+
+
+class Flight:
+    """
+    One in-flight upstream call whose result is shared by every concurrent caller
+
+    The caller that created the flight performs the call and passes the
+    result to finish(); the others block in wait() or await wait_async()
+    (from any thread or event loop).
+    """
+
+    __slots__ = ("done", "result", "_async_waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self._async_waiters = []
+
+    def finish(self, result: Any) -> None:
+        self.result = result
+        self.done.set()
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop already closed (waiter gave up)
+                pass
+
+    def wait(self) -> Any:
+        self.done.wait()
+        return self.result
+
+    async def wait_async(self) -> Any:
+        event = asyncio.Event()
+        self._async_waiters.append((asyncio.get_running_loop(), event))
+        # Re-check after registering: finish() may have run in between
+        if not self.done.is_set():
+            await event.wait()
+        return self.result
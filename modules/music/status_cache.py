@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from modules.music.singleflight import Flight
+
+# Load environment variables
+load_dotenv()
+
+# Freshness of non-terminal statuses (seconds); terminal ones are kept until evicted
+STATUS_CACHE_TTL = float(os.getenv("SUNO_STATUS_CACHE_TTL", 3))
+STATUS_CACHE_MAX_ENTRIES = int(os.getenv("SUNO_STATUS_CACHE_MAX_ENTRIES", 5000))
+
+SUCCESS_STATUSES = {"SUCCESS", "COMPLETE", "COMPLETED"}
+
+
+def is_terminal_status(status_result: Any) -> bool:
+    """
+    Check whether a task status can no longer change
+
+    Args:
+        status_result: Task status information (data of the status response)
+
+    Returns:
+        True for success and failure states (TEXT_SUCCESS, FIRST_SUCCESS and PENDING are not terminal)
+    """
+    if not isinstance(status_result, dict):
+        return False
+    status = str(status_result.get("status") or "").upper()
+    return status in SUCCESS_STATUSES or "FAIL" in status or "ERROR" in status or "EXCEPTION" in status
+
+
+class StatusCache:
+    """
+    Singleflight and short-TTL cache in front of the Suno status endpoint
+
+    Concurrent callers asking for the same task_id share one upstream
+    request (from any thread or event loop). Results are cached for ttl
+    seconds, terminal states until they are evicted by LRU. Failed lookups
+    (None) are shared with the callers that were waiting but not cached.
+    """
+
+    def __init__(self, ttl: float = STATUS_CACHE_TTL, max_entries: int = STATUS_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            ttl: Freshness of non-terminal statuses (seconds)
+            max_entries: Number of cached task statuses (least recently used dropped first)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # task_id -> (expires_at or None for terminal, status)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._flights: Dict[str, Flight] = {}
+        self._hits = 0
+        self._coalesced = 0
+        self._fetches = 0
+
+    def _cached(self, task_id):
+        entry = self._cache.get(task_id)
+        if entry is None:
+            return None
+        expires_at, status = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._cache[task_id]
+            return None
+        self._cache.move_to_end(task_id)
+        self._hits += 1
+        return status
+
+    def _claim(self, task_id):
+        """Return (cached status, flight, is_leader) under the lock"""
+        with self._lock:
+            status = self._cached(task_id)
+            if status is not None:
+                return status, None, False
+            flight = self._flights.get(task_id)
+            if flight is not None:
+                self._coalesced += 1
+                return None, flight, False
+            flight = self._flights[task_id] = Flight()
+            self._fetches += 1
+            return None, flight, True
+
+    def _complete(self, task_id, flight, result):
+        with self._lock:
+            if result is not None:
+                self._store(task_id, result)
+            self._flights.pop(task_id, None)
+        flight.finish(result)
+
+    def _store(self, task_id, status):
+        expires_at = None if is_terminal_status(status) else time.monotonic() + self.ttl
+        self._cache[task_id] = (expires_at, status)
+        self._cache.move_to_end(task_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def put(self, task_id: str, status: Dict[str, Any]) -> None:
+        """
+        Store a status obtained elsewhere (e.g. by the background poller)
+
+        Args:
+            task_id: Task ID
+            status: Task status information
+        """
+        with self._lock:
+            self._store(task_id, status)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached status without fetching"""
+        with self._lock:
+            return self._cached(task_id)
+
+    def get_or_fetch(self, task_id: str, fetch: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached status, or fetch it once for all concurrent callers
+
+        Args:
+            task_id: Task ID
+            fetch: Function performing the upstream status request
+
+        Returns:
+            Task status information, or None if the request failed
+        """
+        status, flight, leader = self._claim(task_id)
+        if status is not None:
+            return status
+        if not leader:
+            return flight.wait()
+        result = None
+        try:
+            result = fetch()
+        finally:
+            self._complete(task_id, flight, result)
+        return result
+
+    async def get_or_fetch_async(self, task_id: str, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        """
+        Asyncio counterpart of get_or_fetch(); does not block the event loop
+
+        Args:
+            task_id: Task ID
+            fetch: Coroutine function performing the upstream status request
+
+        Returns:
+            Task status information, or None if the request failed
+        """
+        status, flight, leader = self._claim(task_id)
+        if status is not None:
+            return status
+        if not leader:
+            return await flight.wait_async()
+        result = None
+        try:
+            result = await fetch()
+        finally:
+            self._complete(task_id, flight, result)
+        return result
+
+    def invalidate(self, task_id: str) -> None:
+        with self._lock:
+            self._cache.pop(task_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "in_flight": len(self._flights),
+                "hits": self._hits,
+                "coalesced": self._coalesced,
+                "fetches": self._fetches,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries
+            }
+
+
+status_cache = StatusCache()
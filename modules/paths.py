@@ -0,0 +1,6 @@
+import os
+
+# Repository root (modules/ sits directly below it)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generated files and cache databases, independent of the server's working directory
+OUTPUT_DIR = os.path.join(ROOT_DIR, "output")
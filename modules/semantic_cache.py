@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from modules.embedding import PROMPT_EMBEDDING_MODEL, model_loaded
+
+# Load environment variables
+load_dotenv()
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity of a prompt to a cached one to count as a near duplicate
+# (sentence embeddings: rewordings of the same request score about 0.9 and above)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+# Cached generations older than this are not offered (media URLs expire upstream)
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 7 * 24 * 60 * 60))
+# Submitted generations waiting for their result
+SEMANTIC_CACHE_MAX_PENDING = int(os.getenv("SEMANTIC_CACHE_MAX_PENDING", 1000))
+
+
+def params_key(kind: str, params: Dict[str, Any]) -> str:
+    """
+    Key of the exact-match parameters a near-duplicate must share (genre, model, ...)
+
+    Args:
+        kind: Generation kind ("music", "video")
+        params: Generation parameters other than the prompt
+
+    Returns:
+        Hex digest
+    """
+    normalized = {name: value.strip().casefold() if isinstance(value, str) else value for name, value in params.items()}
+    payload = json.dumps([kind, normalized], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    """
+    Near-duplicate prompt cache over sentence embeddings
+
+    Completed generations are added with the embedding of their prompt to a
+    bounded in-process vector index (a float32 matrix allocated on the
+    first insert; the oldest slot is reused when full). A lookup returns the most similar
+    completed generation with the same exact-match parameters whose cosine
+    similarity reaches the threshold. Vectors are unit length, so the search
+    is one matrix-vector product.
+
+    Embeddings need torch and transformers; without them the cache disables
+    itself and every lookup misses. start_warm_up() loads the model in the
+    background at startup; until it is ready, lookups miss instead of
+    loading it inside a request.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        max_pending: int = SEMANTIC_CACHE_MAX_PENDING,
+        enabled: bool = SEMANTIC_CACHE_ENABLED
+    ):
+        """
+        Args:
+            embed: Function returning a unit-length embedding (default: modules.embedding.get_prompt_embedding)
+            threshold: Minimum cosine similarity of a match
+            max_entries: Capacity of the vector index
+            ttl: Age after which cached generations are not matched (seconds)
+            max_pending: Number of submitted generations remembered until completion
+            enabled: Whether lookups and inserts are performed
+        """
+        # Default model: warm once loaded in this process (a custom embed is always ready)
+        self._ready = threading.Event()
+        if embed is None:
+            from modules.embedding import get_prompt_embedding as embed
+            if model_loaded(PROMPT_EMBEDDING_MODEL):
+                self._ready.set()
+        else:
+            self._ready.set()
+        self._warming = False
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # Allocated on the first insert, sized by the model's embedding (processes that never cache pay nothing)
+        self._vectors: Optional[np.ndarray] = None
+        self._created_at: Optional[np.ndarray] = None
+        self._groups: List[Optional[str]] = [None] * max_entries
+        self._results: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._next_slot = 0
+        self._size = 0
+        # job id -> (group, vector, prompt), waiting for the generation to complete
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def encode(self, prompt: str) -> Optional[np.ndarray]:
+        """
+        Embed a prompt (None if embeddings are unavailable)
+
+        Args:
+            prompt: Generation prompt
+
+        Returns:
+            Unit-length float32 vector or None
+        """
+        if not self.enabled or not prompt:
+            return None
+        if self._warming and not self._ready.is_set():
+            # Model still loading in the background: miss rather than block the request
+            return None
+        return self._embed(prompt)
+
+    def start_warm_up(self) -> None:
+        """
+        Load the embedding model in a daemon thread (call once at server startup)
+        """
+        if not self.enabled or self._ready.is_set():
+            return
+        self._warming = True
+
+        def warm_up():
+            started = time.time()
+            if self._embed("warm up") is not None:
+                print(f"Semantic cache embedding model ready in {time.time() - started:.1f}s")
+            self._ready.set()
+
+        threading.Thread(target=warm_up, name="semantic-cache-warm-up", daemon=True).start()
+
+    def _embed(self, prompt):
+        try:
+            return np.asarray(self.embed(prompt), dtype=np.float32)
+        except ImportError as e:
+            print(f"Semantic cache disabled (embedding model unavailable): {str(e)}")
+            self.enabled = False
+        except Exception as e:
+            print(f"Error embedding prompt: {str(e)}")
+        return None
+
+    def lookup(self, kind: str, params: Dict[str, Any], vector: Optional[np.ndarray]) -> Optional[Dict[str, Any]]:
+        """
+        Find the closest completed generation of a prompt embedding
+
+        Args:
+            kind: Generation kind ("music", "video")
+            params: Exact-match generation parameters
+            vector: Prompt embedding from encode()
+
+        Returns:
+            Dictionary with similarity, prompt and result, or None if nothing is close enough
+        """
+        if vector is None:
+            return None
+        group = params_key(kind, params)
+        with self._lock:
+            if self._size:
+                scores = self._vectors[:self._size] @ vector
+                fresh = self._created_at[:self._size] > time.time() - self.ttl
+                same_group = np.fromiter((g == group for g in self._groups[:self._size]), dtype=bool, count=self._size)
+                scores = np.where(fresh & same_group, scores, -1.0)
+                best = int(np.argmax(scores))
+                similarity = float(scores[best])
+                if similarity >= self.threshold:
+                    self._hits += 1
+                    match = dict(self._results[best])
+                    match["similarity"] = round(similarity, 4)
+                    return match
+            self._misses += 1
+        return None
+
+    def add(self, kind: str, params: Dict[str, Any], vector: Optional[np.ndarray], prompt: str, result: Dict[str, Any]) -> None:
+        """
+        Add a completed generation to the index
+
+        Args:
+            kind: Generation kind
+            params: Exact-match generation parameters
+            vector: Prompt embedding from encode()
+            prompt: Generation prompt
+            result: Generation result served on a match
+        """
+        if vector is None:
+            return
+        self._insert(params_key(kind, params), vector, prompt, result)
+
+    def _insert(self, group, vector, prompt, result):
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._created_at = np.zeros(self.max_entries, dtype=np.float64)
+            slot = self._next_slot
+            self._vectors[slot] = vector
+            self._groups[slot] = group
+            self._created_at[slot] = time.time()
+            self._results[slot] = {"prompt": prompt, "result": result}
+            self._next_slot = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def add_pending(self, job_id: str, kind: str, params: Dict[str, Any], vector: Optional[np.ndarray], prompt: str) -> None:
+        """
+        Remember a submitted generation until complete_pending() receives its result
+
+        Args:
+            job_id: Upstream task ID
+            kind: Generation kind
+            params: Exact-match generation parameters
+            vector: Prompt embedding from encode()
+            prompt: Generation prompt
+        """
+        if vector is None or not job_id:
+            return
+        with self._lock:
+            self._pending[job_id] = (params_key(kind, params), vector, prompt)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+
+    def complete_pending(self, job_id: str, result: Dict[str, Any]) -> bool:
+        """
+        Add a pending generation to the index once its result is known
+
+        Args:
+            job_id: Upstream task ID
+            result: Generation result served on a match
+
+        Returns:
+            True if the job was pending
+        """
+        with self._lock:
+            pending = self._pending.pop(job_id, None)
+        if pending is None:
+            return False
+        group, vector, prompt = pending
+        self._insert(group, vector, prompt, result)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "ready": self._ready.is_set(),
+                "entries": self._size,
+                "pending": len(self._pending),
+                "hits": self._hits,
+                "misses": self._misses,
+                "threshold": self.threshold,
+                "max_entries": self.max_entries
+            }
+
+
+semantic_cache = SemanticCache()
@@ -7,10 +7,20 @@ from moviepy.video.io.VideoFileClip import VideoFileClip
 from moviepy.audio.io.AudioFileClip import AudioFileClip
 import ffmpeg
 import random
-import boto3
 import uuid
 import hashlib
-from botocore.exceptions import ClientError
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from modules.media.downloader import download_to_file
+from modules.media.s3 import get_s3_uploader
+from modules.media.probe import probe_cache
+from modules.media.aac_cache import get_aac_cache, AAC_CACHE_ENABLED
+from modules.media.segment import get_segment_selector
+from modules.video.merge_cache import merge_cache
+from modules.video.merge_engine import scratch_root
+from modules.video.stream_merge import stream_merge_to_s3
 
 # ロギングの基本設定
 logging.basicConfig(
@@ -36,6 +46,13 @@ CALLBACK_URL = os.getenv("CALLBACK_URL", "http://localhost:5001")
 SEGMIND_API_KEY = os.getenv("SEGMIND_API_KEY", "SG_4d5d5ba221ccfc4e")
 SEGMIND_API_URL = "https://api.segmind.com/v1/video-audio-merge"
 
+# 音声の開始位置をfile_idから決定する（同じ入力なら常に同じ結果）
+MERGE_DETERMINISTIC_OFFSET = os.getenv("MERGE_DETERMINISTIC_OFFSET", "false").lower() == "true"
+# 一時ファイルを使わず、URLから直接ffmpegに読ませて出力をS3へマルチパートアップロードする
+MERGE_STREAMING = os.getenv("MERGE_STREAMING", "false").lower() == "true"
+# 音声の開始位置の決め方（"energy": 最も盛り上がる区間, "random": ランダム）
+MERGE_AUDIO_OFFSET = os.getenv("MERGE_AUDIO_OFFSET", "energy").lower()
+
 # 利用可能なスタイル
 AVAILABLE_STYLES = ["anime", "3d_animation", "clay", "comic", "cyberpunk"]
 
@@ -93,70 +110,195 @@ async def generate_video_from_text(
             "message": "An unexpected error occurred"
         }
 
+def download_and_probe(url: str, path: str) -> dict:
+    """
+    URLをファイルへダウンロードし、メタデータ（長さ・コーデック等）を取得する
+
+    既知のURL・内容のメタデータはキャッシュから返し、ffprobeを起動しない。
+
+    :param url: URL
+    :param path: 保存先パス
+    :return: メタデータ（modules.media.probe.summarize_probe 参照）
+    """
+    download_to_file(url, path)
+    return probe_cache.probe_file(path, url)
+
+def prepare_audio(url: str, path: str) -> tuple:
+    """
+    マージ用の音声を用意する（AACキャッシュがあればダウンロード・エンコードしない）
+
+    :param url: 音声のURL
+    :param path: ダウンロード先パス（ジョブの作業ディレクトリ内）
+    :return: (メタデータ, ffmpegに渡す音声ファイルのパス, AACエンコード済みならTrue)
+    """
+    # キャッシュのファイルは他プロセスのevict()で消えうるため、作業ディレクトリにリンク（またはコピー）して使う
+    aac_path = os.path.join(os.path.dirname(path), "audio.m4a")
+    if AAC_CACHE_ENABLED:
+        cached_path = get_aac_cache().lookup_url(url)
+        metadata = probe_cache.get_url(url)
+        if cached_path and metadata and get_aac_cache().checkout(cached_path, aac_path):
+            return metadata, aac_path, True
+
+    metadata = download_and_probe(url, path)
+    if AAC_CACHE_ENABLED:
+        try:
+            # 一度だけAACに変換して保存（以降のマージはコピーのみ）
+            if get_aac_cache().checkout(get_aac_cache().encode(path, url), aac_path):
+                return metadata, aac_path, True
+        except Exception as e:
+            print(f"Warning: AAC cache encode failed, encoding during merge: {e}")
+    return metadata, path, False
+
+def merge_variant(deterministic_offset: bool, streaming: bool, audio_offset: str) -> str:
+    """
+    マージ結果を変えるオプションの組み合わせ（キャッシュキーとS3キーに含める、merge_file_id参照）
+
+    :param deterministic_offset: 音声の開始位置をfile_idから決定する
+    :param streaming: fragmented MP4としてS3へストリーミングする
+    :param audio_offset: 音声の開始位置の決め方（"energy", "random"）
+    :return: "energy", "seeded", "random" のいずれか（ストリーミングなら "-fmp4" 付き）
+    """
+    # ストリーミングマージは区間解析を行わない
+    if audio_offset == "energy" and not streaming:
+        offset_mode = "energy"
+    else:
+        offset_mode = "seeded" if deterministic_offset else "random"
+    return f"{offset_mode}-fmp4" if streaming else offset_mode
+
+def merge_file_id(video_url: str, audio_url: str, variant: str) -> str:
+    """
+    マージID（S3キーとキャッシュキー）を生成する
+
+    既定の組み合わせ（"energy"）は従来どおりURLのみから生成し、既存のS3上のマージ結果を使い続ける
+
+    :param video_url: 動画のURL
+    :param audio_url: 音声のURL
+    :param variant: merge_variant() の値
+    :return: 12文字のハッシュ
+    """
+    combined_urls = f"{video_url}|{audio_url}" if variant == "energy" else f"{video_url}|{audio_url}|{variant}"
+    return hashlib.md5(combined_urls.encode()).hexdigest()[:12]
+
+def find_merged_video(file_id: str, video_url: str, audio_url: str) -> dict:
+    """
+    マージ済みの動画を探す（ローカルインデックス、次にS3のHEAD）
+
+    :param file_id: マージID
+    :param video_url: 動画のURL
+    :param audio_url: 音声のURL
+    :return: s3_url と audio_start_time を含む辞書、見つからなければNone
+    """
+    cached = merge_cache.get(file_id)
+    if cached:
+        return cached
+
+    bucket_name = os.getenv('S3_BUCKET')
+    if not bucket_name:
+        return None
+    key = f"generated/{file_id}.mp4"
+    if not s3_object_exists(bucket_name, key):
+        return None
+    s3_url = get_s3_uploader().object_url(bucket_name, key)
+    # 他のワーカーやインデックス消失前のマージ結果をインデックスに戻す
+    merge_cache.put(file_id, video_url, audio_url, s3_url)
+    return {"s3_url": s3_url, "audio_start_time": None}
+
 def merge_video_audio(
     video_url: str,
     audio_url: str,
+    deterministic_offset: bool = MERGE_DETERMINISTIC_OFFSET,
+    use_cache: bool = True,
+    streaming: bool = MERGE_STREAMING,
+    audio_offset: str = MERGE_AUDIO_OFFSET,
 ) -> dict:
     """
     動画と音声をマージする
 
+    同じURLとオプション（開始位置の決め方・コンテナ形式）のマージ結果が既にあれば、
+    ダウンロード・ffmpeg・アップロードを行わずにそのs3_urlを返す。
+
     :param video_url: 動画のURL
     :param audio_url: 音声のURL
+    :param deterministic_offset: 音声の開始位置をfile_idから決定する（Falseならランダム）
+    :param use_cache: 既存のマージ結果を再利用する
+    :param streaming: ダウンロード・ローカル出力なしでffmpegの出力をS3へ直接ストリーミングする（fragmented MP4）
+    :param audio_offset: 音声の開始位置の決め方（"energy": RMSとオンセット強度が最大の区間, "random": ランダム）
     """
-    # URLをベースにした一貫性のあるハッシュを生成
-    combined_urls = f"{video_url}|{audio_url}"
-    file_id = hashlib.md5(combined_urls.encode()).hexdigest()[:12]  # 12文字のハッシュを使用
-    
-    temp_audio_path = f"{file_id}_audio.mp3"
-    temp_video_path = f"{file_id}_video.mp4"
-    output_path = f"{file_id}.mp4"
+    # URLと結果を変えるオプションをベースにした一貫性のあるハッシュを生成
+    file_id = merge_file_id(video_url, audio_url, merge_variant(deterministic_offset, streaming, audio_offset))
 
-    try:
-        # 音声ファイルをダウンロード
-        audio_response = requests.get(audio_url)
-        audio_response.raise_for_status()
+    if use_cache:
+        cached = find_merged_video(file_id, video_url, audio_url)
+        if cached:
+            print(f"Merge cache hit: {file_id}")
+            return {
+                "success": True,
+                "message": "Video and audio merged successfully",
+                "s3_url": cached["s3_url"],
+                "cached": True
+            }
+    
+    if streaming:
+        return merge_video_audio_streaming(file_id, video_url, audio_url, deterministic_offset)
 
-        # 動画
-        video_response = requests.get(video_url)
-        video_response.raise_for_status()   
+    # ジョブごとの作業ディレクトリ（同じURLの同時マージでもファイルが衝突しない。tmpfsがあればそこに作成）
+    work_dir = tempfile.mkdtemp(prefix=f"merge-{file_id}-", dir=scratch_root())
+    temp_audio_path = os.path.join(work_dir, "audio.mp3")
+    temp_video_path = os.path.join(work_dir, "video.mp4")
+    output_path = os.path.join(work_dir, f"{file_id}.mp4")
 
-        # 一時ファイルを作成
-        with open(temp_audio_path, 'wb') as f:
-            f.write(audio_response.content)
-        with open(temp_video_path, 'wb') as f:
-            f.write(video_response.content)
+    try:
+        # 音声・動画を同時にファイルへストリーミング（所要時間は合計ではなく長い方のみ）
+        # メタデータはダウンロード時に取得済み（キャッシュ済みならffprobeは起動しない）
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="merge-download") as executor:
+            audio_future = executor.submit(prepare_audio, audio_url, temp_audio_path)
+            video_future = executor.submit(download_and_probe, video_url, temp_video_path)
+            audio_metadata, audio_input_path, audio_is_aac = audio_future.result()
+            video_metadata = video_future.result()
 
         # 入力ファイル
         video = ffmpeg.input(temp_video_path)
         
-        # 動画の長さを取得
-        video_probe = ffmpeg.probe(temp_video_path)
-        video_duration = float(video_probe['format']['duration'])
+        # 動画・音声の長さ
+        video_duration = video_metadata['duration']
+        audio_duration = audio_metadata['duration']
         
-        # 音声の長さを取得
-        audio_probe = ffmpeg.probe(temp_audio_path)
-        audio_duration = float(audio_probe['format']['duration'])
-        
-        # ランダムな開始位置を計算（音声の長さから動画の長さを引いた範囲内）
+        # 開始位置を計算（音声の長さから動画の長さを引いた範囲内）
         max_start_time = audio_duration - video_duration
         if max_start_time < 0:
             max_start_time = 0
-        audio_start_time = random.uniform(0, max_start_time)
+        audio_start_time = None
+        if audio_offset == "energy":
+            try:
+                # 最もエネルギーの高い区間（解析結果はトラックごとにキャッシュ）
+                audio_start_time = get_segment_selector().select(audio_input_path, video_duration, max_start_time)
+            except Exception as e:
+                print(f"Warning: audio segment analysis failed, using a random offset: {e}")
+            if audio_start_time is None:
+                # 解析できなかった結果は "energy" ではなく実際に使った決め方のキーで保存する
+                file_id = merge_file_id(video_url, audio_url, merge_variant(deterministic_offset, streaming, "random"))
+                output_path = os.path.join(work_dir, f"{file_id}.mp4")
+        if audio_start_time is None:
+            if deterministic_offset:
+                audio_start_time = random.Random(file_id).uniform(0, max_start_time)
+            else:
+                audio_start_time = random.uniform(0, max_start_time)
         
         print(f"Video duration: {video_duration} seconds")
         print(f"Audio duration: {audio_duration} seconds")
         print(f"Using audio from {audio_start_time:.2f} seconds")
         
         # 音声を動画の長さに合わせる（開始位置を指定）
-        audio = ffmpeg.input(temp_audio_path, ss=audio_start_time, t=video_duration)
+        # 入力側の-ssはAACフレーム単位（約20ms）でシークするため、コピーでも位置がずれない
+        audio = ffmpeg.input(audio_input_path, ss=audio_start_time, t=video_duration)
 
-        # 動画と音声を結合
+        # 動画と音声を結合（AACキャッシュ済みなら再エンコードせずにリマックスのみ）
         stream = ffmpeg.output(
             video,
             audio,
             output_path,
             vcodec='copy',
-            acodec='aac'
+            acodec='copy' if audio_is_aac else 'aac'
         )
 
         # 実行
@@ -173,15 +315,7 @@ def merge_video_audio(
         # s3_url = f"https://{bucket_name}.s3.amazonaws.com/generate/{output_path}"
         if not s3_url:
             raise Exception("Failed to upload to S3")
-
-        # 一時ファイルを削除
-        try:
-            os.remove(temp_audio_path)
-            os.remove(temp_video_path)
-            os.remove(output_path)
-            print(f"Temporary files removed: {temp_audio_path}, {temp_video_path}, {output_path}")
-        except Exception as e:
-            print(f"Warning: Failed to remove temporary files: {e}")
+        merge_cache.put(file_id, video_url, audio_url, s3_url, audio_start_time)
 
         return {
             "success": True,
@@ -190,48 +324,67 @@ def merge_video_audio(
         }
 
     except requests.exceptions.RequestException as e:
-        # エラー時も一時ファイルを削除
-        try:
-            os.remove(temp_audio_path)
-            os.remove(temp_video_path)
-            os.remove(output_path)
-        except:
-            pass
         return {
             "success": False,
             "error": str(e),
             "message": "Failed to merge video and audio"
         }
     except Exception as e:
-        # エラー時も一時ファイルを削除
-        try:
-            os.remove(temp_audio_path)
-            os.remove(temp_video_path)
-            os.remove(output_path)
-        except:
-            pass
         return {
             "success": False,
             "error": str(e),
             "message": "An unexpected error occurred"
-        } 
+        }
+    finally:
+        # 作業ディレクトリごと一時ファイルを削除（エラー時も）
+        shutil.rmtree(work_dir, ignore_errors=True)
     
+def merge_video_audio_streaming(file_id: str, video_url: str, audio_url: str, deterministic_offset: bool) -> dict:
+    """
+    一時ファイルを使わずに動画と音声をマージし、エンコードと並行してS3へアップロードする
+
+    :param file_id: マージID
+    :param video_url: 動画のURL
+    :param audio_url: 音声のURL
+    :param deterministic_offset: 音声の開始位置をfile_idから決定する
+    """
+    try:
+        bucket_name = os.getenv('S3_BUCKET')
+        if not bucket_name:
+            raise ValueError("S3_BUCKET environment variable is not set")
+
+        merged = stream_merge_to_s3(file_id, video_url, audio_url, bucket_name, deterministic_offset)
+        merge_cache.put(file_id, video_url, audio_url, merged["s3_url"], merged["audio_start_time"])
+
+        return {
+            "success": True,
+            "message": "Video and audio merged successfully",
+            "s3_url": merged["s3_url"]
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "An unexpected error occurred"
+        }
+
+def s3_object_exists(bucket_name, key):
+    """
+    S3オブジェクトの存在を確認する（HEAD）
+
+    :param bucket_name: バケット名
+    :param key: オブジェクトキー
+    :return: 存在すればTrue（確認できなかった場合はFalse）
+    """
+    return get_s3_uploader().object_exists(bucket_name, key)
+
 def upload_to_s3(file_path, bucket_name):
     try:
-        s3_client = boto3.client('s3')
-        file_name = f"generated/{file_path}"
-        
-        s3_client.upload_file(
-            file_path,
-            bucket_name,
-            file_name,
-            ExtraArgs={'ContentType': 'video/mp4'}
-        )
-        
-        # S3のURLを生成
-        url = f"https://{bucket_name}.s3.amazonaws.com/{file_name}"
+        # プロセス共有のクライアント・転送設定を再利用（呼び出しごとにクライアントを作らない）
+        file_name = f"generated/{os.path.basename(file_path)}"
+        url = get_s3_uploader().upload_file(file_path, bucket_name, file_name, content_type='video/mp4')
         print(f"File uploaded successfully to {url}")
         return url
-    except ClientError as e:
+    except (ClientError, BotoCoreError) as e:
         print(f"Error uploading to S3: {e}")
         return None
\ No newline at end of file
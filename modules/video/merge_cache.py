@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from modules.paths import OUTPUT_DIR
+
+# Load environment variables
+load_dotenv()
+
+# SQLite index of completed merges (shared by worker processes)
+MERGE_CACHE_PATH = os.getenv("MERGE_CACHE_PATH", os.path.join(OUTPUT_DIR, "merge_cache.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS merges (
+    file_id TEXT PRIMARY KEY,
+    video_url TEXT NOT NULL,
+    audio_url TEXT NOT NULL,
+    s3_url TEXT NOT NULL,
+    audio_start_time REAL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class MergeCache:
+    """
+    Index of merged videos already uploaded to S3, keyed by merge file_id
+
+    The file_id is derived from the input URLs and the options that change
+    the output (offset mode, fragmented or regular MP4), so a repeated merge
+    of the same video and audio with the same options finds its s3_url here
+    without downloading, running ffmpeg or uploading again.
+    """
+
+    def __init__(self, path: str = MERGE_CACHE_PATH):
+        """
+        Args:
+            path: SQLite file of the index
+        """
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a completed merge
+
+        Args:
+            file_id: Merge ID
+
+        Returns:
+            Dictionary with s3_url and audio_start_time, or None on a miss
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT s3_url, audio_start_time FROM merges WHERE file_id = ?",
+                (file_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Merge cache read failed: {str(e)}")
+            row = None
+        with self._lock:
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return {"s3_url": row[0], "audio_start_time": row[1]}
+
+    def put(self, file_id: str, video_url: str, audio_url: str, s3_url: str, audio_start_time: Optional[float] = None) -> None:
+        """
+        Record a completed merge
+
+        Args:
+            file_id: Merge ID
+            video_url: Video URL
+            audio_url: Audio URL
+            s3_url: URL of the uploaded result
+            audio_start_time: Audio offset used (None if unknown)
+        """
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO merges (file_id, video_url, audio_url, s3_url, audio_start_time, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file_id, video_url, audio_url, s3_url, audio_start_time, time.time())
+            )
+        except sqlite3.Error as e:
+            print(f"Merge cache write failed: {str(e)}")
+
+    def invalidate(self, file_id: str) -> None:
+        self._connection().execute("DELETE FROM merges WHERE file_id = ?", (file_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._connection().execute("SELECT COUNT(*) FROM merges").fetchone()[0]
+        with self._lock:
+            return {
+                "entries": entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "path": self.path
+            }
+
+
+merge_cache = MergeCache()
@@ -0,0 +1,336 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from modules.paths import OUTPUT_DIR
+
+# Load environment variables
+load_dotenv()
+
+# Merge processes per server worker (downloads, ffmpeg and upload run in them)
+MERGE_WORKERS = int(os.getenv("MERGE_WORKERS", min(4, os.cpu_count() or 1)))
+# Jobs queued or running per server worker before submissions are rejected
+MERGE_MAX_QUEUE = int(os.getenv("MERGE_MAX_QUEUE", 32))
+# SQLite file of job records (shared by server workers, so any of them can answer status requests)
+MERGE_JOBS_PATH = os.getenv("MERGE_JOBS_PATH", os.path.join(OUTPUT_DIR, "merge_jobs.db"))
+# Finished job records older than this are deleted (seconds)
+MERGE_JOB_TTL = float(os.getenv("MERGE_JOB_TTL", 24 * 60 * 60))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS merge_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    video_url TEXT NOT NULL,
+    audio_url TEXT NOT NULL,
+    options TEXT NOT NULL,
+    result TEXT,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_merge_jobs_created_at ON merge_jobs(created_at);
+"""
+
+
+def scratch_root() -> str:
+    """
+    Directory under which merges create their scratch directories
+
+    MERGE_SCRATCH_DIR if set, otherwise /dev/shm when it is a writable tmpfs
+    (inputs and output never touch the disk), otherwise the system temp dir.
+
+    Returns:
+        Directory path
+    """
+    configured = os.getenv("MERGE_SCRATCH_DIR")
+    if configured:
+        os.makedirs(configured, exist_ok=True)
+        return configured
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class QueueFullError(Exception):
+    """Too many merge jobs are queued or running"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _run_job(job_id: str, jobs_path: str, video_url: str, audio_url: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge job body, run in a pool process"""
+    conn = _connect(jobs_path)
+    try:
+        conn.execute(
+            "UPDATE merge_jobs SET status = ?, started_at = ? WHERE job_id = ?",
+            (STATUS_RUNNING, time.time(), job_id)
+        )
+    finally:
+        conn.close()
+    # Imported here: the pool process only loads the video module when it runs a job
+    from modules.video.generator import merge_video_audio
+    return merge_video_audio(video_url, audio_url, **options)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MergeEngine:
+    """
+    Bounded process pool running video/audio merges as jobs
+
+    submit() records a job and returns immediately; the merge (downloads,
+    ffprobe, ffmpeg, S3 upload) runs in a pool process, in its own scratch
+    directory, so handlers stay responsive and merges use all cores. Jobs of
+    the same inputs already in flight in this process are shared. Job
+    records live in SQLite, so status and results are visible to every
+    server worker.
+    """
+
+    def __init__(self, workers: int = MERGE_WORKERS, max_queue: int = MERGE_MAX_QUEUE, path: str = MERGE_JOBS_PATH, ttl: float = MERGE_JOB_TTL):
+        """
+        Args:
+            workers: Number of merge processes
+            max_queue: Jobs queued or running before submit() raises QueueFullError
+            path: SQLite file of job records
+            ttl: Age after which finished job records are deleted (seconds)
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.path = os.path.abspath(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # (video_url, audio_url, options) -> job_id of jobs submitted by this process and not finished
+        self._inflight: Dict[str, str] = {}
+        self._futures: Dict[str, Future] = {}
+        self._submitted = 0
+        self._coalesced = 0
+        self._rejected = 0
+        self._succeeded = 0
+        self._failed = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a server process with live threads and sockets is unsafe
+            # (pool processes import the main module as __mp_main__, without its __main__ block;
+            # app.py skips its server setup there, see MERGE_POOL_PROCESS)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, video_url: str, audio_url: str, options: Optional[Dict[str, Any]] = None, on_done: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> str:
+        """
+        Queue a merge
+
+        Args:
+            video_url: Video URL
+            audio_url: Audio URL
+            options: Keyword arguments of merge_video_audio (deterministic_offset, use_cache)
+            on_done: Function called with the job ID and result when the merge finishes
+
+        Returns:
+            Job ID (that of the in-flight job for the same inputs, if any)
+
+        Raises:
+            QueueFullError: If max_queue jobs are already queued or running
+        """
+        options = options or {}
+        key = json.dumps([video_url, audio_url, options], sort_keys=True)
+        with self._lock:
+            job_id = self._inflight.get(key)
+            coalesced = job_id is not None
+            if coalesced:
+                self._coalesced += 1
+                future = self._futures[job_id]
+            else:
+                if len(self._inflight) >= self.max_queue:
+                    self._rejected += 1
+                    raise QueueFullError(f"Merge queue is full ({self.max_queue} jobs)")
+                job_id = str(uuid.uuid4())
+                now = time.time()
+                conn = self._connection()
+                conn.execute(
+                    "INSERT INTO merge_jobs (job_id, status, video_url, audio_url, options, pid, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, STATUS_QUEUED, video_url, audio_url, json.dumps(options), os.getpid(), now)
+                )
+                conn.execute(
+                    "DELETE FROM merge_jobs WHERE finished_at IS NOT NULL AND finished_at <= ?",
+                    (now - self.ttl,)
+                )
+                try:
+                    future = self._pool().submit(_run_job, job_id, self.path, video_url, audio_url, options)
+                except BrokenProcessPool:
+                    # A merge process died (OOM, signal): start a fresh pool
+                    print("Merge pool is broken, restarting it")
+                    self._executor = None
+                    future = self._pool().submit(_run_job, job_id, self.path, video_url, audio_url, options)
+                self._inflight[key] = job_id
+                self._futures[job_id] = future
+                self._submitted += 1
+        if coalesced:
+            if on_done is not None:
+                future.add_done_callback(lambda future: on_done(job_id, self._outcome(future)))
+            return job_id
+        future.add_done_callback(lambda future: self._finish(key, job_id, future))
+        if on_done is not None:
+            future.add_done_callback(lambda future: on_done(job_id, self._outcome(future)))
+        print(f"Merge job queued: {job_id} ({len(self._inflight)} in flight)")
+        return job_id
+
+    @staticmethod
+    def _outcome(future: Future) -> Dict[str, Any]:
+        try:
+            return future.result()
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": "Merge job failed"
+            }
+
+    def _finish(self, key, job_id, future):
+        result = self._outcome(future)
+        status = STATUS_SUCCEEDED if result.get("success") else STATUS_FAILED
+        try:
+            self._connection().execute(
+                "UPDATE merge_jobs SET status = ?, result = ?, finished_at = ? WHERE job_id = ?",
+                (status, json.dumps(result), time.time(), job_id)
+            )
+        except sqlite3.Error as e:
+            print(f"Error recording merge job {job_id}: {str(e)}")
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._futures.pop(job_id, None)
+            if status == STATUS_SUCCEEDED:
+                self._succeeded += 1
+            else:
+                self._failed += 1
+        print(f"Merge job {status}: {job_id}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the record of a job
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            Dictionary with job_id, status, timestamps and (once finished) result, or None if unknown
+        """
+        row = self._connection().execute(
+            "SELECT status, video_url, audio_url, result, pid, created_at, started_at, finished_at FROM merge_jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, video_url, audio_url, result, pid, created_at, started_at, finished_at = row
+        result = json.loads(result) if result else None
+        if status in (STATUS_QUEUED, STATUS_RUNNING) and not _pid_alive(pid):
+            # The server worker that owned the job exited before it finished
+            status = STATUS_FAILED
+            result = {"success": False, "error": "Merge job was interrupted", "message": "Merge job failed"}
+        return {
+            "job_id": job_id,
+            "status": status,
+            "video_url": video_url,
+            "audio_url": audio_url,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "result": result
+        }
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Block until a job submitted by this process finishes
+
+        Args:
+            job_id: Job ID
+            timeout: Maximum wait (seconds)
+
+        Returns:
+            merge_video_audio result, or None if the job is not in flight here (see get())
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is None:
+            job = self.get(job_id)
+            return job["result"] if job else None
+        future.exception(timeout=timeout)
+        return self._outcome(future)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": len(self._inflight),
+                "max_queue": self.max_queue,
+                "submitted": self._submitted,
+                "coalesced": self._coalesced,
+                "rejected": self._rejected,
+                "succeeded": self._succeeded,
+                "failed": self._failed,
+                "scratch_root": scratch_root()
+            }
+
+
+_merge_engine: Optional[MergeEngine] = None
+_merge_engine_lock = threading.Lock()
+
+
+def get_merge_engine() -> MergeEngine:
+    """
+    Function to get the process-wide merge engine (created on first use)
+
+    Returns:
+        Shared MergeEngine
+    """
+    global _merge_engine
+    if _merge_engine is None:
+        with _merge_engine_lock:
+            if _merge_engine is None:
+                _merge_engine = MergeEngine()
+    return _merge_engine
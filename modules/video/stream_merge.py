@@ -0,0 +1,181 @@
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import ffmpeg
+from dotenv import load_dotenv
+
+from modules.media.probe import probe_cache
+from modules.media.s3 import get_s3_uploader
+
+# Load environment variables
+load_dotenv()
+
+# Size of multipart upload parts (S3 minimum is 5MB for all but the last part)
+S3_PART_SIZE = max(int(os.getenv("S3_PART_SIZE", 8 * 1024 * 1024)), 5 * 1024 * 1024)
+# Parts uploaded concurrently while ffmpeg keeps encoding (memory is bounded by this x part size)
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", 4))
+# Bytes of ffmpeg stderr kept for error messages
+STDERR_TAIL = 4096
+
+# Fragmented MP4: playable without seeking back to write the moov atom, so it can go to a pipe
+FRAGMENTED_MP4_FLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+
+class MultipartUpload:
+    """
+    S3 multipart upload fed incrementally
+
+    write() buffers data and uploads each full part in a small thread pool,
+    so the producer (ffmpeg's stdout) keeps running while earlier parts are
+    in flight; at most `concurrency` parts are buffered or uploading.
+    """
+
+    def __init__(self, client, bucket_name: str, key: str, content_type: str = "video/mp4", part_size: int = S3_PART_SIZE, concurrency: int = S3_UPLOAD_CONCURRENCY):
+        """
+        Args:
+            client: boto3 S3 client
+            bucket_name: Bucket name
+            key: Object key
+            content_type: Content-Type of the object
+            part_size: Size of each part except the last (bytes)
+            concurrency: Parts uploaded in parallel
+        """
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._futures = []
+        self._slots = threading.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-part")
+        self.bytes_written = 0
+        self.upload_id = client.create_multipart_upload(Bucket=bucket_name, Key=key, ContentType=content_type)["UploadId"]
+
+    def _upload_part(self, number, body):
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body
+            )
+            return {"PartNumber": number, "ETag": response["ETag"]}
+        finally:
+            self._slots.release()
+
+    def _submit(self, body):
+        # Blocks the producer while `concurrency` parts are pending (bounded memory)
+        self._slots.acquire()
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                self._slots.release()
+                raise future.exception()
+        self._futures.append(self._executor.submit(self._upload_part, len(self._futures) + 1, bytes(body)))
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+
+    def complete(self) -> None:
+        """Upload the last part and assemble the object"""
+        try:
+            if self._buffer or not self._futures:
+                self._submit(self._buffer)
+                self._buffer = bytearray()
+            parts = [future.result() for future in self._futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": parts}
+            )
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def abort(self) -> None:
+        """Discard the uploaded parts (S3 keeps billing for them otherwise)"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            print(f"Error aborting multipart upload of {self.key}: {str(e)}")
+
+
+def _drain(stream, tail: bytearray) -> None:
+    """Read a pipe to EOF keeping its last bytes (an unread stderr pipe would block ffmpeg)"""
+    for chunk in iter(lambda: stream.read(STDERR_TAIL), b""):
+        tail += chunk
+        del tail[:-STDERR_TAIL]
+
+
+def stream_merge_to_s3(file_id: str, video_url: str, audio_url: str, bucket_name: str, deterministic_offset: bool = False, client=None) -> Dict[str, Any]:
+    """
+    Merge a video and an audio track straight from their URLs into S3
+
+    ffmpeg reads both inputs over HTTP and writes fragmented MP4 to stdout,
+    which is uploaded to generated/<file_id>.mp4 as a multipart upload
+    while encoding continues: no temporary files, and the upload overlaps
+    the merge instead of following it.
+
+    Args:
+        file_id: Merge ID (object name)
+        video_url: Video URL
+        audio_url: Audio URL
+        bucket_name: S3 bucket
+        deterministic_offset: Derive the audio offset from file_id instead of picking it at random
+        client: boto3 S3 client (default: the shared uploader's client)
+
+    Returns:
+        Dictionary with s3_url and audio_start_time
+
+    Raises:
+        Exception: If probing, ffmpeg or the upload failed
+    """
+    # Cached per URL; on a miss ffprobe reads only the container headers over HTTP
+    video_duration = probe_cache.probe_url(video_url)["duration"]
+    audio_duration = probe_cache.probe_url(audio_url)["duration"]
+    max_start_time = max(audio_duration - video_duration, 0)
+    rng = random.Random(file_id) if deterministic_offset else random
+    audio_start_time = rng.uniform(0, max_start_time)
+    print(f"Streaming merge {file_id}: video {video_duration}s, audio {audio_duration}s from {audio_start_time:.2f}s")
+
+    video = ffmpeg.input(video_url)
+    audio = ffmpeg.input(audio_url, ss=audio_start_time, t=video_duration)
+    process = ffmpeg.output(
+        video,
+        audio,
+        "pipe:",
+        format="mp4",
+        vcodec="copy",
+        acodec="aac",
+        movflags=FRAGMENTED_MP4_FLAGS
+    ).run_async(pipe_stdout=True, pipe_stderr=True)
+
+    stderr_tail = bytearray()
+    stderr_reader = threading.Thread(target=_drain, args=(process.stderr, stderr_tail), daemon=True)
+    stderr_reader.start()
+
+    key = f"generated/{file_id}.mp4"
+    upload: Optional[MultipartUpload] = None
+    try:
+        upload = MultipartUpload(client or get_s3_uploader().client, bucket_name, key)
+        while True:
+            chunk = process.stdout.read(1024 * 1024)
+            if not chunk:
+                break
+            upload.write(chunk)
+        returncode = process.wait()
+        stderr_reader.join()
+        if returncode != 0:
+            raise Exception(f"ffmpeg exited with {returncode}: {stderr_tail.decode('utf-8', 'replace')}")
+        upload.complete()
+    except BaseException:
+        process.kill()
+        process.wait()
+        if upload is not None:
+            upload.abort()
+        raise
+
+    s3_url = get_s3_uploader().object_url(bucket_name, key)
+    print(f"Streamed {upload.bytes_written} bytes to {s3_url}")
+    return {"s3_url": s3_url, "audio_start_time": audio_start_time}
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from flask import Flask, jsonify
+
+from modules.idempotency import IdempotencyStore, idempotent
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def make_app(reply):
+    """App whose /gen view counts its runs and returns reply(run number)"""
+    app = Flask(__name__)
+    store = IdempotencyStore(ttl=60)
+    calls = []
+    release = threading.Event()
+    release.set()
+
+    @app.route("/gen", methods=["POST"])
+    @idempotent(store)
+    def gen():
+        calls.append(1)
+        release.wait(5)
+        return reply(len(calls))
+
+    return app, store, calls, release
+
+
+def test_replays_stored_response():
+    app, store, calls, _ = make_app(lambda n: jsonify({"status": "processing", "task_id": f"t{n}"}))
+    client = app.test_client()
+    first = client.post("/gen", json={"prompt": "x"}, headers={"Idempotency-Key": "k1"})
+    second = client.post("/gen", json={"prompt": "x"}, headers={"Idempotency-Key": "k1"})
+    assert len(calls) == 1
+    assert second.get_json() == first.get_json() == {"status": "processing", "task_id": "t1"}
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+def test_request_id_in_body_is_a_key():
+    app, store, calls, _ = make_app(lambda n: jsonify({"task_id": f"t{n}"}))
+    client = app.test_client()
+    client.post("/gen", json={"prompt": "x", "request_id": "r1"})
+    replay = client.post("/gen", json={"prompt": "x", "request_id": "r1"})
+    assert len(calls) == 1
+    assert replay.get_json() == {"task_id": "t1"}
+
+
+def test_requests_without_key_pass_through():
+    app, store, calls, _ = make_app(lambda n: jsonify({"task_id": f"t{n}"}))
+    client = app.test_client()
+    client.post("/gen", json={"prompt": "x"})
+    client.post("/gen", json={"prompt": "x"})
+    assert len(calls) == 2
+
+
+def test_key_reused_with_another_body_conflicts():
+    app, store, calls, _ = make_app(lambda n: jsonify({"task_id": f"t{n}"}))
+    client = app.test_client()
+    client.post("/gen", json={"prompt": "x"}, headers={"Idempotency-Key": "k1"})
+    conflict = client.post("/gen", json={"prompt": "y"}, headers={"Idempotency-Key": "k1"})
+    assert conflict.status_code == 422
+    assert len(calls) == 1
+
+
+def test_timed_out_response_is_not_stored():
+    app, store, calls, _ = make_app(lambda n: jsonify({"status": "processing", "timed_out": True}))
+    client = app.test_client()
+    client.post("/gen", json={"prompt": "x"}, headers={"Idempotency-Key": "k1"})
+    client.post("/gen", json={"prompt": "x"}, headers={"Idempotency-Key": "k1"})
+    assert len(calls) == 2
+
+
+def test_concurrent_waiters_get_the_leaders_response():
+    app, store, calls, release = make_app(lambda n: (jsonify({"error": "upstream"}), 503))
+    release.clear()
+    responses = []
+
+    def post():
+        with app.test_client() as client:
+            response = client.post("/gen", json={"prompt": "x"}, headers={"Idempotency-Key": "k1"})
+            responses.append((response.status_code, response.get_json()))
+
+    leader = threading.Thread(target=post)
+    leader.start()
+    wait_until(lambda: store.stats()["in_flight"] == 1)
+    waiters = [threading.Thread(target=post) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    wait_until(lambda: store.stats()["attached"] == 3)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(timeout=5)
+
+    assert len(calls) == 1
+    assert responses == [(503, {"error": "upstream"})] * 4
+    # 5xx is shared with the waiters but not stored: a later retry runs again
+    assert store.stats()["entries"] == 0
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+import pytest
+
+from modules.media.cache import MediaCache
+
+
+def writer(content, calls=None, delay=0):
+    def download(url, path):
+        if calls is not None:
+            calls.append(url)
+        time.sleep(delay)
+        with open(path, "wb") as f:
+            f.write(content)
+    return download
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MediaCache(root=str(tmp_path / "media"), max_bytes=1000)
+
+
+def test_fetch_downloads_once_then_hits(cache):
+    calls = []
+    path = cache.fetch("https://cdn/a.mp3", writer(b"a" * 10, calls))
+    assert path.endswith(".mp3")
+    with open(path, "rb") as f:
+        assert f.read() == b"a" * 10
+    assert cache.fetch("https://cdn/a.mp3#t=5", writer(b"other", calls)) == path
+    assert calls == ["https://cdn/a.mp3"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_same_content_is_stored_once(cache):
+    first = cache.fetch("https://cdn/a.mp3", writer(b"same"))
+    second = cache.fetch("https://mirror/b.mp3", writer(b"same"))
+    assert first == second
+    stats = cache.stats()
+    assert stats["objects"] == 1
+    assert stats["urls"] == 2
+
+
+def test_concurrent_fetches_share_one_download(cache):
+    calls = []
+    paths = []
+    threads = [
+        threading.Thread(target=lambda: paths.append(cache.fetch("https://cdn/v.mp4", writer(b"v" * 10, calls, delay=0.1))))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(calls) == 1
+    assert len(set(paths)) == 1 and paths[0] is not None
+    assert cache.stats()["coalesced"] == 3
+
+
+def test_failed_download_leaves_nothing_behind(cache):
+    def broken(url, path):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+        raise IOError("connection reset")
+
+    assert cache.fetch("https://cdn/x.mp3", broken) is None
+    assert os.listdir(cache.tmp_dir) == []
+    assert cache.lookup("https://cdn/x.mp3") is None
+
+
+def test_evicts_least_recently_used_over_budget(cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("modules.media.cache.time.time", lambda: clock[0])
+    old = cache.fetch("https://cdn/old.mp3", writer(b"o" * 400))
+    clock[0] += 100
+    recent = cache.fetch("https://cdn/recent.mp3", writer(b"r" * 400))
+    clock[0] += 100
+    # Touch the older object so that it becomes the most recently used one
+    assert cache.lookup("https://cdn/old.mp3") == old
+    clock[0] += 100
+    new = cache.fetch("https://cdn/new.mp3", writer(b"n" * 400))
+
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup("https://cdn/recent.mp3") is None
+    assert not os.path.exists(recent)
+    assert os.path.exists(old) and os.path.exists(new)
+    assert cache.stats()["resident_bytes"] == 800
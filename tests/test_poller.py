@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from modules.callback.store import CallbackStore
+from modules.music.poller import POLL_SOURCE, TaskPoller, status_to_callback
+
+SCHEDULE = [(0.2, 0.02), (float("inf"), 0.1)]
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+class FakeStatusAPI:
+    """Status endpoint answering PENDING until complete() is called"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.status = {"status": "PENDING"}
+
+    def __call__(self, task_id):
+        with self.lock:
+            self.calls.append((task_id, time.monotonic()))
+            return dict(self.status)
+
+    def complete(self):
+        with self.lock:
+            self.status = {"status": "SUCCESS", "response": {"sunoData": [{"id": "a1", "audioUrl": "https://x/a1.mp3"}]}}
+
+
+@pytest.fixture
+def poller_parts():
+    api = FakeStatusAPI()
+    store = CallbackStore()
+    pollers = []
+
+    def make(**kwargs):
+        options = {"schedule": SCHEDULE, "first_delay": 0.01, "max_age": 5, "workers": 2}
+        options.update(kwargs)
+        poller = TaskPoller(api, store, store.add, **options)
+        pollers.append(poller)
+        return poller.start()
+
+    yield api, store, make
+    for poller in pollers:
+        poller.stop()
+
+
+def test_interval_follows_the_schedule():
+    poller = TaskPoller(lambda task_id: None, CallbackStore(), lambda data: None, schedule=[(60, 5), (600, 30), (float("inf"), 60)])
+    assert poller.interval(0) == 5
+    assert poller.interval(59) == 5
+    assert poller.interval(60) == 30
+    assert poller.interval(10_000) == 60
+
+
+def test_pending_task_is_polled_on_schedule_until_terminal(poller_parts):
+    api, store, make = poller_parts
+    poller = make()
+    poller.track("t1")
+    poller.track("t1")
+    wait_until(lambda: len(api.calls) >= 3)
+    assert poller.pending() == ["t1"]
+    api.complete()
+    wait_until(lambda: not poller.pending())
+
+    _, info = store.find("t1")
+    assert info["data"]["source"] == POLL_SOURCE
+    assert info["data"]["data"]["data"][0]["audio_url"] == "https://x/a1.mp3"
+    assert poller.stats()["resolved_by_poll"] == 1
+    # One scheduler entry per task even when tracked twice
+    times = [at for task_id, at in api.calls]
+    assert all(later - earlier >= 0.015 for earlier, later in zip(times, times[1:]))
+
+
+def test_delivered_callback_resolves_without_polling(poller_parts):
+    api, store, make = poller_parts
+    store.add({"code": 200, "data": {"callbackType": "complete", "task_id": "t2", "data": []}})
+    poller = make()
+    poller.track("t2")
+    wait_until(lambda: not poller.pending())
+    assert api.calls == []
+    assert poller.stats()["resolved_by_callback"] == 1
+
+
+def test_tasks_past_max_age_are_given_up(poller_parts):
+    api, store, make = poller_parts
+    poller = make(max_age=0.1)
+    poller.track("t3")
+    wait_until(lambda: not poller.pending())
+    assert poller.stats()["expired"] == 1
+    assert store.find("t3") == (None, None)
+
+
+def test_failed_status_becomes_error_callback():
+    payload = status_to_callback("t4", {"status": "CREATE_TASK_FAILED", "errorCode": 413, "errorMessage": "Too long"})
+    assert payload["code"] == 413
+    assert payload["data"] == {"callbackType": "error", "task_id": "t4", "data": []}
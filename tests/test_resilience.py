@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from modules.music.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    SunoAPIError,
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+)
+
+RETRYABLE = SunoAPIError("Server error", status_code=503, retryable=True)
+CLIENT_ERROR = SunoAPIError("Bad request", status_code=400)
+
+
+def opened_breaker(recovery_timeout=0.05):
+    breaker = CircuitBreaker("/test", failure_threshold=2, recovery_timeout=recovery_timeout)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(RETRYABLE)
+    assert breaker.snapshot()["state"] == STATE_OPEN
+    return breaker
+
+
+def half_open_breaker():
+    breaker = opened_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.snapshot()["state"] == STATE_HALF_OPEN
+    return breaker
+
+
+def test_opens_after_consecutive_retryable_failures():
+    breaker = CircuitBreaker("/test", failure_threshold=3, recovery_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(RETRYABLE)
+    assert breaker.snapshot()["state"] == STATE_CLOSED
+    breaker.before_call()
+    breaker.record_failure(RETRYABLE)
+    assert breaker.snapshot()["state"] == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("/test", failure_threshold=2, recovery_timeout=60)
+    breaker.before_call()
+    breaker.record_failure(RETRYABLE)
+    breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+    breaker.record_failure(RETRYABLE)
+    assert breaker.snapshot()["state"] == STATE_CLOSED
+
+
+def test_client_errors_do_not_count():
+    breaker = CircuitBreaker("/test", failure_threshold=1, recovery_timeout=60)
+    breaker.before_call()
+    breaker.record_failure(CLIENT_ERROR)
+    assert breaker.snapshot()["state"] == STATE_CLOSED
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = half_open_breaker()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_success_closes():
+    breaker = half_open_breaker()
+    breaker.record_success()
+    assert breaker.snapshot()["state"] == STATE_CLOSED
+    breaker.before_call()
+
+
+def test_probe_failure_reopens():
+    breaker = half_open_breaker()
+    breaker.record_failure(RETRYABLE)
+    assert breaker.snapshot()["state"] == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_client_error_does_not_close():
+    breaker = half_open_breaker()
+    breaker.record_failure(CLIENT_ERROR)
+    assert breaker.snapshot()["state"] == STATE_HALF_OPEN
+    # The probe slot is free again
+    breaker.before_call()
+
+
+def test_release_probe_keeps_half_open():
+    breaker = half_open_breaker()
+    breaker.release_probe()
+    assert breaker.snapshot()["state"] == STATE_HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
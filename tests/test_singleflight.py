@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+from modules.music.singleflight import Flight
+
+
+def test_wait_returns_finished_result():
+    flight = Flight()
+    flight.finish({"task_id": "abc"})
+    assert flight.wait() == {"task_id": "abc"}
+
+
+def test_thread_waiters_share_one_result():
+    flight = Flight()
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(flight.wait())) for _ in range(5)]
+    for waiter in waiters:
+        waiter.start()
+    flight.finish("done")
+    for waiter in waiters:
+        waiter.join(timeout=5)
+    assert results == ["done"] * 5
+
+
+def test_async_waiter_woken_from_another_thread():
+    flight = Flight()
+
+    async def main():
+        threading.Timer(0.05, flight.finish, args=("done",)).start()
+        return await asyncio.wait_for(flight.wait_async(), timeout=5)
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_async_waiter_after_finish_does_not_block():
+    flight = Flight()
+    flight.finish("done")
+    assert asyncio.run(asyncio.wait_for(flight.wait_async(), timeout=5)) == "done"
+
+
+def test_finish_ignores_closed_loops():
+    flight = Flight()
+
+    async def give_up():
+        try:
+            await asyncio.wait_for(flight.wait_async(), timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(give_up())
+    flight.finish("late")
+    assert flight.wait() == "late"